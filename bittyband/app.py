@@ -1,17 +1,17 @@
 #!/bin/env python3
 
+""" Each mode imports its own subsystem, so the audio libraries that the
+    importer needs aren't loaded by the modes that never touch audio.
+"""
+
 import sys
 
 from .simplehelp import SimpleHelp
-from .importer import CsvPlayer
 from .commands import Commands
 from .player import PushButtonPlayer
 from .ui import get_ui
-from .cmdrecorder import CommandRecorder
-from .jamlister import JamLister
 from .bgplayer import BackgroundDrums, BackgroundNull
-from .importer import Importer
-from .importlister import ImportLister
+
 
 def app(config):
     ui_maker = get_ui()
@@ -25,17 +25,25 @@ def app(config):
     need_for_mode = []
     mode = lambda: True
     if config["instance"]["mode"] == "gui" or config["instance"]["mode"] == "jam":
+        from .cmdrecorder import CommandRecorder
         wiring["push_recorder"] = CommandRecorder(config)
         need_for_mode = ["push_player", "push_recorder", "metronome"]
-        mode = ui.start_jam
+        def mode():
+            ui.start_jam()
+            latency = wiring["push_player"].latency
+            if latency.count > 0:
+                sys.stderr.write("key to MIDI out latency (microseconds): {}\n".format(latency))
 
     elif config["instance"]["mode"] == "list":
+        from .jamlister import JamLister
         wiring["jam_lister"] = JamLister(config)
         wiring["metronome"] = BackgroundNull(config)
         need_for_mode = ["push_player", "metronome"]
         mode = ui.start_list
 
     elif config["instance"]["mode"] == "import":
+        from .importlister import ImportLister
+        from .importer import Importer, CsvPlayer
         wiring["import_lister"] = ImportLister(config)
         wiring["importer"] = Importer(config)
         wiring["csv_player"] = CsvPlayer(config)
@@ -43,12 +51,32 @@ def app(config):
         mode = ui.start_import
 
     elif config["instance"]["mode"] == "import-file":
+        from .importlister import ImportLister
+        from .importer import Importer, CsvPlayer
         wiring["import_lister"] = ImportLister(config)
         wiring["importer"] = Importer(config)
         wiring["csv_player"] = CsvPlayer(config)
         need_for_mode = ["push_player", "csv_player"]
         mode = ui.start_import_file
 
+    elif config["instance"]["mode"] == "export-jams":
+        from .batchexport import export_jams
+        def mode():
+            if export_jams(config) > 0:
+                sys.exit(1)
+
+    elif config["instance"]["mode"] == "export-imports":
+        from .batchexport import export_imports
+        def mode():
+            if export_imports(config) > 0:
+                sys.exit(1)
+
+    elif config["instance"]["mode"] == "convert-streams":
+        from .streamformat import convert_streams
+        def mode():
+            if convert_streams(config) > 0:
+                sys.exit(1)
+
     elif config["instance"]["mode"] == "test":
         pass
 
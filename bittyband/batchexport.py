@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+""" Headless exports of a whole project, spread over a process pool. """
+
+__all__ = ["export_jams", "export_imports"]
+
+import io
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from configparser import ConfigParser
+from pathlib import Path
+
+from .bgplayer import BackgroundNull
+from .commands import Commands
+from .exportly import ExportLy
+from .exporttxt import ExportTxt
+from .jamlister import JamLister, read_segment
+from .render import render_segment
+
+EXPORT_SUFFIXES = {"midi": ".midi", "ly": ".ly", "txt": ".txt"}
+DEFAULT_FORMATS = "midi,ly,txt"
+# records what was exported from which version of each source
+EXPORT_INDEX = "exports.index"
+
+
+def get_export_options(config):
+    """ Return the (formats, jobs, output directory) asked for in `instance`. """
+    instance = config["instance"]
+    formats = []
+    for fmt in instance.get("export_formats", DEFAULT_FORMATS).split(","):
+        fmt = fmt.strip()
+        if fmt == "":
+            continue
+        if fmt not in EXPORT_SUFFIXES:
+            raise ValueError("unknown export format: {}".format(fmt))
+        formats.append(fmt)
+    jobs = instance.get("export_jobs", "")
+    jobs = int(jobs) if jobs != "" else None
+    project_dir = Path(instance["project_dir"])
+    output_dir = instance.get("export_dir", "")
+    output_dir = Path(output_dir) if output_dir != "" else project_dir / "exports"
+    return formats, jobs, output_dir
+
+
+def config_text(config):
+    text = io.StringIO()
+    config.write(text)
+    return text.getvalue()
+
+
+def parse_config(text):
+    config = ConfigParser(inline_comment_prefixes=None)
+    config.read_string(text)
+    return config
+
+
+class ExportIndex:
+    """ What has been exported, and from which version of its source.
+
+        Exporters don't always write the file they are given (an empty
+        Lilypond export writes nothing), so whether an export is current
+        is decided from this rather than from the outputs' mtimes.
+    """
+
+    def __init__(self, output_dir):
+        self.path = output_dir / EXPORT_INDEX
+        self.entries = ConfigParser(interpolation=None)
+        if self.path.exists():
+            self.entries.read(str(self.path))
+
+    def is_current(self, what, source_mtime, outputs):
+        if not self.entries.has_section(what):
+            return False
+        entry = self.entries[what]
+        if entry.get("source_mtime") != str(source_mtime):
+            return False
+        done = entry.get("formats", "").split(",")
+        for fmt in outputs:
+            if fmt not in done:
+                return False
+        for output in outputs.values():
+            if output.name in entry.get("files", "").split("/") and not output.exists():
+                return False
+        return True
+
+    def exported(self, what, source_mtime, outputs):
+        if not self.entries.has_section(what):
+            self.entries.add_section(what)
+        entry = self.entries[what]
+        formats = set(outputs)
+        files = set(output.name for output in outputs.values() if output.exists())
+        if entry.get("source_mtime") == str(source_mtime):
+            formats.update(f for f in entry.get("formats", "").split(",") if f != "")
+            files.update(f for f in entry.get("files", "").split("/") if f != "")
+        entry["source_mtime"] = str(source_mtime)
+        entry["formats"] = ",".join(sorted(formats))
+        entry["files"] = "/".join(sorted(files))
+
+    def save(self):
+        with self.path.open("w") as out:
+            self.entries.write(out)
+
+
+def report(done, total, what, status):
+    sys.stderr.write("[{}/{}] {}: {}\n".format(done, total, what, status))
+    sys.stderr.flush()
+
+
+def _export_jam(text, stream, mark, title, outputs):
+    config = parse_config(text)
+    material = read_segment(stream, mark)
+    for fmt, output in outputs.items():
+        if fmt == "midi":
+            render_segment(config, material, output)
+            continue
+        if fmt == "ly":
+            exporter = ExportLy(config, output, title=title)
+        else:
+            exporter = ExportTxt(config, output)
+        cmds = Commands(config)
+        cmds.wire(push_player=exporter, metronome=BackgroundNull())
+        exporter.start()
+        cmds.play(material, realtime=False, quiet=True)
+        exporter.end()
+
+
+def _export_import(text, name, bits, outputs):
+    from .importer import Importer
+    config = parse_config(text)
+    config["instance"]["import-file"] = name
+    importer = Importer(config)
+    importer.wire(ui=None, import_lister=None, push_player=None, csv_player=None)
+    importer.scan(bits=bits)
+    importer.export(outputs)
+
+
+def export_jams(config):
+    """ Export every marked segment that isn't deleted.
+
+        Segments already exported from the current version of their
+        stream are skipped. Progress is reported on stderr; returns the
+        number of segments that failed.
+    """
+    lister = JamLister(config)
+    jobs = []
+    for what in lister.get_order():
+        mark = lister.get_mark(what)
+        stream = lister.project_dir / mark["name"]
+        jobs.append((what, stream.stat().st_mtime_ns, _export_jam,
+                     (stream, dict(mark), mark.get("title", "Untitled"))))
+    return run_exports(config, jobs)
+
+
+def export_imports(config):
+    """ Export every import that has been worked on.
+
+        Each import is scanned once, in a worker, and all the formats are
+        exported from that one scan. Imports already exported from the
+        current version of their `.meta`, `.data` and journal files are
+        skipped. Progress is reported on stderr; returns the number of
+        imports that failed.
+    """
+    from .importlister import ImportLister
+    lister = ImportLister(config)
+    lister.scan()
+    jobs = []
+    for name in lister.get_order():
+        bits = lister.get(name)
+        metadata_file = Path(bits["metadata"])
+        sources = [metadata_file.with_suffix(suffix) for suffix in (".meta", ".data", ".journal")]
+        if not sources[1].exists():
+            # never worked on; nothing to export
+            continue
+        source_mtime = max(f.stat().st_mtime_ns for f in sources if f.exists())
+        jobs.append((name, source_mtime, _export_import, (name, bits)))
+    return run_exports(config, jobs)
+
+
+def run_exports(config, jobs):
+    """ Run (what, source_mtime, function, args) export jobs in a process pool.
+
+        Each function is called as `function(config_text, *args, outputs)`.
+    """
+    formats, max_workers, output_dir = get_export_options(config)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    index = ExportIndex(output_dir)
+    text = config_text(config)
+    total = len(jobs)
+    done = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for what, source_mtime, function, args in jobs:
+            outputs = {fmt: output_dir / (what + EXPORT_SUFFIXES[fmt]) for fmt in formats}
+            if index.is_current(what, source_mtime, outputs):
+                done += 1
+                report(done, total, what, "up to date")
+                continue
+            future = pool.submit(function, text, *args, outputs)
+            futures[future] = (what, source_mtime, outputs)
+        try:
+            for future in as_completed(futures):
+                done += 1
+                what, source_mtime, outputs = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    report(done, total, what, "failed: {}".format(e))
+                else:
+                    index.exported(what, source_mtime, outputs)
+                    report(done, total, what, "exported")
+        finally:
+            index.save()
+    return failed
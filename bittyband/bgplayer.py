@@ -1,31 +1,112 @@
 #!/usr/bin/env python3
 
-__all__ = ["BackgroundDrums", "BackgroundNull"]
+__all__ = ["BackgroundDrums", "BackgroundNull", "DrumPattern", "compile_pattern"]
 
 import sys
 import mido
-import queue
 import threading
+import time
 import os.path
+from functools import lru_cache
 from datetime import datetime, timedelta 
 from mido import Message, MidiFile, MidiTrack
 
 from .midinames import *
 from .errors import *
+from .player import LOOKAHEAD_SECS
 
 DRUM_CHANNEL=9
 DRUM_VELOCITY=16
+# what mido gives a note_off by default
+NOTE_OFF_VELOCITY=64
+
+class DrumPattern:
+    """ A bar of drums, compiled ready to loop.
+
+        `events` holds (offset, status, note, velocity) tuples, sorted by
+        offset, with offsets in microseconds from the start of the bar.
+        `messages` holds the matching `Message` for each event, and
+        `bar_length` is the length of the bar in microseconds. Compiled
+        patterns are shared through a cache, so don't change them.
+    """
+
+    def __init__(self, events, bar_length):
+        self.events = tuple(events)
+        self.messages = tuple(Message.from_bytes([status, note, velocity])
+                              for offset, status, note, velocity in self.events)
+        self.bar_length = bar_length
+
+
+def _freeze(seq):
+    if hasattr(seq, "__iter__"):
+        return tuple(_freeze(s) for s in seq)
+    return seq
+
+
+@lru_cache(maxsize=32)
+def compile_pattern(num, dem, tempo, seq):
+    """ Compile a bar of `num` beats of a `seq` of (nested) drum notes.
+
+        `tempo` is in microseconds per quarter note, as from `bpm2tempo`;
+        `seq` has to be hashable, see `_freeze`.
+    """
+    global DRUM_CHANNEL
+    global DRUM_VELOCITY
+    note_on = 0x90 | DRUM_CHANNEL
+    note_off = 0x80 | DRUM_CHANNEL
+    events = []
+    basetime = 0
+    basetempo = tempo * 4 / dem
+    for si in range(num):
+        s = seq[si % len(seq)]
+        if hasattr(s, "__iter__"):
+            for items in s:
+                if hasattr(items, "__iter__"):
+                    mytempo = basetempo / len(items)
+                    for i in range(len(items)):
+                        note = items[i]
+                        events.append((basetime + (mytempo * i), note_on, note, DRUM_VELOCITY))
+                        events.append((basetime + (mytempo * (i + 1)), note_off, note, NOTE_OFF_VELOCITY))
+                else:
+                    events.append((basetime, note_on, items, DRUM_VELOCITY))
+                    events.append((basetime + basetempo, note_off, items, NOTE_OFF_VELOCITY))
+        else:
+            if s > 0:
+                events.append((basetime, note_on, s, DRUM_VELOCITY))
+                events.append((basetime + basetempo, note_off, s, NOTE_OFF_VELOCITY))
+        basetime += basetempo
+    events.sort(key=lambda event: event[0])
+    return DrumPattern(((int(round(offset)), status, note, velocity) for offset, status, note, velocity in events),
+                       int(round(basetime)))
+
+
+@lru_cache(maxsize=None)
+def _default_seq():
+    ss = getNoteForName("ss")
+    s = (ss, ss, ss, ss)
+    return (s, s, s, s)
+
 
 class BackgroundDrums:
+    """ Loops a bar of drums under a jam.
+
+        Each bar starts at an absolute time on the `perf_counter` clock, a
+        bar length after the one before, so the loop doesn't drift however
+        long it runs. Its messages are fed to the push player a little
+        ahead of when they're due. Pattern and tempo changes take effect
+        at the start of the next bar; control calls wake the loop at once.
+    """
 
     def __init__(self, config):
-        self.queue = queue.Queue() 
+        self.cond = threading.Condition()
         self.thread = None
+        self.stopping = False
+        self.playing = False
+        self.restart = False
         self.active = {}
         self.ui = None
-        track = MidiTrack()
-        self.midifile = MidiFile()
-        self.midifile.tracks.append(track)
+        self.pattern = DrumPattern((), 0)
+        self.next_pattern = None
 
     def wire(self, *, push_player, **kwargs):
         self.player = push_player
@@ -35,113 +116,111 @@ class BackgroundDrums:
 
     def start(self):
         if self.thread is None:
+            self.stopping = False
             self.thread = threading.Thread(target=self._runner, daemon=True)
             self.thread.start()
             self.pause()
 
     def end(self):
-        if self.queue is not None and self.thread is not None:
-            self.queue.join()
-            self.queue.put(None)
+        if self.thread is not None:
+            self._control(stopping=True, playing=False)
+
+    def _control(self, **changes):
+        with self.cond:
+            for k, v in changes.items():
+                setattr(self, k, v)
+            self.cond.notify_all()
+
+    def _wait_until(self, due):
+        """ Wait until `due` (or for ever, if None).
+
+            Returns False if a control call interrupts the wait.
+        """
+        while True:
+            if self.stopping or not self.playing or self.restart:
+                return False
+            if due is None:
+                self.cond.wait()
+                continue
+            wait = due - time.perf_counter()
+            if wait <= 0:
+                return True
+            self.cond.wait(wait)
 
     def _runner(self):
-        terminate = False
-        while not terminate:
-            try:
-                for midi in self.midifile.play():
-                    if not self.queue.empty():
-                        while True:
-                            message = self.queue.get()
-                            self.queue.task_done()
-                            if message is None:
-                                terminate = True
-                                raise InterruptedError
-                            if isinstance(message, str):
-                                if message == "restart" or message == "start":
-                                    raise InterruptedError
-                                elif message == "pause":
-                                    pass
-                                elif message == "resume" or message == "play":
-                                    break
-                    self.player.feed_midi(midi)
-            except InterruptedError:
-                pass
+        with self.cond:
+            while not self.stopping:
+                while not self.playing and not self.stopping:
+                    self.cond.wait()
+                if self.stopping:
+                    break
+                self.restart = False
+                bar_start = time.perf_counter() + LOOKAHEAD_SECS
+                while self._play_bar(bar_start):
+                    bar_start += self.pattern.bar_length / 1000000
+                    if bar_start < time.perf_counter():
+                        # we fell more than a bar behind; start afresh
+                        bar_start = time.perf_counter() + LOOKAHEAD_SECS
+                self._silence()
         self.thread = None
-        self.queue = None
+
+    def _play_bar(self, bar_start):
+        """ Feed one bar starting at `bar_start`; returns False if interrupted. """
+        if self.next_pattern is not None:
+            self.pattern = self.next_pattern
+            self.next_pattern = None
+        pattern = self.pattern
+        if pattern.bar_length == 0:
+            # nothing to play until the pattern changes
+            while self.next_pattern is None:
+                if not self._wait_until(None):
+                    return False
+            return self._play_bar(time.perf_counter() + LOOKAHEAD_SECS)
+        for (offset, status, note, velocity), message in zip(pattern.events, pattern.messages):
+            due = bar_start + offset / 1000000
+            if not self._wait_until(due - LOOKAHEAD_SECS):
+                return False
+            self.player.feed_midi(message, at=due)
+            self._sent(status, note, velocity, due)
+        return self._wait_until(bar_start + pattern.bar_length / 1000000 - LOOKAHEAD_SECS)
+
+    def _sent(self, status, note, velocity, due):
+        if status & 0xF0 == 0x90 and velocity > 0:
+            self.active[note] = due
+        else:
+            self.active.pop(note, None)
+
+    def _silence(self):
+        """ Turn off the notes fed so far, after they've started. """
+        for note, due in self.active.items():
+            self.player.feed_midi(Message("note_off", channel=DRUM_CHANNEL, note=note), at=due)
+        self.active.clear()
 
     def set_tempo(self, num, dem, tempo): 
-        hihat = getNoteForName("hihat")
-        pedalhihat = getNoteForName("pedalhihat")
-        bassdrum = getNoteForName("bassdrum")
-        snare = getNoteForName("snare")
-        sn = getNoteForName("sn")
-        ss = getNoteForName("ss")
         #a0 = "hh hh // hhp // bd"
         #b0 = "hh hh // hhp // sn"
         #c0 = "hh hh // hhp // bd bd"
         #seq0 = "abcb"
-        a = [[hihat, hihat], pedalhihat, bassdrum]
-        b = [[hihat, hihat], pedalhihat, snare]
-        c = [[hihat, hihat], pedalhihat, [bassdrum, bassdrum]]
-        s = [ss, ss, ss, ss]
-        seq = [s, s, s, s]
-        self.set_pattern(num, dem, tempo, *seq)
+        self.set_pattern(num, dem, tempo, *_default_seq())
 
     def set_pattern(self, num, dem, tempo, *seq):
-        global DRUM_CHANNEL
-        global DRUM_VELOCITY
-        track = MidiTrack()
-        newMidifile = MidiFile()
-        newMidifile.tracks.append(track)
-        nexttime = 0
-        notebucket = []
-        basetime = 0
-        basetempo = tempo * 4 / dem
-        for si in range(num):
-            s = seq[si % len(seq)]
-            if hasattr(s, "__iter__"):
-                for items in s:
-                    if hasattr(items, "__iter__"):
-                        mytempo = basetempo / len(items)
-                        for i in range(len(items)):
-                            note = items[i]
-                            notebucket.append(Message("note_on", channel=DRUM_CHANNEL, note=note, velocity=DRUM_VELOCITY, time= basetime + (mytempo * i)))
-                            notebucket.append(Message("note_off", channel=DRUM_CHANNEL, note=note, time=basetime + (mytempo * (i + 1))))
-                    else:
-                        notebucket.append(Message("note_on", channel=DRUM_CHANNEL, note=items, velocity=DRUM_VELOCITY, time=basetime))
-                        notebucket.append(Message("note_off", channel=DRUM_CHANNEL, note=items, time=basetime + basetempo) )
-            else:
-                if s > 0:
-                    notebucket.append(Message("note_on", channel=DRUM_CHANNEL, note=s, velocity=DRUM_VELOCITY, time=basetime))
-                    notebucket.append(Message("note_off", channel=DRUM_CHANNEL, note=s, time=basetime + basetempo))
-            basetime += basetempo
-        notebucket.sort(key=lambda message: message.time)
-        start = None
-        for evt in notebucket:
-            if start is None:
-                start = evt.time
-                evt.time = 0
-            else:
-                n = evt.time
-                evt.time = (n - start) / 1000
-                start = n
-            track.append(evt)
-        self.midifile = newMidifile
+        """ Switch to a new pattern at the start of the next bar. """
+        self._control(next_pattern=compile_pattern(num, dem, tempo, _freeze(seq)))
 
     def pause(self):
-        self.queue.put("pause")
+        self._control(playing=False)
 
     def resume(self):
-        self.queue.put("resume")
+        self._control(playing=True)
 
     def stop(self):
-        self.queue.put("stop")
+        self._control(playing=False, restart=True)
 
     def play(self):
-        self.queue.put("play")
+        self._control(playing=True)
 
     def rewind(self):
-        self.queue.put("restart")
+        self._control(restart=True)
 
 
 class BackgroundNull:
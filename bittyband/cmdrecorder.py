@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import os
 import queue
 from pathlib import Path
 import threading
@@ -10,42 +11,115 @@ from time import time,perf_counter
 import sys
 
 FILE_ID = "#,audio/vnd.mrbeany.bittyband.stream : v1\n"
+# next to a stream while its recorder is writing it
+RECORDING_SUFFIX = ".recording"
+
+# write out what has been recorded at least this often...
+FLUSH_SECS = 0.25
+# ...or once this much has built up
+FLUSH_BYTES = 64 * 1024
+
 
 class CommandRecorder:
-    """ Internal Command Recorder (for jam mode) """
+    """ Internal Command Recorder (for jam mode)
+
+        The writer thread commits in groups: everything waiting in the
+        queue goes out in one write, at most `flush_secs` after the
+        oldest of it was recorded or once `flush_bytes` have built up.
+        A `mark_good` or `mark_bad` is written out straight away and,
+        unless `fsync_marks` is off, synced to disk. These come from the
+        `[recorder]` section of the config.
+    """
     def __init__(self, config):
         project_dir = Path(config["instance"]["project_dir"])
+        options = config["recorder"] if "recorder" in config else {}
+        self.flush_secs = float(options.get("flush_ms", FLUSH_SECS * 1000)) / 1000
+        self.flush_bytes = int(options.get("flush_bytes", FLUSH_BYTES))
+        self.fsync_marks = str(options.get("fsync_marks", "yes")).lower() in ("yes", "true", "on", "1")
         self.fname = self.find_next_name(project_dir, "cmd-{}.stream")
         self.queue = queue.Queue() 
         self.thread = None
+        # the writer's deadlines are kept on this clock
+        self.clock = perf_counter
+        self._pending = []
+        self._size = 0
+        self._due = None
 
     def wire(self, **kwargs):
         pass
 
     def start(self):
+        Path(self.fname + RECORDING_SUFFIX).touch()
         self.thread = threading.Thread(target=self.writer)
         self.thread.start()
 
     def writer(self):
+        try:
+            self._write()
+        finally:
+            Path(self.fname + RECORDING_SUFFIX).unlink(missing_ok=True)
+        self.queue = None
+        self.thread = None
+
+    def _write(self):
         global FILE_ID
         with open(self.fname, "wt") as out:
             out.write(FILE_ID)
-            while True:
-                if self.queue.empty():
-                    out.flush()
-                item = self.queue.get()
-                if item is None:
-                    break
-                out.write(item)
-                out.write("\n")
-                self.queue.task_done()
-        self.queue = None
-        self.thread = None
+            out.flush()
+            stopping = False
+            while not stopping:
+                try:
+                    if self._due is None:
+                        items = [self.queue.get()]
+                    else:
+                        items = [self.queue.get(timeout=max(self._due - self.clock(), 0))]
+                except queue.Empty:
+                    items = []
+                # take everything else that's waiting along with it
+                while True:
+                    try:
+                        items.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                for item in items:
+                    self.queue.task_done()
+                stopping = self._collect(items, out)
+
+    def _collect(self, items, out):
+        """ Add `items` to what's pending, and write it all to `out` if it's time.
+
+            Returns True if one of them, None, asks the writer to stop.
+        """
+        stopping = False
+        mark = False
+        for item in items:
+            if item is None:
+                stopping = True
+                continue
+            if self._due is None:
+                self._due = self.clock() + self.flush_secs
+            stamp, cmd = item
+            line = "{},{}\n".format(stamp, cmd)
+            self._pending.append(line)
+            self._size += len(line)
+            if cmd.startswith("mark_good") or cmd == "mark_bad":
+                mark = True
+        if self._pending and (stopping or mark or self._size >= self.flush_bytes or self.clock() >= self._due):
+            out.write("".join(self._pending))
+            out.flush()
+            if mark and self.fsync_marks:
+                os.fsync(out.fileno())
+            self._pending = []
+            self._size = 0
+            self._due = None
+        return stopping
 
     def end(self):
-        if self.queue is not None and self.thread is not None:
+        thread = self.thread
+        if self.queue is not None and thread is not None:
             self.queue.join()
             self.queue.put(None)
+            thread.join()
 
     def find_next_name(self, project_dir, basenm):
         tme = str(time())
@@ -57,9 +131,13 @@ class CommandRecorder:
         t.write_text(FILE_ID)
         return str(t)
 
-    def add(self, what):
+    def add(self, what, at=None):
+        """ Record the command `what`, as of `at` on the `perf_counter` clock (by default, now).
+
+            It's formatted by the writer thread, out of the way of the keys.
+        """
         if self.queue is not None:
-            self.queue.put("{},{}".format(perf_counter(),what))
+            self.queue.put((perf_counter() if at is None else at, what))
 
     def __del__(self):
         if hasattr(self, "queue"):
@@ -8,6 +8,7 @@ from mido import Message, bpm2tempo
 from .midinames import getLyForMidiNote
 import time
 from .utils.cmdutils import *
+from .player import LOOKAHEAD_SECS, ALL_NOTES_OFF, ALL_SOUND_OFF
 
 import locale
 
@@ -29,16 +30,27 @@ class Commands:
         self.pad_chords = [0, 2, 4]
         self.pad_chord_idx = -1
         self.pad_chord_seq = []
-        self.scale = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
         self.active_preset = None
         self.lead_note = None
         self.pad_note = None
         self.key_note = 60
+        self.scale_text = None
+        # until a preset is set, there are no chords
+        self.pad_chords_text = ""
+        self.pad_sequence_text = None
+        self._retable()
         self.pad_instrument = 0
         self.lead_instrument = 0
         self.ui = None
         self.message_time = 0
+        self.message_at = None
         self.background_on = False
+        self.keymap = None
+        self.key_table = {}
+        # builds the messages played; an offline renderer can swap in something lighter
+        self.make_message = Message
+        self._lead_on = {}
+        self._lead_off = {}
 
     def wire(self, *, push_player, push_recorder=None, ui=None, metronome, **kwargs):
         self.player = push_player
@@ -52,29 +64,107 @@ class Commands:
         if action is not None:
             action(self, cmd)
 
-    def play(self, material, realtime=True):
+    def compile_keys(self, keymap):
+        """ Compile `keymap`, of keys to commands, for `press`.
+
+            The table is rebuilt whenever the key or scale changes, so a
+            lead note key goes straight to a prebuilt `note_on` without
+            working out its note.
+        """
+        self.keymap = keymap
+        self._compile()
+
+    def _compile(self):
+        table = {}
+        for key, command in self.keymap.items():
+            note = self.tables.note_for(command)
+            if command == "note_key":
+                note = self.key_note
+            if note is not None and not 0 <= note <= 127:
+                # let do_note complain about it
+                note = None
+            if note is not None and note not in self._lead_on:
+                self._lead_on[note] = (Message('note_on', note=note, channel=LEAD_CHANNEL),
+                                       "{} ".format(getLyForMidiNote(note)))
+            table[key] = (command, note)
+        self.key_table = table
+
+    def press(self, key, stamp=None):
+        """ Record and run the command `key` is mapped to by `compile_keys`.
+
+            `stamp` is when the key was read, on the `perf_counter` clock;
+            lead notes carry it to the player's latency probe. Returns the
+            command, or None if `key` isn't mapped.
+        """
+        entry = self.key_table.get(key)
+        if entry is None:
+            return None
+        command, note = entry
+        if command == "quit":
+            return command
+        if self.cmdrecorder is not None:
+            self.cmdrecorder.add(command, at=stamp)
+        if note is None:
+            action = action_mapping.get(command)
+            if action is not None:
+                action(self, command)
+            return command
+        note_on, text = self._lead_on[note]
+        if self.lead_note is None:
+            self.player.feed_midi(note_on, stamp=stamp)
+        else:
+            note_off = self._lead_off.get(self.lead_note)
+            if note_off is None:
+                note_off = self._lead_off[self.lead_note] = Message('note_off', note=self.lead_note,
+                                                                    channel=LEAD_CHANNEL)
+            self.player.feed_midi(note_off, note_on, stamp=stamp)
+        self.lead_note = note
+        if self.ui is not None:
+            self.ui.puts(text)
+        return command
+
+    def play(self, material, realtime=True, *, quiet=False):
+        """ Play the commands of a stream segment through the player.
+
+            `material` is lines of a v1 stream or `(time, command)` pairs.
+            Unless `realtime`, it goes as fast as the player takes it,
+            with message times in milliseconds. Each command is echoed to
+            stderr, unless `quiet`.
+        """
         global action_mapping
         orig_ui = self.ui
         try:
             self.ui = None
             start = None
             end = None
+            origin = None
             for line in material:
-                if line[0] in "# \t":
-                    continue
-                p = line.split(",", 1)
-                cmd = p[-1]
-                end = float(p[0])
+                if isinstance(line, str):
+                    if line[0] in "# \t":
+                        continue
+                    p = line.split(",", 1)
+                    cmd = p[-1]
+                    end = float(p[0])
+                else:
+                    # already parsed, from a v2 stream
+                    end, cmd = line
                 if start is not None:
                     s = (end - start)
                     if s > 0:
                         #                   self.message_time = int(s * 1000000)
                         self.message_time = int(s * 1000)
-                        if realtime:
-                            time.sleep(s)
+                if realtime:
+                    # feed each command a little ahead of when it's due
+                    now = time.perf_counter()
+                    if origin is None:
+                        origin = (now, end)
+                    self.message_at = origin[0] + end - origin[1]
+                    if self.message_at - LOOKAHEAD_SECS > now:
+                        time.sleep(self.message_at - LOOKAHEAD_SECS - now)
                 if cmd[0] == "!":
                     continue
-                sys.stderr.write(cmd + "\n\r")
+                if not quiet:
+                    sys.stderr.write(cmd + "\n\r")
                 action = action_mapping.get(cmd)
                 if action is not None:
                     action(self, cmd)
@@ -82,6 +172,7 @@ class Commands:
             self.do_silence("silence")
         finally:
             self.ui = orig_ui
+            self.message_at = None
 
     def do_nothing(self, what):
         pass
@@ -139,7 +230,11 @@ class Commands:
         if self.cmdrecorder is not None:
             self.cmdrecorder.add("!set key={0!r}".format(self.key_note))
         if "scale" in self.config[what]:
-            self.scale = parse_scale(self.config[what]["scale"].strip())
+            self.scale_text = self.config[what]["scale"].strip()
+        self.pad_chords_text = self.config[what].get("pad_chords", "1")
+        self.pad_sequence_text = self.config[what].get("pad_sequence", "I")
+        self._retable()
+        if "scale" in self.config[what]:
             self.player.feed_comment("scale contents: {!r}".format(self.scale))
         if self.cmdrecorder is not None:
             self.cmdrecorder.add("!set scale={0!r}".format(self.scale))
@@ -148,8 +243,8 @@ class Commands:
         else:
             self.lead_instrument = 0
 
-        self.player.feed_midi(Message('program_change', channel=LEAD_CHANNEL,
-                                      program=self.lead_instrument, time=self.message_time))
+        self.player.feed_midi(self.make_message('program_change', channel=LEAD_CHANNEL,
+                                      program=self.lead_instrument, time=self.message_time), at=self.message_at)
         self.message_time = 0
         if self.cmdrecorder is not None:
             self.cmdrecorder.add("!set lead_instrument={0!r}".format(self.lead_instrument))
@@ -157,13 +252,13 @@ class Commands:
             self.pad_instrument = int(self.config[what]["pad_instrument"])
         else:
             self.pad_instrument = 0
-        self.player.feed_midi(Message('program_change', channel=PAD_CHANNEL,
-                                      program=self.pad_instrument, time=0))
+        self.player.feed_midi(self.make_message('program_change', channel=PAD_CHANNEL,
+                                      program=self.pad_instrument, time=0), at=self.message_at)
         if self.cmdrecorder is not None:
             self.cmdrecorder.add("!set pad_instrument={0!r}".format(self.pad_instrument))
 
-        self.pad_chords = parse_chords(self.config[what].get("pad_chords", "1"), self.scale, self.key_note)
-        self.pad_chord_seq = parse_sequence(self.config[what].get("pad_sequence", "I"), self.pad_chords)
+        self.pad_chords = self.tables.chords
+        self.pad_chord_seq = self.tables.sequence
         self.active_preset = what
         bpm = 120
         if "bpm" in self.config[what]:
@@ -177,14 +272,22 @@ class Commands:
         else:
             nude = timing.partition("/")
             self.background.set_tempo(int(nude[0]), int(nude[-1]), bpm2tempo(bpm))
+        if self.keymap is not None:
+            self._compile()
+
+    def _retable(self):
+        self.tables = preset_tables(self.key_note, self.scale_text, self.pad_chords_text, self.pad_sequence_text)
+        self.scale = self.tables.scale
 
     def set_lead_note(self, note=None):
         if self.lead_note is not None:
             self.player.feed_midi(
-                Message('note_off', note=self.lead_note, channel=LEAD_CHANNEL, time=self.message_time))
+                self.make_message('note_off', note=self.lead_note, channel=LEAD_CHANNEL, time=self.message_time),
+                at=self.message_at)
             self.message_time = 0
         if note is not None:
-            self.player.feed_midi(Message('note_on', note=note, channel=LEAD_CHANNEL, time=self.message_time))
+            self.player.feed_midi(self.make_message('note_on', note=note, channel=LEAD_CHANNEL, time=self.message_time),
+                                  at=self.message_at)
         else:
             self.player.feed_other("rest", channel=LEAD_CHANNEL)
         self.lead_note = note
@@ -194,31 +297,47 @@ class Commands:
             else:
                 self.ui.puts("{} ".format(getLyForMidiNote(note)))
 
-    def do_panic(self):
+    def do_panic(self, thorough=False):
+        """ Silence everything.
+
+            Each channel gets "All Notes Off" and "All Sound Off", then the
+            notes the player knows are sounding get a `note_off`. With
+            `thorough`, every note on every channel gets one instead, for
+            devices that ignore the channel mode controllers.
+        """
         if self.ui is not None:
             self.ui.puts("\nPANIC ")
         note_set = []
         for channel in range(0, 16):
-            for note in range(0, 128):
-                note_set.append(Message('note_off', note=note, channel=channel, time=self.message_time))
-        self.player.feed_midi(*note_set, time=self.message_time, abbr="panic")
+            note_set.append(self.make_message('control_change', channel=channel, control=ALL_NOTES_OFF))
+            note_set.append(self.make_message('control_change', channel=channel, control=ALL_SOUND_OFF))
+        if thorough:
+            for channel in range(0, 16):
+                for note in range(0, 128):
+                    note_set.append(self.make_message('note_off', note=note, channel=channel))
+        else:
+            for channel, note in self.player.sounding():
+                note_set.append(self.make_message('note_off', note=note, channel=channel))
+        self.player.feed_midi(*note_set, time=self.message_time, abbr="panic", at=self.message_at)
         self.message_time = 0
 
     def set_pad_note(self, note=None):
         global PAD_VELOCITY
         if isinstance(self.pad_note, int):
-            self.player.feed_midi(Message('note_off', note=self.pad_note, channel=PAD_CHANNEL, time=self.message_time))
+            self.player.feed_midi(self.make_message('note_off', note=self.pad_note, channel=PAD_CHANNEL, time=self.message_time),
+                                  at=self.message_at)
             self.message_time = 0
         elif hasattr(self.pad_note, "__iter__"):
             note_set = []
             for pn in self.pad_note:
-                note_set.append(Message('note_off', note=pn, channel=PAD_CHANNEL))
-            self.player.feed_midi(*note_set, time=self.message_time, abbr="chord_off")
+                note_set.append(self.make_message('note_off', note=pn, channel=PAD_CHANNEL))
+            self.player.feed_midi(*note_set, time=self.message_time, abbr="chord_off", at=self.message_at)
             self.message_time = 0
 
         if isinstance(note, int):
             self.player.feed_midi(
-                Message('note_on', note=note, channel=PAD_CHANNEL, time=self.message_time, velocity=PAD_VELOCITY))
+                self.make_message('note_on', note=note, channel=PAD_CHANNEL, time=self.message_time, velocity=PAD_VELOCITY),
+                at=self.message_at)
             if self.ui is not None:
                 self.ui.puts("< {} > ".format(getLyForMidiNote(note)))
         elif hasattr(note, "__iter__"):
@@ -226,12 +345,12 @@ class Commands:
             if self.ui is not None:
                 self.ui.puts("< ")
             for pn in note:
-                note_set.append(Message('note_on', note=pn, channel=PAD_CHANNEL, velocity=PAD_VELOCITY))
+                note_set.append(self.make_message('note_on', note=pn, channel=PAD_CHANNEL, velocity=PAD_VELOCITY))
                 if self.ui is not None:
                     self.ui.puts("{} ".format(getLyForMidiNote(pn)))
             if self.ui is not None:
                 self.ui.puts("> ")
-            self.player.feed_midi(*note_set, time=self.message_time, abbr="chord_on")
+            self.player.feed_midi(*note_set, time=self.message_time, abbr="chord_on", at=self.message_at)
             self.message_time = 0
         elif note is None:
             self.player.feed_other("rest", channel=LEAD_CHANNEL)
@@ -241,7 +360,7 @@ class Commands:
         self.set_lead_note(self.lead_note)
 
     def do_note(self, what):
-        note = calculate_note(what, key_note=self.key_note, scale=self.scale)
+        note = self.tables.note_for(what)
         if note is not None:
             self.set_lead_note(note)
 
@@ -282,6 +401,9 @@ class Commands:
             self.key_note += OCTAVE_STEPS
         elif name == "octave_down":
             self.key_note -= OCTAVE_STEPS
+        self._retable()
+        if self.keymap is not None:
+            self._compile()
 
     def do_play_pause(self, name):
         if self.background_on:
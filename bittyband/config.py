@@ -7,8 +7,6 @@ import sys
 from configparser import ConfigParser
 from pathlib import Path
 
-from .player import PushButtonPlayer
-from .commands import Commands
 from .errors import ConfigError
 
 
@@ -28,6 +26,10 @@ def parse(argv):
         config["instance"]["mode"] = args.mode
         if args.mode == "importer":
             config["instance"]["import-file"] = args.import_file
+        elif args.mode in ("export-jams", "export-imports"):
+            set_export_options(args)
+        elif args.mode == "convert-streams":
+            config["instance"]["stream_format"] = args.stream_format
     else:
         parser.parse_args(["-h"])
         sys.exit(0)
@@ -106,6 +108,37 @@ key = 60
 scale = rel: 1 2 3 4 5 6 7
 title = C4 Major
 
+[automate]
+# onsets quieter than this (dB) are left out; changing it reuses the cached analysis
+silence = -40
+# the analysis profile automate uses, unless another is asked for
+profile = normal
+
+# analysis profiles: the hop (and window, twice the hop unless buf_size is
+# given) in samples, and the aubio onset method the tempo is tracked with
+[analysis_draft]
+# a long hop and the cheapest method: fast, but onsets are only placed to ~50ms
+hop_size = 2048
+tempo_method = energy
+
+[analysis_normal]
+hop_size = 1024
+tempo_method = specdiff
+
+[analysis_precise]
+# a short hop in a long window: slow, but onsets are placed to ~6ms
+hop_size = 256
+buf_size = 2048
+tempo_method = complex
+
+[recorder]
+# recorded jam commands are written out at least this often (milliseconds)...
+flush_ms = 250
+# ...or once this many bytes of them have built up
+flush_bytes = 65536
+# sync the stream to disk at each mark_good and mark_bad
+fsync_marks = yes
+
 
 [keymap]
 quit = (^[,KEY_ESCAPE,\N{escape})
@@ -272,6 +305,15 @@ version = 1
 """
 
 
+def set_export_options(args):
+    global config
+    config["instance"]["export_formats"] = args.formats
+    if args.jobs is not None:
+        config["instance"]["export_jobs"] = str(args.jobs)
+    if args.output_dir is not None:
+        config["instance"]["export_dir"] = args.output_dir
+
+
 def create(args):
     load_home_config(args)
     project_dir = find_project_dir(args.project)
@@ -282,12 +324,15 @@ def create(args):
 
 
 def panic(args):
+    # imported here so nothing else slows down a panic
+    from .player import PushButtonPlayer
+    from .commands import Commands
     pbplayer = PushButtonPlayer(config)
     pbplayer.start()
     cmds = Commands(config)
     cmds.wire(push_player=pbplayer, metronome=None)
     try:
-        cmds.do_panic()
+        cmds.do_panic(thorough=args.thorough)
     finally:
         pbplayer.end()
     return True
@@ -310,6 +355,8 @@ parser_list.set_defaults(mode="list")
 parser_test = subparsers.add_parser("test", description="Perform some internal tests")
 parser_test.set_defaults(mode="test")
 parser_test = subparsers.add_parser("panic", description="Perform a MIDI Panic and clear all notes.")
+parser_test.add_argument("--thorough", action="store_true",
+                         help="Also send a note off for every note on every channel.")
 parser_test.set_defaults(func=panic, mode="panic")
 parser_importlist = subparsers.add_parser("import", description="Grand importer mode",)
 parser_importlist.add_argument("-i", "--import", metavar="FILE", dest="import_file")
@@ -317,3 +364,19 @@ parser_importlist.set_defaults(mode="import")
 parser_importer = subparsers.add_parser("importer", description="Import specific file")
 parser_importer.add_argument("import_file", metavar="FILE", help="file in import directory")
 parser_importer.set_defaults(mode="importer")
+parser_export_jams = subparsers.add_parser("export-jams", description="Export every marked jam segment")
+parser_export_jams.set_defaults(mode="export-jams")
+parser_export_imports = subparsers.add_parser("export-imports", description="Export every import")
+parser_export_imports.set_defaults(mode="export-imports")
+parser_convert_streams = subparsers.add_parser("convert-streams",
+                                               description="Convert the recorded jam streams to another format")
+parser_convert_streams.add_argument("-t", "--to", choices=("1", "2"), default="2", dest="stream_format",
+                                    help="Stream format: 1 (text) or 2 (binary). (Default: 2.)")
+parser_convert_streams.set_defaults(mode="convert-streams")
+for parser_export in (parser_export_jams, parser_export_imports):
+    parser_export.add_argument("-f", "--formats", default="midi,ly,txt",
+                               help="Comma-separated formats to export: midi, ly, txt. (Default: all.)")
+    parser_export.add_argument("-j", "--jobs", type=int,
+                               help="Number of export processes. (Default: one per CPU.)")
+    parser_export.add_argument("-o", "--output-dir", metavar="DIR", dest="output_dir",
+                               help="Directory to export in to. (Default: 'exports' in the project.)")
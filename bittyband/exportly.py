@@ -369,7 +369,7 @@ class ExportLy:
         else:
             self.lily.lyrics.append(quote_as_needed(lyric))
 
-    def feed_midi(self, *what, abbr=None, channel=None, time=None):
+    def feed_midi(self, *what, abbr=None, channel=None, time=None, at=None):
         if len(what) == 0:
             return
         if abbr == "panic":
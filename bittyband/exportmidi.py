@@ -43,7 +43,7 @@ class ExportMidi:
     def feed_lyric(self, lyric, **kwargs):
         pass
 
-    def feed_midi(self, *what, ui=None, abbr=None, channel=None, time=None): 
+    def feed_midi(self, *what, ui=None, abbr=None, channel=None, time=None, at=None): 
         for w in what: 
             if time is not None:
                 w.time = time
@@ -121,5 +121,5 @@ class ExportTxt:
         if needSpace:
             self.cur.append(" ")
 
-    def feed_midi(self, *what, ui=None, abbr=None, channel=None, time=None):
+    def feed_midi(self, *what, ui=None, abbr=None, channel=None, time=None, at=None):
         pass
@@ -1,32 +1,44 @@
 #!/usr/bin/env
 
 import csv
+import io
+import os
+import threading
 from pathlib import Path
 from configparser import ConfigParser
 
 import mido
-import pyglet
 from mido import Message
 
 from ..midinames import getLyForMidiNote
 from .csvplayer import CsvPlayer
 from ..utils.cmdutils import *
 from ..utils.time import human_duration, from_human_duration, filename_iso_time
-from .importcsvdialect import ImportCsvDialect
+from .importcsvdialect import ImportCsvDialect, DATA_FIELDNAMES
 from ..exportly import ExportLy
 from ..exportmidi import ExportMidi
 from ..exporttxt import ExportTxt
 from ..commands import LEAD_CHANNEL, PAD_CHANNEL
-from .automate import Automate
+from .rowstore import RowStore
+from .journal import EditJournal
+from .datacache import read_cache, write_cache
 
+# journal records to collect before compacting them in to the `.data` file
+COMPACT_AFTER = 500
 
 
 class Importer:
     def __init__(self, config):
         self.config = config
         self.ui = None
-        self.data = {}
-        self.order = []
+        self.rows = RowStore()
+        self._seen_revision = None
+        self._checkpoints = {}
+        self._tracks = []
+        self.journal = None
+        self._compactor = None
+        self._automate = None
+        self.spreader = None
         self.player = None
         self.start_segment = None
         self.start_line = 0
@@ -63,6 +75,7 @@ class Importer:
         self.player.play()
 
     def _start_player(self):
+        import pyglet
         media = self.bits["media"]
         self.play_length = self.bits["length_secs"]
         sound = pyglet.media.load(str(media))
@@ -73,7 +86,7 @@ class Importer:
         self.player.queue(group)
 
     def _do_play(self, line):
-        self.start_segment = self.order[line]
+        self.start_segment = self.rows[line]
         self.start_line = line
         self.end_segment = None
         self.playing_row = None
@@ -89,7 +102,7 @@ class Importer:
             self.csv_player.play()
 
     def _do_play_chords(self, line):
-        self.start_segment = self.order[line]
+        self.start_segment = self.rows[line]
         self.start_line = line
         self.end_segment = None
         self.playing_row = None
@@ -104,14 +117,14 @@ class Importer:
             self.csv_player.play()
 
     def _do_play_segment(self, *, line, advertise=True):
-        if line == len(self.order) - 1:
+        if line == len(self.rows) - 1:
             self.spreader.show_status("Can not play last segment")
             self.playing_row = None
             return False
-        self.start_segment = self.order[line]
+        self.start_segment = self.rows[line]
         self.start_line = line
         self.playing_row = line
-        self.end_segment = self.order[line + 1]
+        self.end_segment = self.rows[line + 1]
         if advertise:
             self.spreader.show_status("Playing current line".format(human_duration(self.start_segment), human_duration(self.end_segment)))
         self.player.seek(self.start_segment)
@@ -120,21 +133,22 @@ class Importer:
         self.csv_player.play()
 
     def _do_repeat_mark(self, *, line):
-        datum = self.data.get(self.order[line])
-        if datum.get("mark_idx", -1) < 0:
+        datum = self.rows.row_at(line)
+        mark_loc = datum.get("mark_loc")
+        if mark_loc is None:
             self.spreader.show_status("This line isn't in a marked section")
             return False
         self.playing_row = None
-        self.start_line = datum["mark_idx"]
+        self.start_line = self.rows.index(mark_loc)
         end_line = self.start_line
-        while end_line < len(self.order) and self.data.get(self.order[end_line]).get("mark_idx",-1) == self.start_line:
+        while end_line < len(self.rows) and self.rows.row_at(end_line).get("mark_loc") == mark_loc:
             end_line += 1
-        if end_line >= len(self.order):
-            end_line = len(self.order) - 1
+        if end_line >= len(self.rows):
+            end_line = len(self.rows) - 1
 
-        start_secs = self.order[line]
+        start_secs = self.rows[line]
         self.start_segment = start_secs
-        self.end_segment = self.order[end_line]
+        self.end_segment = self.rows[end_line]
         starting_at = ""
         if line != self.start_line:
             starting_at = " starting at {}".format(human_duration(start_secs))
@@ -147,17 +161,17 @@ class Importer:
         self.csv_player.play()
 
     def _do_delete(self, *, line):
-        if line == 0 or line == len(self.order) - 1:
+        if line == 0 or line == len(self.rows) - 1:
             self.spreader.show_status("Can't delete top or bottom")
             return False
-        item = self.order[line]
-        del self.data[item]
-        del self.order[line]
+        self.rows.remove_at(line)
         self.spreader.invalidate = True
         self.changed = True
         return True
 
     def _do_idle(self):
+        if self._automate is not None:
+            self._collect_automate()
         if not self.player:
             self.spreader.show_status(self.bits["title"])
             self._start_player()
@@ -169,45 +183,48 @@ class Importer:
             self.csv_player.play()
         # display = human_duration(t, floor=True)
         # self.spreader.display_time(display)
-        # display = human_duration(self.order[self.csv_player.line-1], floor=1)
+        # display = human_duration(self.rows[self.csv_player.line-1], floor=1)
         # self.spreader.display_line(display)
         row = self.playing_row
         if row is not None and row != self.spreader.active:
             self._do_play_segment(line=self.spreader.active, advertise=False)
         if not self.player.playing:
-            if len(self.order) != len(self.data):
+            if self.rows.revision != self._seen_revision:
                 self.update_order()
                 self._propagate()
                 self.spreader.refresh()
-            elif self._need_propagate:
+            elif self.rows.dirty is not None:
                 self._propagate()
                 self.spreader.refresh()
+            elif self.journal.pending >= COMPACT_AFTER:
+                self._compact_in_background()
 
     def _do_tap(self, *, line):
         offset = self.player.time
-        if offset not in self.data:
+        if offset not in self.rows:
             self.add_row(offset)
         self.spreader.show_status(human_duration(offset, 3))
         self.changed = True
         return False
 
     def _split_words(self, line):
-        datum = self.data[self.order[line]]
+        datum = self.rows.row_at(line)
         words = break_on_lily_words(datum["lyric"])
-        if line == len(self.order):
+        if line == len(self.rows):
             self.spreader.show_status("Can't do that on the last line.")
             return True
         segments = len(words)
-        available_space = self.order[line+1] - self.order[line]
+        available_space = self.rows[line+1] - self.rows[line]
         offset = available_space / segments
-        starting_at = self.order[line]
+        starting_at = self.rows[line]
         for idx in range(1,segments):
             location = starting_at + offset * idx
-            if location in self.data:
+            if location in self.rows:
                 self.spreader.show_status("Woah. Didn't expect {} to be present. Stopping.".format(location))
                 return True
             self.add_row(location, lyric=words[idx])
         datum["lyric"] = words[0]
+        self.rows.touch(datum["location"])
         return False
 
     def _do_beat_repeat(self, bpm, *, line):
@@ -238,15 +255,15 @@ class Importer:
         if check is None:
             self.spreader.show_status("Problem parsing rate: {} (around {})".format(bpm, bpm[i:]))
             return True
-        offset = check - self.order[line]
-        location = self.order[line]
-        bottom = self.order[-1]
+        offset = check - self.rows[line]
+        location = self.rows[line]
+        bottom = self.rows[-1]
         x = 0
         while x < rep:
             location += offset
             if location < 0.0 or location > bottom:
                 break
-            if location not in self.data:
+            if location not in self.rows:
                 self.add_row(location)
             x += 1
         self.spreader.show_status("{} rows added every {}".format(x, human_duration(offset, 3)))
@@ -256,12 +273,12 @@ class Importer:
     _track_change_states = ["", "crap", "resume", "unknown", "track"]
 
     def _do_track(self, *, line):
-        datum = self.data[self.order[line]]
+        datum = self.rows.row_at(line)
         got = datum.get("track-change","")
         if got == "":
             last = ""
             for i in range(line - 1, -1, -1):
-                d = self.data[self.order[line]]
+                d = self.rows.row_at(line)
                 last = d.get("track-change", "")
                 if last != "":
                     got = last
@@ -272,7 +289,7 @@ class Importer:
         if idx >= len(self._track_change_states):
             idx = 0
         datum["track-change"] = self._track_change_states[idx]
-        self._need_propagate = True
+        self.rows.touch(datum["location"])
         self.spreader.refresh_line(line)
         self.changed = True
         return True
@@ -281,7 +298,7 @@ class Importer:
     _chord_mode = "progression"
     _chord_selections = 2
     def _do_chord(self, *, line):
-        datum = self.data[self.order[line]]
+        datum = self.rows.row_at(line)
 
 
         if self._chord_mode == "progression":
@@ -304,12 +321,12 @@ class Importer:
 
         datum["chord_ui"] = "??"
         self.spreader.refresh_line(line)
-        self._need_propagate = True
+        self.rows.touch(datum["location"])
         self.changed = True
         return True
 
     def _do_chord_backwards(self, *, line):
-        datum = self.data[self.order[line]]
+        datum = self.rows.row_at(line)
 
 
         if self._chord_mode == "progression":
@@ -327,30 +344,63 @@ class Importer:
 
         datum["chord_ui"] = "??"
         self.spreader.refresh_line(line)
-        self._need_propagate = True
+        self.rows.touch(datum["location"])
         self.changed = True
         return True
 
-    def _propagate(self):
-        self._need_propagate = False
-        last_track = "unknown"
-        last_chord = "rest"
-        self._tracks = []
-        chord_idx = -1
-        if str(0.0) in self.metadata:
-            this_track = self.find_song_data(0.0)
+    def _propagate(self, full=False):
+        """ Recompute the running track, chord and mark state of the rows.
+
+            The state going in to each row is checkpointed, so after an
+            edit only the rows from the one before the first edited row up
+            to where the state matches the previous pass again are visited.
+            Returns the number of rows visited.
+        """
+        dirty = self.rows.take_dirty()
+        start = 0
+        if dirty is not None and not full and len(self.rows) > 0:
+            start = max(self.rows.line_for(dirty[0]) - 1, 0)
+            if self.rows[start] not in self._checkpoints:
+                full = True
         else:
-            this_track = self.find_song_data(-1)
-        self.song_data[-1] = this_track
+            full = True
+        if full:
+            self._checkpoints = {}
+            self._tracks = []
+            tail = []
+            last_track = "unknown"
+            last_chord = "rest"
+            chord_idx = -1
+            last_mark = None
+            if str(0.0) in self.metadata:
+                self.song_data[-1] = self.find_song_data(0.0)
+            else:
+                self.song_data[-1] = self.find_song_data(-1)
+        else:
+            last_track, last_chord, chord_idx, last_mark, track_count, track_start = \
+                self._checkpoints[self.rows[start]]
+            tail = self._tracks[track_count:]
+            del self._tracks[track_count:]
+        if self._tracks:
+            this_track = self.song_data[self._tracks[-1]]
+        else:
+            this_track = self.song_data[-1]
         chord_values = this_track["pad_chord_seq"]
         chord_names = this_track.get("pad_sequence","").split("-")
         chord_selections = this_track.get("pad_selections","").split()
         chord_data = this_track.get("pad_chords_parsed",{})
-        last_mark = -1
-        idx = -1
-        for location in self.order:
-            idx += 1
-            datum = self.data.get(location)
+        visited = 0
+        for line in range(start, len(self.rows)):
+            datum = self.rows.row_at(line)
+            location = datum["location"]
+            # the track start too, so rows after a moved track start aren't skipped
+            state = (last_track, last_chord, chord_idx, last_mark, len(self._tracks),
+                     self._tracks[-1] if self._tracks else None)
+            if not full and location > dirty[1] and self._checkpoints.get(location) == state:
+                self._tracks.extend(t for t in tail if t >= location)
+                break
+            self._checkpoints[location] = state
+            visited += 1
             next_track = datum.get("track-change", "")
             next_chidx = None
             next_chord = None
@@ -361,8 +411,8 @@ class Importer:
             mark = datum.get("mark","")
             if mark != "":
                 if mark[0] not in ".-*@+=: ":
-                    last_mark = idx
-            datum["mark_idx"] = last_mark
+                    last_mark = location
+            datum["mark_loc"] = last_mark
             if next_track == "":
                 if last_track == "unknown":
                     datum["track_ui"] = "  ?"
@@ -472,9 +522,10 @@ class Importer:
             if str(t) not in self.metadata:
                 self.metadata.add_section(str(t))
                 self.set_defaults_for_song(t)
-            if self.data[t].get("mark","") == "":
-                self.data[t]["mark"] = "Track @{}".format(human_duration(t,0))
-            self.metadata[str(t)]["title"] = self.data[t]["mark"]
+            if self.rows.row(t).get("mark","") == "":
+                self.rows.row(t)["mark"] = "Track @{}".format(human_duration(t,0))
+                self.rows.touch(t)
+            self.metadata[str(t)]["title"] = self.rows.row(t)["mark"]
             selection = self.metadata[str(t)].get("pad_selections","")
             if selection != "":
                 c = len(selection.strip().split())
@@ -483,7 +534,8 @@ class Importer:
                     if c > self._chord_selections:
                         self._chord_selections = c
         if old_mode != self._chord_mode:
-            self._propagate()
+            return self._propagate(full=True)
+        return visited
 
     def parse_timecode(self, *, timecode, line):
         if timecode is None or timecode.strip() == "":
@@ -507,10 +559,10 @@ class Importer:
                 except ValueError:
                     return None
             next = line+1
-            if next == len(self.order):
+            if next == len(self.rows):
                 next -= 1
-            offset = self.order[next]  - self.order[line]
-            location = self.order[line] + offset * trial * negate
+            offset = self.rows[next]  - self.rows[line]
+            location = self.rows[line] + offset * trial * negate
 
         elif timecode.endswith("bpm") or timecode.endswith("b"):
             if timecode.endswith("b"):
@@ -534,14 +586,14 @@ class Importer:
 
             except ValueError:
                 return None
-            location = self.order[line] + offset
+            location = self.rows[line] + offset
 
         else:
             try:
                 offset = float(timecode)
             except ValueError:
                 return None
-            location = self.order[line] + offset
+            location = self.rows[line] + offset
         return location
 
     def _do_jump(self, timecode, *, line):
@@ -553,12 +605,8 @@ class Importer:
 
     def _perform_jump(self, location, callback=None, callback_args={}):
         newline = None
-        if location in self.data:
-            try:
-                newline = self.order.index(location)
-            except ValueError:
-                self.update_order()
-                newline = self.order.index(location)
+        if location in self.rows:
+            newline = self.rows.index(location)
         if newline is None:
             self.changed = True
             was_p_playing = self.player.playing
@@ -571,7 +619,7 @@ class Importer:
             if callback is not None:
                 callback(location, **callback_args)
             self._do_idle()
-            newline = self.order.index(location)
+            newline = self.rows.index(location)
             self.player.seek(location)
             self.csv_player.seek(newline)
             if was_p_playing:
@@ -582,29 +630,33 @@ class Importer:
 
     def _do_lyric(self, lyric, *, line):
         if line < 0 or lyric is None:
-            return self.data[self.order[-line]].get("lyric","")
-        self.data[self.order[line]]["lyric"] = lyric.strip()
+            return self.rows.row_at(-line).get("lyric","")
+        self.rows.row_at(line)["lyric"] = lyric.strip()
+        self.rows.touch(self.rows[line])
         self.changed = True
         return True
 
     def _do_line_mark(self, *, line):
         self.changed = True
-        lyric = self.data[self.order[line]].get("lyric", "")
+        lyric = self.rows.row_at(line).get("lyric", "")
         if lyric == "":
-            self.data[self.order[line]]["lyric"] = "/"
+            self.rows.row_at(line)["lyric"] = "/"
+            self.rows.touch(self.rows[line])
             return
         if lyric[0] == '/':
-            self.data[self.order[line]]["lyric"] = "\\" + self.data[self.order[line]]["lyric"][1:]
+            self.rows.row_at(line)["lyric"] = "\\" + self.rows.row_at(line)["lyric"][1:]
         elif lyric[0] == '\\':
-            self.data[self.order[line]]["lyric"] = self.data[self.order[line]]["lyric"][1:]
+            self.rows.row_at(line)["lyric"] = self.rows.row_at(line)["lyric"][1:]
         else:
-            self.data[self.order[line]]["lyric"] = "/" + self.data[self.order[line]]["lyric"]
+            self.rows.row_at(line)["lyric"] = "/" + self.rows.row_at(line)["lyric"]
+        self.rows.touch(self.rows[line])
         return True
 
     def _do_mark(self, mark, *, line):
         if line < 0 or mark is None:
-            return self.data[self.order[-line]].get("mark","")
-        self.data[self.order[line]]["mark"] = mark
+            return self.rows.row_at(-line).get("mark","")
+        self.rows.row_at(line)["mark"] = mark
+        self.rows.touch(self.rows[line])
         self.changed = True
         return True
 
@@ -615,10 +667,10 @@ class Importer:
         self._do_clone(line, +1)
 
     def _do_clone(self, line, dir = 1):
-        base = self.order[line]
-        if line + 1 == len(self.order):
+        base = self.rows[line]
+        if line + 1 == len(self.rows):
             return False
-        next = self.order[line+dir]
+        next = self.rows[line+dir]
         offset = (next - base) / 2
         if offset < 0.0005 and offset > -0.0005:
             return False
@@ -639,7 +691,7 @@ class Importer:
             return False
         if offset is None or line < 0:
             return self.last_nudge
-        if line <= 0 or line >= len(self.order) -1:
+        if line <= 0 or line >= len(self.rows) -1:
             self.spreader.show_status("Can't nudge top or bottom.")
             return False
         orig_offset = offset
@@ -648,16 +700,16 @@ class Importer:
         except ValueError:
             self.spreader.show_status("Invalid offset: {}".format(offset))
             return False
-        base = self.order[line]
+        base = self.rows[line]
         location = base + offset
-        if line > 0 and self.order[line-1] > location:
-            self.spreader.show_status("Invalid offset: {}; can't go over {}".format(offset, self.order[line - 1]))
+        if line > 0 and self.rows[line-1] > location:
+            self.spreader.show_status("Invalid offset: {}; can't go over {}".format(offset, self.rows[line - 1]))
             return False
-        if line < len(self.order) - 1 and self.order[line+1] < location:
-            self.spreader.show_status("Invalid offset: {}; can't go under {}".format(offset, self.order[line + 1]))
+        if line < len(self.rows) - 1 and self.rows[line+1] < location:
+            self.spreader.show_status("Invalid offset: {}; can't go under {}".format(offset, self.rows[line + 1]))
             return False
         self.last_nudge = orig_offset
-        self._perform_jump(location, callback=self.swap_goodies, callback_args={"from_loc": self.order[line]})
+        self._perform_jump(location, callback=self.swap_goodies, callback_args={"from_loc": self.rows[line]})
         line_now = line
         if offset < 0:
             line_now += 1
@@ -669,12 +721,13 @@ class Importer:
 
     def clone_goodies(self, to_loc, from_loc):
         self.changed = True
-        data_from = self.data[from_loc]
-        data_to = self.data[to_loc]
+        data_from = self.rows.row(from_loc)
+        data_to = self.rows.row(to_loc)
         for k in data_from.keys():
             if k == "location":
                 continue
             data_to[k] = data_from[k]
+        self.rows.touch(to_loc)
 
     def _do_shift_up(self, *, line):
         self._do_shift(line, -1)
@@ -683,10 +736,10 @@ class Importer:
         self._do_shift(line, +1)
 
     def _do_shift(self, line, dir = 1):
-        base = self.order[line]
-        if line + 1 == len(self.order):
+        base = self.rows[line]
+        if line + 1 == len(self.rows):
             return
-        next = self.order[line+dir]
+        next = self.rows[line+dir]
         offset = (next - base) / 2
         if offset < 0.0005 and offset > -0.0005:
             return
@@ -695,26 +748,28 @@ class Importer:
 
     def _do_swap_up(self, *, line):
         if line > 0:
-            self.swap_goodies(self.order[line], self.order[line - 1])
+            self.swap_goodies(self.rows[line], self.rows[line - 1])
             self.spreader.move_to(line - 1)
             self._do_idle()
             self.spreader.move_to(line)
 
     def _do_swap_down(self, *, line):
-        if line < len(self.order) - 1:
-            self.swap_goodies(self.order[line], self.order[line + 1])
+        if line < len(self.rows) - 1:
+            self.swap_goodies(self.rows[line], self.rows[line + 1])
             self.spreader.move_to(line + 1)
             self._do_idle()
             self.spreader.move_to(line)
 
     def swap_goodies(self, to_loc, from_loc):
         self.changed = True
-        data_from = self.data[from_loc]
-        data_to = self.data[to_loc]
+        data_from = self.rows.row(from_loc)
+        data_to = self.rows.row(to_loc)
         for k in data_from.keys():
             if k == "location":
                 continue
             data_to[k], data_from[k] = data_from[k], data_to.get(k,"")
+        self.rows.touch(to_loc)
+        self.rows.touch(from_loc)
 
     def _do_export_midi(self, filename, *, line):
         if filename is None or len(filename.strip()) == 0:
@@ -738,23 +793,21 @@ class Importer:
         return False
 
     def export_midi(self, output):
-        exporter = ExportMidi(self.config, output)
-        csvplayr = CsvPlayer(self.config)
-        csvplayr.wire(importer=self, push_player=exporter, realtime=False)
-        exporter.start()
-        csvplayr.export()
-        exporter.end()
+        self._export(ExportMidi(self.config, output))
 
     def export_txt(self, output):
-        exporter = ExportTxt(self.config, output)
-        csvplayr = CsvPlayer(self.config)
-        csvplayr.wire(importer=self, push_player=exporter, realtime=False)
-        exporter.start()
-        csvplayr.export()
-        exporter.end()
+        self._export(ExportTxt(self.config, output))
 
     def export_ly(self, output):
-        exporter = ExportLy(self.config, output)
+        self._export(ExportLy(self.config, output))
+
+    def export(self, outputs):
+        """ Export to each of {"midi"|"txt"|"ly": output} from one scan. """
+        exporters = {"midi": self.export_midi, "txt": self.export_txt, "ly": self.export_ly}
+        for fmt, output in outputs.items():
+            exporters[fmt](output)
+
+    def _export(self, exporter):
         csvplayr = CsvPlayer(self.config)
         csvplayr.wire(importer=self, push_player=exporter, realtime=False)
         exporter.start()
@@ -763,13 +816,14 @@ class Importer:
 
     def _do_lead_rest(self, *, line):
         self.changed = True
-        datum = self.data[self.order[line]]
+        datum = self.rows.row_at(line)
         datum["note"] = ""
         datum["note_ui"] = "-"
+        self.rows.touch(datum["location"])
         return True
 
     def _do_up_note(self, *, line):
-        datum = self.data[self.order[line]]
+        datum = self.rows.row_at(line)
         track_id = datum.get("track_id", -1)
         got = datum.get("note","")
         if got == "":
@@ -785,11 +839,12 @@ class Importer:
         self.last_note = got
         datum["note"] = got
         datum["note_ui"] = getLyForMidiNote(got)
+        self.rows.touch(datum["location"])
         self.changed = True
         return True
 
     def _do_down_note(self, *, line):
-        datum = self.data[self.order[line]]
+        datum = self.rows.row_at(line)
         track_id = datum.get("track_id", -1)
         got = datum.get("note","")
         if got == "":
@@ -805,11 +860,12 @@ class Importer:
         self.last_note = got
         datum["note"] = got
         datum["note_ui"] = getLyForMidiNote(got)
+        self.rows.touch(datum["location"])
         self.changed = True
         return True
 
     def _do_up_octave(self, *, line):
-        datum = self.data[self.order[line]]
+        datum = self.rows.row_at(line)
         track_id = datum.get("track_id", -1)
         got = datum.get("note","")
         if got == "":
@@ -825,11 +881,12 @@ class Importer:
         self.last_note = got
         datum["note"] = got
         datum["note_ui"] = getLyForMidiNote(got)
+        self.rows.touch(datum["location"])
         self.changed = True
         return True
 
     def _do_down_octave(self, *, line):
-        datum = self.data[self.order[line]]
+        datum = self.rows.row_at(line)
         track_id = datum.get("track_id", -1)
         got = datum.get("note","")
         if got == "":
@@ -847,11 +904,12 @@ class Importer:
         self.last_note = got
         datum["note"] = got
         datum["note_ui"] = getLyForMidiNote(got)
+        self.rows.touch(datum["location"])
         self.changed = True
         return True
 
     def _do_up_on_scale(self, *, line):
-        datum = self.data[self.order[line]]
+        datum = self.rows.row_at(line)
         track_id = datum.get("track_id", -1)
         song_stuff = self.song_data.get(track_id)
         if song_stuff is None:
@@ -884,11 +942,12 @@ class Importer:
         self.last_note = trial
         datum["note"] = trial
         datum["note_ui"] = getLyForMidiNote(trial)
+        self.rows.touch(datum["location"])
         self.changed = True
         return True
 
     def _do_down_on_scale(self, *, line):
-        datum = self.data[self.order[line]]
+        datum = self.rows.row_at(line)
         track_id = datum.get("track_id", -1)
         song_stuff = self.song_data.get(track_id)
         if song_stuff is None:
@@ -921,11 +980,12 @@ class Importer:
         self.last_note = trial
         datum["note"] = trial
         datum["note_ui"] = getLyForMidiNote(trial)
+        self.rows.touch(datum["location"])
         self.changed = True
         return True
 
     def _do_sample_note(self, *, line):
-        datum = self.data[self.order[line]]
+        datum = self.rows.row_at(line)
         self.csv_player.set_lead_note(datum["note"] )
         self.spreader.show_status("Sampling note...")
         self.ui.get_key(timeout=0.2)
@@ -934,9 +994,82 @@ class Importer:
         return False
 
     def _do_automate(self, *, line):
-        Automate().process(self)
+        options = self.config["automate"] if "automate" in self.config else {}
+        return self._automate_with(options.get("profile", "normal"))
+
+    def _do_automate_profile(self, name, *, line):
+        if name is None:
+            return False
+        options = self.config["automate"] if "automate" in self.config else {}
+        return self._automate_with(name.strip() or options.get("profile", "normal"))
+
+    def _automate_with(self, name):
+        if self._automate is not None:
+            self._automate.cancel()
+            self.spreader.show_status("Cancelling automate...")
+            return False
+        from .automate import AutomateJob, AnalysisProfile, SILENCE_DB
+        from .analysiscache import analysis_file_for
+        options = self.config["automate"] if "automate" in self.config else {}
+        try:
+            profile = AnalysisProfile.from_config(self.config, name)
+        except KeyError:
+            self.spreader.show_status("No analysis profile called {}".format(name))
+            return False
+        self._automate = AutomateJob(self.bits["media"], silence=float(options.get("silence", SILENCE_DB)),
+                                     cache_file=analysis_file_for(Path(self.bits["metadata"])),
+                                     profile=profile)
+        self._automate.start()
+        self.spreader.show_status("Automating ({})... (press 'a' again to cancel)".format(name))
         return False
 
+    def _do_snap_grid(self, subdivisions, *, line):
+        if subdivisions is None:
+            return False
+        from .beatgrid import BeatGrid
+        grid = BeatGrid.from_text(self.metadata["audio"].get("beat-grid", ""))
+        if grid is None:
+            self.spreader.show_status("No beat grid yet; automate ('a') finds one.")
+            return False
+        try:
+            subdivisions = int(subdivisions) if subdivisions.strip() else 2
+        except ValueError:
+            self.spreader.show_status("Not a number of subdivisions: {}".format(subdivisions))
+            return False
+        if subdivisions < 1:
+            self.spreader.show_status("Need at least one subdivision per beat.")
+            return False
+        moved = self.snap_rows(grid, subdivisions)
+        self.spreader.show_status("{} rows snapped to 1/{} of a beat".format(moved, subdivisions))
+        return True
+
+    def _profile_names(self):
+        # the `[analysis_<name>]` sections; see `automate.AnalysisProfile`
+        if not hasattr(self.config, "sections"):
+            return []
+        return [section[len("analysis_"):] for section in self.config.sections() if section.startswith("analysis_")]
+
+    def _collect_automate(self):
+        """ Merge in whatever the automate job has found since last time. """
+        from .automate import apply_summary
+        for message in self._automate.take():
+            kind = message[0]
+            if kind == "rows":
+                self.merge_rows(message[1])
+                self.spreader.show_status("Automating: {:.0%} (press 'a' again to cancel)".format(message[2]))
+            elif kind == "done":
+                apply_summary(self, message[1])
+                name = self._automate.profile.name
+                self.metadata["audio"]["analysis-realtime-" + name] = "{:.1f}".format(message[2])
+                self._automate = None
+                self.spreader.show_status("Automate complete: {} ran at {:.1f}x realtime.".format(name, message[2]))
+            elif kind == "cancelled":
+                self._automate = None
+                self.spreader.show_status("Automate cancelled.")
+            elif kind == "error":
+                self._automate = None
+                self.spreader.show_status("Automate failed: {}".format(message[1]))
+
     def _do_backup(self, *, line):
         self.backup()
         self.spreader.show_status("Backup complete.")
@@ -964,10 +1097,12 @@ class Importer:
             "/" : change the line separator indicator in the lyrics
             ";" - sample the lead note
             ":" : repeat the marked section
-            'a' / 'A' : automate
+            'a' : automate (again to cancel)
+            'A' : automate with another analysis profile
             'C' / 'c' : change the chord
             'D' / 'd' : delete row
             'E' / 'e' : export to MIDI
+            'G' / 'g' : snap the rows to the beat grid
             'H' / 'h' : play just the MIDI
             'j' : shift down by half
             'k' : shift up by half
@@ -1057,35 +1192,60 @@ class Importer:
                               description="Swap data with line above")
         spreader.register_key(self._do_swap_down, "w",
                               description="Swap data with line below")
-        spreader.register_key(self._do_automate, "a", "A",
-                              description="Automate finding the notes")
-
-    def scan(self):
+        spreader.register_key(self._do_automate, "a",
+                              description="Automate finding the notes in the background (again to cancel)")
+        spreader.register_key(self._do_automate_profile, "A", arg="?str",
+                              prompt="Analysis profile? ({}; ENTER for the usual one)".format(
+                                  ", ".join(self._profile_names())),
+                              description="Automate finding the notes with another analysis profile")
+        spreader.register_key(self._do_snap_grid, "g", "G", arg="?str",
+                              prompt="Snap rows to the beat grid; subdivisions per beat? (ENTER for 2)",
+                              description="Snap all rows to the beat grid found by automate")
+
+    def scan(self, bits=None):
+        """ Load the import's rows.
+
+            `bits` are the import's details from `ImportLister.get()`; they
+            are looked up if they aren't given.
+        """
         self.import_file = self.config["instance"]["import-file"]
-        self.bits = self.import_lister.get(self.import_file)
+        if bits is None:
+            bits = self.import_lister.get(self.import_file)
+        self.bits = bits
         self.data_file = Path(self.bits["metadata"]).with_suffix(".data")
         self.metadata = ConfigParser(inline_comment_prefixes=None)
         self.metadata.read(str(self.bits["metadata"]))
 
-        if self.data_file.exists():
+        cached = read_cache(self.data_file)
+        if cached is not None:
+            for row in cached:
+                self.rows.add(row)
+            self.rows.take_dirty()
+        elif self.data_file.exists():
             with self.data_file.open(newline="") as csvfile:
                 data_reader = csv.DictReader(csvfile, dialect=ImportCsvDialect)
                 for row in data_reader:
                     location = float(row["location"])
                     row["location"] = location
-                    self.data[location] = row
-        if len(self.data) == 0:
+                    self.rows.add(row)
+            write_cache(self.data_file, self.rows.rows())
+        if len(self.rows) == 0:
             self.add_row(0.0, mark="START")
             self.add_row(self.bits["length_secs"], mark="END")
+        self.journal = EditJournal(self.data_file)
+        if self.journal.replay(self.rows) > 0:
+            self.changed = True
+        if self.spreader is not None:
+            self.rows.journal = self.journal
         self.update_order()
-        self.clean()
+        self.clean(cached=cached is not None)
 
     def add_row(self, location, *, mark="", lyric="", note=""):
-        if location in self.data:
+        if location in self.rows:
             raise IndexError("location {} already present in data".format(location))
-        if self.order and location > self.order[-1]:
-            if int(location) != int(self.order[-1]):
-                raise IndexError("location {} can't be bigger than file: {}".format(location, self.order[-1]))
+        if len(self.rows) > 1 and location > self.rows[-1]:
+            if int(location) != int(self.rows[-1]):
+                raise IndexError("location {} can't be bigger than file: {}".format(location, self.rows[-1]))
         if location < 0:
             raise IndexError("location {} can't be less than zero".format(location))
         note_ui = "-"
@@ -1093,19 +1253,111 @@ class Importer:
             note_ui = getLyForMidiNote(note)
         row = {"location":location, "mark":mark, "lyric":lyric, "track_ui":"", "chord_ui":"",
                "chord-change":"", "chord-selection": 0, "track-change":"", "note":note, "note_ui":note_ui}
-        self.data[location]  = row
-        return row
+        return self.rows.add(row)
+
+    def merge_rows(self, rows):
+        """ Add `(location, mark, note)` rows found by analysis.
+
+            Where a row is already at the location, its empty mark and
+            note are filled in rather than it being added again. Rows
+            outside the import are left out. Returns how many rows were
+            added.
+        """
+        added = 0
+        for location, mark, note in rows:
+            existing = self.rows.get(location)
+            if existing is None:
+                try:
+                    self.add_row(location, mark=mark, note=note)
+                except IndexError:
+                    continue
+                added += 1
+                continue
+            touched = False
+            if mark and not existing.get("mark"):
+                existing["mark"] = mark
+                touched = True
+            if note != "" and existing.get("note", "") == "":
+                existing["note"] = note
+                existing["note_ui"] = getLyForMidiNote(note)
+                touched = True
+            if touched:
+                self.rows.touch(location)
+        if rows:
+            self.changed = True
+        return added
+
+    def snap_rows(self, grid, subdivisions=1):
+        """ Move the rows on to the nearest subdivision of `grid`.
+
+            The top and bottom rows stay put, as do rows that would land
+            on or past another row. A track's metadata, kept under the
+            location of its first row, moves with it. Returns how many
+            rows moved.
+        """
+        import numpy
+        if len(self.rows) < 3:
+            return 0
+        locations = numpy.asarray(self.rows[1:-1])
+        snapped = grid.snap(locations, subdivisions)
+        snapped = numpy.round(snapped, 6)
+        final = numpy.where((snapped > self.rows[0]) & (snapped < self.rows[-1]), snapped, locations)
+        # a row that would land on or past the one before, or on or past
+        # one after that isn't moving, stays where it is
+        while True:
+            bounds = numpy.concatenate(([self.rows[0]], final, [self.rows[-1]]))
+            fixed = numpy.concatenate(((final == locations)[1:], [True]))
+            clash = (final <= bounds[:-2]) | ((final >= bounds[2:]) & fixed)
+            clash &= final != locations
+            if not clash.any():
+                break
+            final[clash] = locations[clash]
+        moving = final != locations
+        moved = [self.rows.remove(float(old)) for old in locations[moving]]
+        for row, old, new in zip(moved, locations[moving], final[moving]):
+            self._move_metadata(float(old), float(new))
+            row["location"] = float(new)
+            self.rows.add(row)
+        if moved:
+            self.changed = True
+        return len(moved)
+
+    def _move_metadata(self, old, new):
+        """ Move the metadata section for the row at `old` to `new`, if there is one. """
+        metadata = getattr(self, "metadata", None)
+        if metadata is None or not metadata.has_section(str(old)):
+            return
+        values = {k: metadata.get(str(old), k, raw=True) for k in metadata.options(str(old))}
+        metadata.remove_section(str(old))
+        if metadata.has_section(str(new)):
+            metadata.remove_section(str(new))
+        metadata.add_section(str(new))
+        for k, v in values.items():
+            metadata.set(str(new), k, v)
+        self.song_data.pop(old, None)
 
     def update_order(self):
-        self.order = list(self.data.keys())
-        self.order.sort()
-        self.save()
+        self._seen_revision = self.rows.revision
 
     def return_value(self, line):
         return False
 
-    def clean(self):
-        for r in self.data.values():
+    def clean(self, cached=False):
+        """ Fill in the defaults for the rows.
+
+            Rows loaded from the data cache are already complete, so then
+            only the ones the journal touched need looking at.
+        """
+        dirty = self.rows.dirty
+        if not cached:
+            rows = self.rows.rows()
+        elif dirty is None:
+            rows = ()
+        else:
+            first = self.rows.line_for(dirty[0])
+            last = self.rows.line_for(dirty[1]) + 1
+            rows = (self.rows.row_at(line) for line in range(first, min(last, len(self.rows))))
+        for r in rows:
             r.setdefault("lyric", "")
             r.setdefault("chord-change", "")
             r.setdefault("chord-selection", 0)
@@ -1130,47 +1382,65 @@ class Importer:
             if song_meta[k].strip() != "":
                 ret[k] = song_meta[k]
         ret["key_note"] = int(ret.get("key","60"))
-        ret["scale_parsed"] = parse_scale(ret.get("scale", "1 2 3 4 5 6 7").strip())
         ret["lead_instrument"] = int(ret.get("lead_instrument","0"))
         ret["pad_instrument"] = int(ret.get("pad_instrument","0"))
         ret["pad_offset"] = int(ret.get("pad_offset","-12"))
-        ret["pad_chords_parsed"] = parse_chords(ret.get("pad_chords", "1"), ret["scale_parsed"], ret["key_note"] + ret["pad_offset"])
-        ret["pad_chord_seq"] = parse_sequence(ret.get("pad_sequence", "I"), ret["pad_chords_parsed"])
+        tables = preset_tables(ret["key_note"], ret.get("scale", "1 2 3 4 5 6 7").strip(),
+                               ret.get("pad_chords", "1"), ret.get("pad_sequence", "I"), ret["pad_offset"])
+        ret["scale_parsed"] = tables.scale
+        ret["pad_chords_parsed"] = tables.chords
+        ret["pad_chord_seq"] = tables.sequence
         ret["pad_velocity"] = int(ret.get("pad_velocity", 64))
         ret["lead_velocity"] = int(ret.get("lead_velocity", 64))
         return ret
 
     def save(self):
-        if not self.changed:
+        """ Compact the edit journal in to the `.data` and `.meta` files. """
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+        if not self.changed and self.journal.pending == 0:
             return
-        with self.data_file.open("w", newline='') as csvfile:
-            fieldnames = ['location', 'lyric', 'mark', 'track-change', "chord-change", "chord-selection", "note"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore', dialect=ImportCsvDialect)
-            writer.writeheader()
-            for location in self.order:
-                writer.writerow(self.data[location])
+        write_data(self.data_file, self.rows.rows())
         with open(str(self.bits["metadata"]), 'w') as meta:
             self.metadata.write(meta)
+        self.journal.truncate()
+        self.changed = False
+
+    def _compact_in_background(self):
+        if self._compactor is not None:
+            if self._compactor.is_alive():
+                return
+            self._compactor = None
+        if not self.journal.rotate():
+            return
+        rows = [dict(row) for row in self.rows.rows()]
+        meta = io.StringIO()
+        self.metadata.write(meta)
+        self._compactor = threading.Thread(target=self._compact, args=(rows, meta.getvalue()), daemon=True)
+        self._compactor.start()
+
+    def _compact(self, rows, meta):
+        write_data(self.data_file, rows)
+        with open(str(self.bits["metadata"]), 'w') as out:
+            out.write(meta)
+        self.journal.compacted()
 
     def backup(self):
-        dsecs = self.data_file.stat().st_mtime
         meta_file = Path(self.bits["metadata"])
-        msecs = meta_file.stat().st_mtime
-        secs = max(dsecs, msecs)
+        secs = 0
+        for f in (self.data_file, meta_file, self.journal.path):
+            if f.exists():
+                secs = max(secs, f.stat().st_mtime)
         suffix = filename_iso_time(secs)
         backup_data = self.data_file.with_name("{}-{}{}".format(self.data_file.stem, suffix, self.data_file.suffix))
         backup_meta = meta_file.with_name("{}-{}{}".format(meta_file.stem, suffix, meta_file.suffix))
-        with backup_data.open("w", newline='') as csvfile:
-            fieldnames = ['location', 'lyric', 'mark', 'track-change', "chord-change", "chord-selection", "note"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore', dialect=ImportCsvDialect)
-            writer.writeheader()
-            for location in self.order:
-                writer.writerow(self.data[location])
+        write_data(backup_data, self.rows.rows(), cache=False)
         with backup_meta.open('w') as meta:
             self.metadata.write(meta)
 
     def get_line(self, what, max_len):
-        datum = self.data[what]
+        datum = self.rows.row(what)
         padout=max_len - 25
         marklen = int(padout // 3)
         lyrlen = int(padout * 2 // 3)
@@ -1181,7 +1451,7 @@ class Importer:
             human_time=loc, **datum)
 
     def get_order(self):
-        return self.order
+        return self.rows
 
     def __call__(self, *args, **kwargs):
         pass
@@ -1208,6 +1478,24 @@ class Importer:
 
 
 
+def write_data(data_file, rows, cache=True):
+    """ Write rows out as a `.data` TSV file, replacing it atomically.
+
+        Unless `cache` is False, the binary data cache is rewritten to
+        match it.
+    """
+    rows = list(rows)
+    tmp_file = data_file.with_name(data_file.name + ".tmp")
+    with tmp_file.open("w", newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=DATA_FIELDNAMES, extrasaction='ignore', dialect=ImportCsvDialect)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+    os.replace(str(tmp_file), str(data_file))
+    if cache:
+        write_cache(data_file, rows)
+
+
 def break_on_lily_words(words):
     ret = []
     for w in words.split():
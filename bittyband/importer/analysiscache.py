@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+""" Binary sidecar holding the raw output of an Automate analysis.
+
+    The onsets are kept before any silence threshold is applied, as
+    columns: float64 locations, int16 pitches, float32 levels and a
+    byte flagging the beats; followed by the beats themselves and the
+    tempo confidence at each. The cache is keyed on a blake2b hash of
+    the media's contents and the analysis parameters, so it survives
+    the media being moved or touched, but not re-encoded.
+"""
+
+__all__ = ["analysis_key", "read_analysis", "write_analysis", "analysis_file_for"]
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+CACHE_MAGIC = b"BBAUBIO\n"
+CACHE_VERSION = 1
+_HEADER = struct.Struct("<8sHH32sII")
+_ROW_BYTES = 8 + 2 + 4 + 1
+_BEAT_BYTES = 8 + 4
+# stands in for an onset without a pitch
+_EMPTY = -1
+_BEAT_MARK = "- beat"
+_HASH_CHUNK = 1024 * 1024
+
+
+def analysis_file_for(metadata_file):
+    return metadata_file.with_suffix(".analysis")
+
+
+def _usable():
+    return array("h").itemsize == 2 and array("f").itemsize == 4 and array("B").itemsize == 1
+
+
+def analysis_key(media, params):
+    """ Return the cache key for analysing `media` with `params`. """
+    digest = hashlib.blake2b(digest_size=32)
+    digest.update(repr(sorted(params.items())).encode("utf-8"))
+    with open(str(media), "rb") as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.digest()
+
+
+def write_analysis(cache_file, key, rows, beats):
+    """ Write the `(location, mark, pitch, level)` rows and `(seconds, confidence)` beats. """
+    if not _usable():
+        return False
+    locations = array("d")
+    pitches = array("h")
+    levels = array("f")
+    marks = array("B")
+    for location, mark, pitch, level in rows:
+        locations.append(location)
+        pitches.append(_EMPTY if pitch == "" else pitch)
+        levels.append(level)
+        marks.append(mark == _BEAT_MARK)
+    beat_times = array("d", (beat for beat, confidence in beats))
+    confidences = array("f", (confidence for beat, confidence in beats))
+
+    header = _HEADER.pack(CACHE_MAGIC, CACHE_VERSION, sys.byteorder == "little", key,
+                          len(locations), len(beat_times))
+    tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+    with tmp_file.open("wb") as out:
+        out.write(header)
+        for column in (locations, pitches, levels, marks, beat_times, confidences):
+            out.write(column.tobytes())
+    os.replace(str(tmp_file), str(cache_file))
+    return True
+
+
+def read_analysis(cache_file, key):
+    """ Return the cached `(rows, beats)`, or None if there are none for `key`. """
+    if not _usable() or not cache_file.exists():
+        return None
+    with cache_file.open("rb") as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, version, little, cached_key, count, nbeats = _HEADER.unpack_from(mapped)
+            if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                return None
+            if bool(little) != (sys.byteorder == "little") or cached_key != key:
+                return None
+            if len(mapped) != _HEADER.size + count * _ROW_BYTES + nbeats * _BEAT_BYTES:
+                return None
+            return _load_columns(memoryview(mapped), count, nbeats)
+
+
+def _load_columns(view, count, nbeats):
+    pos = _HEADER.size
+    columns = []
+    try:
+        for code, size, length in (("d", 8, count), ("h", 2, count), ("f", 4, count), ("B", 1, count),
+                                   ("d", 8, nbeats), ("f", 4, nbeats)):
+            columns.append(view[pos:pos + size * length].cast(code).tolist())
+            pos += size * length
+    finally:
+        view.release()
+    locations, pitches, levels, marks, beat_times, confidences = columns
+    rows = [(location, _BEAT_MARK if mark else "", "" if pitch == _EMPTY else pitch, level)
+            for location, pitch, level, mark in zip(locations, pitches, levels, marks)]
+    return rows, list(zip(beat_times, confidences))
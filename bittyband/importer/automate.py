@@ -1,64 +1,391 @@
 #!/usr/bin/env python3
 
+__all__ = ["Automate", "AutomateJob", "AnalysisProfile", "analyze", "analyze_parallel", "run_analysis"]
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy
 import aubio
 
+from .beatgrid import fit_grid
+from .analysiscache import analysis_key, read_analysis, write_analysis
+
 HOP_SIZE = 1024
+# seconds of audio analysed between batches of rows
+BATCH_SECS = 30.0
+# ignore onsets under this level (dB)
+SILENCE_DB = -40
+# the detectors run this low, so that any threshold above can be applied afterwards
+RAW_SILENCE_DB = -90
+# seconds of audio each worker analyses in parallel mode
+WINDOW_SECS = 120.0
+# seconds before its window a worker starts, to let the detectors settle
+OVERLAP_SECS = 5.0
+# onsets or beats this many hops apart across a window boundary are the same one
+MERGE_HOPS = 2
 
+# config sections holding the analysis profiles
+PROFILE_PREFIX = "analysis_"
+DEFAULT_PROFILE = "normal"
 
-class Automate:
-    def __init__(self):
-        pass
+NOTE_NAMES = ["c", "cis", "d", 'dis', "e", "f", "fis", "g", "gis", "a", "ais", "b"]
 
-    def process(self, importer):
-        source = aubio.source(importer.bits["media"], 0, HOP_SIZE)
-
-        # Total number of frames read
-        total_frames = 0
-        samplerate = source.samplerate
-        tempoer = aubio.tempo("specdiff", HOP_SIZE * 2, HOP_SIZE, samplerate)
-        # List of beats, in samples
-        beats = []
-        notes_o = aubio.notes("default", HOP_SIZE * 2, HOP_SIZE, samplerate)
-        # ignore frames under this level (dB)
-        notes_o.set_silence(-40)
-        popularity = {}
-
-        while True:  # reading loop
-            samples, read = source()
-            mark = ""
-
-            is_beat = tempoer(samples)
-            if is_beat:
-                this_beat = tempoer.get_last_s()
-                mark = "- beat"
-                beats.append(this_beat)
-
-            new_note = notes_o(samples)
-
-            location = total_frames / float(samplerate)
+
+class AnalysisProfile:
+    """ The hop, window and methods the detectors run with.
+
+        Profiles are kept in the `[analysis_<name>]` sections of the
+        config: `hop_size`, `buf_size` (twice the hop if left out),
+        `tempo_method` (any of aubio's onset methods) and `notes_method`.
+    """
+
+    def __init__(self, name=DEFAULT_PROFILE, *, hop_size=HOP_SIZE, buf_size=None,
+                 tempo_method="specdiff", notes_method="default"):
+        self.name = name
+        self.hop_size = hop_size
+        self.buf_size = hop_size * 2 if buf_size is None else buf_size
+        self.tempo_method = tempo_method
+        self.notes_method = notes_method
+
+    @classmethod
+    def from_config(cls, config, name):
+        """ Return the profile `name`; KeyError if the config hasn't got one. """
+        section = config[PROFILE_PREFIX + name]
+        hop_size = int(section.get("hop_size", HOP_SIZE))
+        buf_size = section.get("buf_size")
+        return cls(name, hop_size=hop_size,
+                   buf_size=None if buf_size in (None, "") else int(buf_size),
+                   tempo_method=section.get("tempo_method", "specdiff"),
+                   notes_method=section.get("notes_method", "default"))
+
+    def params(self):
+        """ The parameters an analysis depends on, for its cache key. """
+        return {"hop_size": self.hop_size, "buf_size": self.buf_size, "tempo": self.tempo_method,
+                "notes": self.notes_method, "silence": RAW_SILENCE_DB, "merge_hops": MERGE_HOPS}
+
+    def detectors(self, samplerate):
+        tempoer = aubio.tempo(self.tempo_method, self.buf_size, self.hop_size, samplerate)
+        notes_o = aubio.notes(self.notes_method, self.buf_size, self.hop_size, samplerate)
+        notes_o.set_silence(RAW_SILENCE_DB)
+        return tempoer, notes_o
+
+
+def analyze(media, on_batch, *, cancelled=None, batch_secs=BATCH_SECS, profile=None):
+    """ Find the beats and note onsets of `media`.
+
+        The rows found are handed to `on_batch(rows, progress)` every
+        `batch_secs` of audio, as a list of `(location, mark, note,
+        level)`, along with the fraction of the file analysed so far.
+        No silence threshold is applied; see `apply_silence`. If
+        `cancelled()` turns true the analysis stops between hops and
+        None is returned; otherwise returns the `(seconds, confidence)`
+        of each beat.
+    """
+    if profile is None:
+        profile = AnalysisProfile()
+    hop_size = profile.hop_size
+    source = aubio.source(str(media), 0, hop_size)
+
+    # Total number of frames read
+    total_frames = 0
+    samplerate = source.samplerate
+    duration = getattr(source, "duration", 0)
+    batch_frames = int(batch_secs * samplerate)
+    tempoer, notes_o = profile.detectors(samplerate)
+    # List of beats, in seconds
+    beats = []
+    batch = []
+    next_batch = batch_frames
+
+    while True:  # reading loop
+        if cancelled is not None and cancelled():
+            return None
+        samples, read = source()
+        mark = ""
+
+        is_beat = tempoer(samples)
+        if is_beat:
+            this_beat = tempoer.get_last_s()
+            mark = "- beat"
+            beats.append((this_beat, tempoer.get_confidence()))
+
+        new_note = notes_o(samples)
+
+        location = total_frames / float(samplerate)
+        if (new_note[0] != 0):
+            batch.append((location, mark, int(new_note[0]), float(aubio.db_spl(samples))))
+        elif new_note[2] != 0:
+            batch.append((location, mark, "", float(aubio.db_spl(samples))))
+
+        total_frames += read
+        if read < hop_size: break
+        if total_frames >= next_batch:
+            progress = min(total_frames / duration, 1.0) if duration else 0.0
+            on_batch(batch, progress)
+            batch = []
+            next_batch += batch_frames
+
+    on_batch(batch, 1.0)
+    return beats
+
+
+def analyze_parallel(media, on_batch, *, cancelled=None, workers=None,
+                     window_secs=WINDOW_SECS, overlap_secs=OVERLAP_SECS, profile=None):
+    """ Like `analyze`, but split into windows analysed by a process pool.
+
+        Each worker seeks to `overlap_secs` before its window and runs
+        detectors of its own, keeping only what it finds inside the
+        window. Onsets and beats found by both neighbours at a window
+        boundary are merged. The batches are handed to `on_batch` in
+        order, one per window.
+    """
+    if profile is None:
+        profile = AnalysisProfile()
+    hop_size = profile.hop_size
+    source = aubio.source(str(media), 0, hop_size)
+    samplerate = source.samplerate
+    duration = source.duration
+    source.close()
+    # windows start on a hop, so locations land where `analyze` puts them
+    window = max(hop_size, int(window_secs * samplerate) // hop_size * hop_size)
+    lead = int(overlap_secs * samplerate) // hop_size * hop_size
+    bounds = [(start, min(start + window, duration)) for start in range(0, duration, window)]
+    if not bounds:
+        bounds = [(0, window)]
+    merge_secs = MERGE_HOPS * hop_size / float(samplerate)
+    beats = []
+    last_row = None
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_analyze_window, str(media), start, end, lead, profile) for start, end in bounds]
+        for done, future in enumerate(futures, start=1):
+            if cancelled is not None and cancelled():
+                for f in futures:
+                    f.cancel()
+                return None
+            rows, window_beats = future.result()
+            if rows and last_row is not None and rows[0][0] - last_row[0] < merge_secs \
+                    and rows[0][2] == last_row[2]:
+                rows = rows[1:]
+            if window_beats and beats and window_beats[0][0] - beats[-1][0] < merge_secs:
+                window_beats = window_beats[1:]
+            if rows:
+                last_row = rows[-1]
+            beats.extend(window_beats)
+            on_batch(rows, done / len(futures))
+    return beats
+
+
+def _analyze_window(media, start, end, lead, profile):
+    """ Return the rows and beats of frames `start` to `end` of `media`. """
+    source = aubio.source(media, 0, profile.hop_size)
+    samplerate = source.samplerate
+    origin = max(0, start - lead)
+    if origin:
+        source.seek(origin)
+    tempoer, notes_o = profile.detectors(samplerate)
+    rows = []
+    beats = []
+    frame = origin
+    while frame < end:
+        samples, read = source()
+        mark = ""
+
+        is_beat = tempoer(samples)
+        if is_beat and frame >= start:
+            mark = "- beat"
+            beats.append((origin / float(samplerate) + tempoer.get_last_s(), tempoer.get_confidence()))
+
+        new_note = notes_o(samples)
+        if frame >= start:
+            location = frame / float(samplerate)
             if (new_note[0] != 0):
-                midi_note = int(new_note[0])
-                popularity.setdefault(midi_note % 12, 0)
-                popularity[midi_note % 12] += 1
-                importer.add_row(location, mark=mark, note=midi_note)
+                rows.append((location, mark, int(new_note[0]), float(aubio.db_spl(samples))))
             elif new_note[2] != 0:
-                importer.add_row(location, mark=mark, note="")
-
-            total_frames += read
-            if read < HOP_SIZE: break
-
-        popnotes = []
-        noteNames = ["c", "cis", "d", 'dis', "e", "f", "fis", "g", "gis", "a", "ais", "b"]
-        for n in range(0,12):
-            popnotes.append((noteNames[n], popularity.get(n, 0)))
-        importer.metadata["audio"]["popular-notes"] = repr(popnotes)
-
-        # Convert to periods and to bpm
-        bpm = ""
-        if len(beats) > 1:
-            if len(beats) >= 4:
-                bpms = 60. / numpy.diff(beats)
-                bpm = numpy.median(bpms)
-        importer.metadata["audio"]["bpm"] = str(bpm)
-        importer.changed = True
+                rows.append((location, mark, "", float(aubio.db_spl(samples))))
+
+        frame += read
+        if read < profile.hop_size: break
+    return rows, beats
+
+
+def apply_silence(rows, silence=SILENCE_DB):
+    """ Return the `(location, mark, note)` of the rows at least `silence` dB loud. """
+    return [(location, mark, note) for location, mark, note, level in rows if level >= silence]
+
+
+def _summarize(notes, beats):
+    """ Return the popular notes, the bpm and the beat times of what was found. """
+    beats = [beat for beat, confidence in beats]
+    popularity = {}
+    for midi_note in notes:
+        popularity.setdefault(midi_note % 12, 0)
+        popularity[midi_note % 12] += 1
+    popnotes = []
+    for n in range(0,12):
+        popnotes.append((NOTE_NAMES[n], popularity.get(n, 0)))
+
+    # Convert to periods and to bpm
+    bpm = ""
+    if len(beats) > 1:
+        if len(beats) >= 4:
+            bpms = 60. / numpy.diff(beats)
+            bpm = numpy.median(bpms)
+    return popnotes, bpm, beats
+
+
+def apply_summary(importer, summary):
+    popnotes, bpm, beats = summary
+    importer.metadata["audio"]["popular-notes"] = repr(popnotes)
+    importer.metadata["audio"]["bpm"] = str(bpm)
+    grid = fit_grid(beats)
+    if grid is not None:
+        importer.metadata["audio"]["beat-grid"] = grid.to_text()
+    importer.changed = True
+
+
+def run_analysis(media, on_batch, *, cancelled=None, workers=None, silence=SILENCE_DB, cache_file=None,
+                 profile=None):
+    """ Analyse `media`, handing `(location, mark, note)` rows to `on_batch`.
+
+        If `cache_file` holds the analysis of this media, it is used
+        instead of decoding it again; otherwise it is written once the
+        analysis is done. Either way, `silence` is applied afterwards.
+        Returns the summary for `apply_summary`, or None if cancelled.
+    """
+    if profile is None:
+        profile = AnalysisProfile()
+    key = None
+    if cache_file is not None:
+        key = analysis_key(media, profile.params())
+        cached = read_analysis(cache_file, key)
+        if cached is not None:
+            rows, beats = cached
+            rows = apply_silence(rows, silence)
+            on_batch(rows, 1.0)
+            return _summarize([note for location, mark, note in rows if note != ""], beats)
+    raw = []
+    notes = []
+
+    def on_raw_batch(rows, progress):
+        raw.extend(rows)
+        rows = apply_silence(rows, silence)
+        notes.extend(note for location, mark, note in rows if note != "")
+        on_batch(rows, progress)
+
+    analysis = choose_analysis(media, workers)
+    beats = analysis(media, on_raw_batch, cancelled=cancelled, profile=profile)
+    if beats is None:
+        return None
+    if key is not None:
+        write_analysis(cache_file, key, raw, beats)
+    return _summarize(notes, beats)
+
+
+def media_seconds(media):
+    source = aubio.source(str(media), 0, HOP_SIZE)
+    secs = source.duration / float(source.samplerate)
+    source.close()
+    return secs
+
+
+def choose_analysis(media, workers=None):
+    """ Return `analyze`, or `analyze_parallel` if `media` is long enough to split. """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        return analyze
+    if media_seconds(media) < 2 * WINDOW_SECS:
+        return analyze
+    return lambda media, on_batch, **kwargs: analyze_parallel(media, on_batch, workers=workers, **kwargs)
+
+
+class Automate:
+    def __init__(self, workers=None, silence=SILENCE_DB, cache_file=None, profile=None):
+        self.workers = workers
+        self.silence = silence
+        self.cache_file = cache_file
+        self.profile = profile
+
+    def process(self, importer):
+        summary = run_analysis(importer.bits["media"], lambda rows, progress: importer.merge_rows(rows),
+                               workers=self.workers, silence=self.silence, cache_file=self.cache_file,
+                               profile=self.profile)
+        apply_summary(importer, summary)
+
+
+class AutomateJob:
+    """ Runs the analysis on a thread of its own.
+
+        Recordings long enough to split are analysed by `workers`
+        processes (all the CPUs, unless given). A `cache_file` is used
+        as in `run_analysis`.
+
+        Everything it finds is posted to `messages`, to be picked up by
+        the UI thread with `take()`:
+
+            ("rows", rows, progress) for each batch of rows
+            ("done", summary, realtime) at the end: the summary for
+                `apply_summary`, and how many times faster than
+                realtime the analysis went
+            ("cancelled", None) if `cancel()` stopped it
+            ("error", message) if the analysis failed
+    """
+
+    def __init__(self, media, workers=None, silence=SILENCE_DB, cache_file=None, profile=None):
+        self.media = media
+        self.workers = workers
+        self.silence = silence
+        self.cache_file = cache_file
+        self.profile = AnalysisProfile() if profile is None else profile
+        self.messages = queue.Queue()
+        self.cancelled = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._runner, daemon=True)
+            self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def end(self):
+        self.cancel()
+        if self.thread is not None:
+            self.thread.join()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def take(self):
+        """ Return the messages posted so far, without waiting. """
+        taken = []
+        while True:
+            try:
+                taken.append(self.messages.get_nowait())
+            except queue.Empty:
+                return taken
+
+    def _runner(self):
+        try:
+            started = time.perf_counter()
+            summary = run_analysis(self.media, self._post_rows, cancelled=self.cancelled.is_set,
+                                   workers=self.workers, silence=self.silence, cache_file=self.cache_file,
+                                   profile=self.profile)
+            elapsed = time.perf_counter() - started
+            realtime = media_seconds(self.media) / elapsed if elapsed > 0 else float("inf")
+        except Exception as e:
+            self.messages.put(("error", str(e)))
+            return
+        if summary is None:
+            self.messages.put(("cancelled", None))
+        else:
+            self.messages.put(("done", summary, realtime))
+
+    def _post_rows(self, rows, progress):
+        self.messages.put(("rows", rows, progress))
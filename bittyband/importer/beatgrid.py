@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+__all__ = ["BeatGrid", "fit_grid"]
+
+import numpy
+
+# a change of tempo smaller than this fraction is taken as noise
+TEMPO_TOLERANCE = 0.05
+# beats the local tempo is worked out over
+SMOOTH_BEATS = 16
+# a tempo has to hold for this many beats to get a segment of its own
+MIN_SEGMENT_BEATS = 16
+
+
+class BeatGrid:
+    """ A piecewise regular grid of beats.
+
+        Segment `i` starts at `starts[i]` and has a beat at
+        `origins[i] + k * periods[i]` for every whole `k`. The first
+        segment also covers everything before it starts.
+    """
+
+    def __init__(self, starts, origins, periods):
+        self.starts = numpy.asarray(starts, dtype=float)
+        self.origins = numpy.asarray(origins, dtype=float)
+        self.periods = numpy.asarray(periods, dtype=float)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def segment_for(self, locations):
+        segments = numpy.searchsorted(self.starts, locations, side="right") - 1
+        return numpy.clip(segments, 0, len(self.starts) - 1)
+
+    def snap(self, locations, subdivisions=1, max_shift=None):
+        """ Return `locations` moved to the nearest `1/subdivisions` of a beat.
+
+            Locations further than `max_shift` of a subdivision from the
+            grid are left where they are.
+        """
+        locations = numpy.asarray(locations, dtype=float)
+        segments = self.segment_for(locations)
+        origins = self.origins[segments]
+        steps = self.periods[segments] / subdivisions
+        snapped = origins + numpy.round((locations - origins) / steps) * steps
+        if max_shift is not None:
+            snapped = numpy.where(numpy.abs(snapped - locations) <= max_shift * steps, snapped, locations)
+        return snapped
+
+    def to_text(self):
+        return " ".join("{!r},{!r},{!r}".format(float(s), float(o), float(p))
+                        for s, o, p in zip(self.starts, self.origins, self.periods))
+
+    @classmethod
+    def from_text(cls, text):
+        """ Return the grid `to_text` made, or None if there isn't one. """
+        parts = [triple.split(",") for triple in text.split()]
+        if not parts:
+            return None
+        starts, origins, periods = zip(*((float(s), float(o), float(p)) for s, o, p in parts))
+        return cls(starts, origins, periods)
+
+
+def fit_grid(beats, *, tolerance=TEMPO_TOLERANCE, smooth=SMOOTH_BEATS, min_beats=MIN_SEGMENT_BEATS):
+    """ Fit a `BeatGrid` to the detected `beats`, in seconds.
+
+        The tempo either side of each beat is the median of the `smooth`
+        beat intervals before and after it, so missed or doubled beats
+        don't move it. Where the two differ by more than `tolerance` a
+        new segment starts, as long as both sides last `min_beats`. The
+        origin and period of each segment are a least squares fit to
+        its beats, numbered against the median period. Returns None if
+        there are too few beats to fit.
+    """
+    beats = numpy.sort(numpy.asarray(beats, dtype=float))
+    if len(beats) < 4:
+        return None
+    intervals = numpy.diff(beats)
+    bounds = numpy.concatenate(([0], _tempo_changes(intervals, tolerance, smooth), [len(intervals)]))
+    bounds = _merge_short(bounds, min_beats)
+
+    starts, origins, periods = [], [], []
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        segment = beats[first:last + 1]
+        period = numpy.median(intervals[first:last])
+        numbers = numpy.round((segment - segment[0]) / period)
+        if numbers[-1] > 0:
+            period, origin = numpy.polyfit(numbers, segment, 1)
+        else:
+            origin = segment[0]
+        starts.append(segment[0])
+        origins.append(origin)
+        periods.append(period)
+    return BeatGrid(starts, origins, periods)
+
+
+def _tempo_changes(intervals, tolerance, smooth):
+    """ Return the beats the tempo changes at, as indexes in to `intervals`. """
+    if len(intervals) < 2 * smooth:
+        return numpy.zeros(0, dtype=int)
+    windows = numpy.lib.stride_tricks.sliding_window_view(intervals, smooth)
+    medians = numpy.median(windows, axis=1)
+    # change[j] compares the intervals either side of beat j + smooth
+    change = numpy.abs(numpy.log(medians[smooth:] / medians[:-smooth]))
+    over = numpy.concatenate(([0], (change > numpy.log1p(tolerance)).astype(int), [0]))
+    steps = numpy.diff(over)
+    runs = zip(numpy.flatnonzero(steps == 1), numpy.flatnonzero(steps == -1))
+    # a change shows over a run of beats; it happened where it shows most
+    return numpy.asarray([first + numpy.argmax(change[first:last]) + smooth for first, last in runs],
+                         dtype=int)
+
+
+def _merge_short(bounds, min_beats):
+    """ Drop the changes that would leave a segment shorter than `min_beats`. """
+    keep = [bounds[0]]
+    for edge in bounds[1:-1]:
+        if edge - keep[-1] >= min_beats and bounds[-1] - edge >= min_beats:
+            keep.append(edge)
+    keep.append(bounds[-1])
+    return numpy.asarray(keep)
@@ -2,15 +2,30 @@
 
 import threading
 import time
-import queue
 
 from mido import Message
 from ..commands import LEAD_CHANNEL, PAD_CHANNEL
+from ..player import LOOKAHEAD_SECS
 
 
 class CsvPlayer:
+    """ Plays the rows of an import through the push player.
+
+        The runner thread sleeps on a condition while paused. While
+        playing, each row is due at an absolute position on a clock: the
+        audio player's time when the audio is playing, otherwise the
+        monotonic clock anchored at the first row played. The wait is
+        worked out again for every row, so the MIDI doesn't drift away
+        from the audio over a long playback. Rows are fed to the push
+        player a little ahead of time, with the `perf_counter` time they
+        are due at.
+    """
+
     def __init__(self, config):
-        self.queue = queue.Queue()
+        self.cond = threading.Condition()
+        self.stopping = False
+        self.anchor = None
+        self.due = None
         self.thread = None
         self.__line = 0
         self.last_track = None
@@ -34,58 +49,66 @@ class CsvPlayer:
 
     def start(self):
         if self.thread is None:
+            self.stopping = False
             self.thread = threading.Thread(target=self._runner, daemon=True)
             self.thread.start()
 
     def end(self):
-        if self.queue is not None and self.thread is not None:
-            self.queue.join()
-            self.queue.put(None)
-        pass
+        if self.thread is not None:
+            with self.cond:
+                self.stopping = True
+                self.cond.notify_all()
+
+    def _cancel_fed(self):
+        """ Drop what has been fed ahead of time; call with `cond` held. """
+        if hasattr(self.player, "cancel"):
+            self.player.cancel(channels=(LEAD_CHANNEL, PAD_CHANNEL))
 
     def seek(self, line):
-        self.__line = line
-        self.last_location = 0
-        self.playing = False
+        with self.cond:
+            self._cancel_fed()
+            self.__line = line
+            self.last_location = 0
+            self.anchor = None
+            self.playing = False
+            self.cond.notify_all()
 
     line = property(lambda self: self.__line)
 
     def play(self):
-        if self.__line >= len(self.importer.order):
-            self.__line = 0
-        self.playing = True
+        with self.cond:
+            if self.__line >= len(self.importer.rows):
+                self.__line = 0
+            self.anchor = None
+            self.playing = True
+            self.cond.notify_all()
+
     def pause(self):
-        self.playing = False
+        with self.cond:
+            self._cancel_fed()
+            self.playing = False
+            self.cond.notify_all()
 
     def export(self):
         self.__line = 0
         self.exporting = True
-        while self.__line < len(self.importer.order):
+        while self.__line < len(self.importer.rows):
             self._play_line()
 
     def _play_line(self):
         global LEAD_CHANNEL
         global PAD_CHANNEL
         if not self.playing and not self.exporting:
-            time.sleep(0.00001)
             return
-        try:
-            datum = self.importer.data[self.importer.order[self.__line]]
-        except IndexError:
-            if self.playing:
-                self.__line = 0
-            if len(self.importer.data) == 0:
-                self.playing = False
-                return
-            datum = self.importer.data[self.importer.order[self.__line]]
+        datum = self._current()
+        if datum is None:
+            return
         new_track = datum.get("track_id",-1)
         if self.last_location != 0:
             message_time = datum["location"] - self.last_location
         else:
             message_time = 0
-        if not self.exporting and self.realtime and message_time > 0:
-            time.sleep(message_time)
-        else:
+        if self.exporting or not self.realtime:
             self.message_time += int(message_time * 1000)
         if new_track != self.last_track:
             self.last_track = new_track
@@ -101,9 +124,9 @@ class CsvPlayer:
             else:
                 self.player.unknown_track()
             self.player.feed_midi(Message('program_change', channel=LEAD_CHANNEL,
-                                          program=self.track_info["lead_instrument"], time=0))
+                                          program=self.track_info["lead_instrument"], time=0), at=self.due)
             self.player.feed_midi(Message('program_change', channel=PAD_CHANNEL,
-                                          program=self.track_info["pad_instrument"], time=0))
+                                          program=self.track_info["pad_instrument"], time=0), at=self.due)
             if old_pad_note is not None:
                 self.set_pad_note(old_pad_note)
             if old_lead_note is not None:
@@ -113,8 +136,9 @@ class CsvPlayer:
         if not self.playing and not self.exporting:
             return
         self.__line += 1
-        if self.__line >= len(self.importer.order) and not self.exporting:
+        if self.__line >= len(self.importer.rows) and not self.exporting:
             self.__line = 0
+            self.anchor = None
         new_pad = datum.get("chord_value")
         if new_pad is not None:
             self.set_pad_note(new_pad)
@@ -123,46 +147,82 @@ class CsvPlayer:
             self.set_lead_note(new_lead)
         self.send_lyric(datum["lyric"], self.lead_note is not None)
 
+    def _current(self):
+        try:
+            return self.importer.rows.row_at(self.__line)
+        except IndexError:
+            if self.playing:
+                self.__line = 0
+                self.anchor = None
+            if len(self.importer.rows) == 0:
+                self.playing = False
+                return None
+            return self.importer.rows.row_at(self.__line)
+
+    def _until(self, location):
+        """ Return the seconds until the row at `location` is due. """
+        audio = self.importer.player
+        if audio is not None and audio.playing:
+            self.anchor = None
+            return location - audio.time
+        now = time.perf_counter()
+        if self.anchor is None:
+            self.anchor = (now, location)
+        return self.anchor[0] + (location - self.anchor[1]) - now
+
     def silence(self):
-        self.playing = False
+        self.pause()
         self.set_lead_note()
         self.set_pad_note()
 
     def _runner(self):
         while True:
-            if not self.queue.empty():
-                message = self.queue.get()
-                if message is None:
+            with self.cond:
+                while not self.playing and not self.stopping:
+                    self.cond.wait()
+                if self.stopping:
                     break
-                self.queue.task_done()
-            self._play_line()
+                if self.realtime:
+                    datum = self._current()
+                    if datum is None:
+                        continue
+                    wait = self._until(datum["location"])
+                    if wait > LOOKAHEAD_SECS:
+                        # a seek or pause wakes us early; either way, look again
+                        self.cond.wait(wait - LOOKAHEAD_SECS)
+                        continue
+                    self.due = time.perf_counter() + max(wait, 0)
+                # under the lock, so a pause or seek can't miss what this feeds
+                try:
+                    self._play_line()
+                finally:
+                    self.due = None
         self.thread = None
-        self.queue = None
 
 
     def set_lead_note(self, note=None):
         if isinstance(note, float):
             note = int(note)
         if isinstance(self.lead_note, int):
-            self.player.feed_midi(Message('note_off', note=self.lead_note, channel=LEAD_CHANNEL, time=self.message_time))
+            self.player.feed_midi(Message('note_off', note=self.lead_note, channel=LEAD_CHANNEL, time=self.message_time), at=self.due)
             self.message_time = 0
         elif hasattr(self.lead_note, "__iter__"):
             note_set = []
             for pn in self.lead_note:
                 note_set.append(Message('note_off', note=pn, channel=LEAD_CHANNEL))
-            self.player.feed_midi(*note_set, time=self.message_time, abbr="chord_off")
+            self.player.feed_midi(*note_set, time=self.message_time, abbr="chord_off", at=self.due)
             self.message_time = 0
 
         if isinstance(note, int):
             self.player.feed_midi(
-                Message('note_on', note=note, channel=LEAD_CHANNEL, time=self.message_time, velocity=self.track_info.get("lead_velocity",64)))
+                Message('note_on', note=note, channel=LEAD_CHANNEL, time=self.message_time, velocity=self.track_info.get("lead_velocity",64)), at=self.due)
             self.message_time = 0
         elif hasattr(note, "__iter__"):
             note_set = []
             for pn in note:
                 note_set.append(Message('note_on', note=pn, channel=LEAD_CHANNEL, velocity=self.track_info["lead_velocity"]))
             if len(note) > 0:
-                self.player.feed_midi(*note_set, time=self.message_time, abbr="chord_on")
+                self.player.feed_midi(*note_set, time=self.message_time, abbr="chord_on", at=self.due)
             else:
                 note = None
             self.message_time = 0
@@ -172,25 +232,25 @@ class CsvPlayer:
         if isinstance(note, float):
             note = int(note)
         if isinstance(self.pad_note, int):
-            self.player.feed_midi(Message('note_off', note=self.pad_note, channel=PAD_CHANNEL, time=self.message_time))
+            self.player.feed_midi(Message('note_off', note=self.pad_note, channel=PAD_CHANNEL, time=self.message_time), at=self.due)
             self.message_time = 0
         elif hasattr(self.pad_note, "__iter__"):
             note_set = []
             for pn in self.pad_note:
                 note_set.append(Message('note_off', note=pn, channel=PAD_CHANNEL))
-            self.player.feed_midi(*note_set, time=self.message_time, abbr="chord_off")
+            self.player.feed_midi(*note_set, time=self.message_time, abbr="chord_off", at=self.due)
             self.message_time = 0
 
         if isinstance(note, int):
             self.player.feed_midi(
-                Message('note_on', note=note, channel=PAD_CHANNEL, time=self.message_time, velocity=self.track_info.get("pad_velocity",64)))
+                Message('note_on', note=note, channel=PAD_CHANNEL, time=self.message_time, velocity=self.track_info.get("pad_velocity",64)), at=self.due)
             self.message_time = 0
         elif hasattr(note, "__iter__"):
             note_set = []
             for pn in note:
                 note_set.append(Message('note_on', note=pn, channel=PAD_CHANNEL, velocity=self.track_info["pad_velocity"]))
             if len(note) > 0:
-                self.player.feed_midi(*note_set, time=self.message_time, abbr="chord_on")
+                self.player.feed_midi(*note_set, time=self.message_time, abbr="chord_on", at=self.due)
             else:
                 note = None
             self.message_time = 0
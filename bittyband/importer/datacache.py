@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+""" Columnar binary sidecar for an import's `.data` file.
+
+    The TSV stays the file of record. The cache holds the same rows as
+    columns: float64 locations, int16 notes and chord selections, and
+    indexes in to a table of interned strings for the text fields. It is
+    only used while the TSV's mtime and size match the ones recorded in
+    the header.
+"""
+
+__all__ = ["read_cache", "write_cache"]
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from ..midinames import getLyForMidiNote
+
+CACHE_MAGIC = b"BBROWS\r\n"
+CACHE_VERSION = 1
+_HEADER = struct.Struct("<8sHHqqIII4x")
+_TEXT_FIELDS = ("lyric", "mark", "track-change", "chord-change")
+_NUMBER_FIELDS = ("note", "chord-selection")
+# stands in for an empty note or chord selection
+_EMPTY = -1
+
+
+def cache_file_for(data_file):
+    return data_file.with_suffix(".datacache")
+
+
+def _usable():
+    return array("I").itemsize == 4 and array("h").itemsize == 2
+
+
+def write_cache(data_file, rows):
+    """ Write the cache for `data_file` from rows matching its contents.
+
+        Returns False (and removes any old cache) if the rows hold values
+        that the columns can't represent.
+    """
+    cache_file = cache_file_for(data_file)
+    if not _usable():
+        return False
+    locations = array("d")
+    texts = {"": 0}
+    text_columns = [array("I") for f in _TEXT_FIELDS]
+    number_columns = [array("h") for f in _NUMBER_FIELDS]
+    for row in rows:
+        locations.append(row["location"])
+        for column, field in zip(text_columns, _TEXT_FIELDS):
+            value = row.get(field, "")
+            if not isinstance(value, str):
+                break
+            column.append(texts.setdefault(value, len(texts)))
+        else:
+            for column, field in zip(number_columns, _NUMBER_FIELDS):
+                value = row.get(field, "")
+                if value == "":
+                    value = _EMPTY
+                elif not isinstance(value, (int, float)) or value != int(value) or not 0 <= value < 0x8000:
+                    break
+                column.append(int(value))
+            else:
+                continue
+        if cache_file.exists():
+            cache_file.unlink()
+        return False
+
+    offsets = array("I", [0])
+    blob = bytearray()
+    for text in texts:
+        blob += text.encode("utf-8")
+        offsets.append(len(blob))
+
+    stat = data_file.stat()
+    header = _HEADER.pack(CACHE_MAGIC, CACHE_VERSION, sys.byteorder == "little",
+                          stat.st_mtime_ns, stat.st_size, len(locations), len(texts), len(blob))
+    tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+    with tmp_file.open("wb") as out:
+        out.write(header)
+        out.write(locations.tobytes())
+        for column in text_columns:
+            out.write(column.tobytes())
+        out.write(offsets.tobytes())
+        for column in number_columns:
+            out.write(column.tobytes())
+        out.write(blob)
+    os.replace(str(tmp_file), str(cache_file))
+    return True
+
+
+def read_cache(data_file):
+    """ Return the cached rows for `data_file`, or None if it is stale. """
+    cache_file = cache_file_for(data_file)
+    if not _usable() or not cache_file.exists() or not data_file.exists():
+        return None
+    stat = data_file.stat()
+    with cache_file.open("rb") as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, version, little, mtime_ns, size, count, nstrings, blob_len = _HEADER.unpack_from(mapped)
+            if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                return None
+            if bool(little) != (sys.byteorder == "little"):
+                return None
+            if mtime_ns != stat.st_mtime_ns or size != stat.st_size:
+                return None
+            expected = _HEADER.size + count * (8 + 4 * len(_TEXT_FIELDS) + 2 * len(_NUMBER_FIELDS)) \
+                       + (nstrings + 1) * 4 + blob_len
+            if len(mapped) != expected:
+                return None
+            return _load_columns(memoryview(mapped), count, nstrings, blob_len)
+
+
+def _load_columns(view, count, nstrings, blob_len):
+    pos = _HEADER.size
+    try:
+        locations = view[pos:pos + count * 8].cast("d").tolist()
+        pos += count * 8
+        text_columns = []
+        for field in _TEXT_FIELDS:
+            text_columns.append(view[pos:pos + count * 4].cast("I").tolist())
+            pos += count * 4
+        offsets = view[pos:pos + (nstrings + 1) * 4].cast("I").tolist()
+        pos += (nstrings + 1) * 4
+        number_columns = []
+        for field in _NUMBER_FIELDS:
+            number_columns.append(view[pos:pos + count * 2].cast("h").tolist())
+            pos += count * 2
+        blob = bytes(view[pos:pos + blob_len])
+    finally:
+        view.release()
+
+    texts = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(nstrings)]
+    note_uis = {_EMPTY: "-"}
+    rows = []
+    lyrics, marks, track_changes, chord_changes = text_columns
+    notes, chord_selections = number_columns
+    for i in range(count):
+        note = notes[i]
+        note_ui = note_uis.get(note)
+        if note_ui is None:
+            note_ui = note_uis[note] = getLyForMidiNote(note)
+        selection = chord_selections[i]
+        rows.append({
+            "location": locations[i],
+            "lyric": texts[lyrics[i]],
+            "mark": texts[marks[i]],
+            "track-change": texts[track_changes[i]],
+            "chord-change": texts[chord_changes[i]],
+            "chord-selection": "" if selection == _EMPTY else selection,
+            "note": "" if note == _EMPTY else note,
+            "note_ui": note_ui,
+        })
+    return rows
@@ -2,6 +2,8 @@
 import csv
 import curses.ascii
 
+DATA_FIELDNAMES = ['location', 'lyric', 'mark', 'track-change', "chord-change", "chord-selection", "note"]
+
 class ImportCsvDialect(csv.Dialect):
     lineterminator = "\n"
     quoting = csv.QUOTE_NONNUMERIC
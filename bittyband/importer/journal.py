@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+__all__ = ["EditJournal"]
+
+import csv
+import os
+
+from .importcsvdialect import ImportCsvDialect, DATA_FIELDNAMES
+
+
+class EditJournal:
+    """ Append-only log of the edits made to an import's rows.
+
+        Each add, update or delete is written as a single TSV record next
+        to the `.data` file as it happens. The journal is folded back in
+        to the `.data` file by compaction. It is replayed on top of the
+        `.data` file when the import is next opened.
+    """
+
+    def __init__(self, data_file):
+        self.path = data_file.with_suffix(".journal")
+        self.compacting = data_file.with_suffix(".journal-compacting")
+        self.out = None
+        self.writer = None
+        self.pending = 0
+
+    def _open(self):
+        self.out = self.path.open("a", newline="")
+        self.writer = csv.writer(self.out, dialect=ImportCsvDialect)
+
+    def _record(self, op, row):
+        if self.out is None:
+            self._open()
+        record = [op]
+        for k in DATA_FIELDNAMES:
+            record.append(row.get(k, ""))
+        self.writer.writerow(record)
+        self.out.flush()
+        self.pending += 1
+
+    def add(self, row):
+        self._record("add", row)
+
+    def update(self, row):
+        self._record("update", row)
+
+    def delete(self, location):
+        self._record("delete", {"location": location})
+
+    def close(self):
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+            self.writer = None
+
+    def rotate(self):
+        """ Set the current records aside for compaction.
+
+            Returns False if an earlier compaction is still outstanding.
+        """
+        if self.compacting.exists():
+            return False
+        self.close()
+        if self.path.exists():
+            os.replace(str(self.path), str(self.compacting))
+        self.pending = 0
+        return True
+
+    def compacted(self):
+        """ Drop records that have been folded in to the `.data` file. """
+        if self.compacting.exists():
+            self.compacting.unlink()
+
+    def truncate(self):
+        self.close()
+        self.compacted()
+        if self.path.exists():
+            self.path.unlink()
+        self.pending = 0
+
+    def replay(self, rows):
+        """ Apply the outstanding records to a RowStore.
+
+            Returns how many records were applied. A torn final record
+            (from a crash mid-write) is ignored.
+        """
+        applied = 0
+        for path in (self.compacting, self.path):
+            if not path.exists():
+                continue
+            with path.open(newline="") as journal:
+                try:
+                    for record in csv.reader(journal, dialect=ImportCsvDialect):
+                        if len(record) != len(DATA_FIELDNAMES) + 1:
+                            continue
+                        op = record[0]
+                        row = dict(zip(DATA_FIELDNAMES, record[1:]))
+                        location = row["location"]
+                        if not isinstance(location, float):
+                            continue
+                        if op == "delete":
+                            if location in rows:
+                                rows.remove(location)
+                        elif location in rows:
+                            rows.row(location).update(row)
+                            rows.touch(location)
+                        else:
+                            rows.add(row)
+                        applied += 1
+                except csv.Error:
+                    pass
+        self.pending = applied
+        return applied
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+__all__ = ["RowStore"]
+
+from bisect import bisect_left, insort
+
+
+class RowStore:
+    """ The rows of an import, kept sorted by location.
+
+        It behaves like a read-only sequence of locations (so it can be
+        handed straight to a lister as its `order`) while also mapping each
+        location to its row. Insertion, deletion and location to line
+        lookups are all done with a bisect on the sorted index.
+
+        If a `journal` is attached, every add, delete and touch is also
+        recorded to it.
+    """
+
+    def __init__(self):
+        self._rows = {}
+        self._order = []
+        self.revision = 0
+        self.dirty = None
+        self.journal = None
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def __getitem__(self, line):
+        return self._order[line]
+
+    def __contains__(self, location):
+        return location in self._rows
+
+    def index(self, location):
+        """ Return the line a location is on. """
+        line = bisect_left(self._order, location)
+        if line < len(self._order) and self._order[line] == location:
+            return line
+        raise ValueError("location {} not present in data".format(location))
+
+    def line_for(self, location):
+        """ Return the line a location is (or would be) on. """
+        return bisect_left(self._order, location)
+
+    def get(self, location, default=None):
+        return self._rows.get(location, default)
+
+    def row(self, location):
+        return self._rows[location]
+
+    def row_at(self, line):
+        return self._rows[self._order[line]]
+
+    def rows(self):
+        """ Iterate over the rows in order. """
+        for location in self._order:
+            yield self._rows[location]
+
+    def add(self, row):
+        location = row["location"]
+        if location in self._rows:
+            raise IndexError("location {} already present in data".format(location))
+        self._rows[location] = row
+        if not self._order or location > self._order[-1]:
+            self._order.append(location)
+        else:
+            insort(self._order, location)
+        self.revision += 1
+        self._widen(location)
+        if self.journal is not None:
+            self.journal.add(row)
+        return row
+
+    def remove(self, location):
+        line = self.index(location)
+        del self._order[line]
+        return self._removed(location)
+
+    def remove_at(self, line):
+        location = self._order.pop(line)
+        return self._removed(location)
+
+    def _removed(self, location):
+        self.revision += 1
+        self._widen(location)
+        if self.journal is not None:
+            self.journal.delete(location)
+        return self._rows.pop(location)
+
+    def clear(self):
+        self._rows.clear()
+        self._order.clear()
+        self.revision += 1
+        self.dirty = None
+
+    def touch(self, location):
+        """ Note that the row at a location was edited in place. """
+        self._widen(location)
+        if self.journal is not None:
+            self.journal.update(self._rows[location])
+
+    def _widen(self, location):
+        if self.dirty is None:
+            self.dirty = (location, location)
+        else:
+            self.dirty = (min(self.dirty[0], location), max(self.dirty[1], location))
+
+    def take_dirty(self):
+        """ Return the (first, last) dirty locations and reset them. """
+        dirty = self.dirty
+        self.dirty = None
+        return dirty
@@ -0,0 +1,55 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from . import automate
+from .analysiscache import analysis_key, read_analysis, write_analysis
+from .test_automate import write_tones
+
+
+class TestAnalysisCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.media = Path(self.tmp.name) / "tones.wav"
+        write_tones(self.media, [60, 64, 67, 72] * 2)
+        self.cache_file = Path(self.tmp.name) / "tones.analysis"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        key = analysis_key(self.media, {"hop_size": 1024})
+        rows = [(0.5, "- beat", 60, -12.5), (1.0, "", "", -50.0)]
+        beats = [(0.5, 0.25), (1.0, 0.5)]
+        self.assertTrue(write_analysis(self.cache_file, key, rows, beats))
+        self.assertEqual((rows, beats), read_analysis(self.cache_file, key))
+
+    def test_key_follows_content_and_params(self):
+        key = analysis_key(self.media, {"hop_size": 1024})
+        self.assertNotEqual(key, analysis_key(self.media, {"hop_size": 512}))
+        write_analysis(self.cache_file, key, [], [])
+        with self.media.open("ab") as f:
+            f.write(b"\0\0")
+        self.assertIsNone(read_analysis(self.cache_file, analysis_key(self.media, {"hop_size": 1024})))
+
+    def test_run_analysis_reuses_cache(self):
+        first = []
+        summary = automate.run_analysis(self.media, lambda rows, progress: first.extend(rows),
+                                        workers=1, cache_file=self.cache_file)
+        self.assertTrue(self.cache_file.exists())
+        again = []
+        with mock.patch.object(automate, "choose_analysis", side_effect=AssertionError("decoded again")):
+            cached = automate.run_analysis(self.media, lambda rows, progress: again.extend(rows),
+                                           workers=1, cache_file=self.cache_file)
+            quieter = []
+            automate.run_analysis(self.media, lambda rows, progress: quieter.extend(rows),
+                                  workers=1, silence=0, cache_file=self.cache_file)
+        self.assertEqual(first, again)
+        self.assertEqual(summary[0], cached[0])
+        self.assertEqual(summary[2], cached[2])
+        self.assertLess(len(quieter), len(first))
+
+
+if __name__ == '__main__':
+    unittest.main()
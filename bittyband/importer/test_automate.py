@@ -0,0 +1,181 @@
+import math
+import os
+import struct
+import tempfile
+import time
+import unittest
+from configparser import ConfigParser
+import wave
+from pathlib import Path
+
+import numpy
+
+from ..config import default_config
+from .automate import AutomateJob, AnalysisProfile, analyze, analyze_parallel, HOP_SIZE
+
+
+def write_tones(path, notes, secs_each=0.5, rate=22050):
+    """ Write a mono WAV of the midi `notes`, one after the other. """
+    frames = bytearray()
+    for note in notes:
+        freq = 440.0 * 2 ** ((note - 69) / 12)
+        count = int(secs_each * rate)
+        for i in range(count):
+            # a short fade in and out gives a clean onset for each tone
+            envelope = min(1.0, i / 200, (count - i) / 200)
+            frames += struct.pack("<h", int(12000 * envelope * math.sin(2 * math.pi * freq * i / rate)))
+    with wave.open(str(path), "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(bytes(frames))
+
+
+class TestAutomate(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.media = Path(self.tmp.name) / "tones.wav"
+        write_tones(self.media, [60, 64, 67, 72] * 4)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_rows_come_in_batches(self):
+        batches = []
+        beats = analyze(self.media, lambda rows, progress: batches.append((rows, progress)),
+                          batch_secs=2.0)
+        self.assertIsNotNone(beats)
+        self.assertGreater(len(batches), 2)
+        self.assertEqual(1.0, batches[-1][1])
+        progress = [p for rows, p in batches]
+        self.assertEqual(sorted(progress), progress)
+        locations = [row[0] for rows, p in batches for row in rows]
+        self.assertEqual(sorted(set(locations)), locations)
+        notes = {row[2] for rows, p in batches for row in rows if row[2] != ""}
+        self.assertTrue(notes & {60, 64, 67, 72})
+
+    def test_cancel(self):
+        job = AutomateJob(self.media)
+        job.cancel()
+        job.start()
+        job.thread.join(5)
+        self.assertEqual([("cancelled", None)], job.take())
+
+    def test_job_posts_rows_then_done(self):
+        job = AutomateJob(self.media)
+        job.start()
+        job.thread.join(30)
+        messages = job.take()
+        self.assertEqual("done", messages[-1][0])
+        self.assertTrue(all(m[0] == "rows" for m in messages[:-1]))
+        popular = dict(messages[-1][1][0])
+        self.assertEqual(12, len(popular))
+
+
+class TestParallelAutomate(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.media = Path(self.tmp.name) / "tones.wav"
+        self.rate = 22050
+        write_tones(self.media, [60, 64, 67, 72, 65, 62] * 6, secs_each=0.4, rate=self.rate)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_matches_serial(self):
+        serial = []
+        serial_beats = analyze(self.media, lambda rows, progress: serial.extend(rows))
+        parallel = []
+        progress = []
+
+        def on_batch(rows, done):
+            parallel.extend(rows)
+            progress.append(done)
+
+        parallel_beats = analyze_parallel(self.media, on_batch, workers=2,
+                                          window_secs=3.0, overlap_secs=3.0)
+        self.assertEqual(1.0, progress[-1])
+        self.assertGreater(len(progress), 3)
+        locations = [row[0] for row in parallel]
+        self.assertEqual(sorted(set(locations)), locations)
+        # every serial onset is found within two hops, with the same note
+        tolerance = 2 * HOP_SIZE / self.rate
+        for location, mark, note, level in serial:
+            close = [row for row in parallel if abs(row[0] - location) <= tolerance and row[2] == note]
+            self.assertEqual(1, len(close), "onset at {}".format(location))
+        self.assertLessEqual(abs(len(parallel) - len(serial)), len(serial) // 20)
+        serial_bpm = numpy.median(60. / numpy.diff([beat for beat, confidence in serial_beats]))
+        parallel_bpm = numpy.median(60. / numpy.diff([beat for beat, confidence in parallel_beats]))
+        self.assertAlmostEqual(serial_bpm, parallel_bpm, delta=serial_bpm * 0.1)
+
+    def test_cancel(self):
+        self.assertIsNone(analyze_parallel(self.media, lambda rows, done: None, workers=2,
+                                           window_secs=3.0, cancelled=lambda: True))
+
+
+class RecordingProfile(AnalysisProfile):
+    """ Keeps the detectors it builds. """
+
+    def detectors(self, samplerate):
+        if not hasattr(self, "built"):
+            self.built = []
+        self.built.append(super().detectors(samplerate))
+        return self.built[-1]
+
+
+class TestProfiles(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.media = Path(self.tmp.name) / "tones.wav"
+        write_tones(self.media, [60, 64, 67, 72] * 4)
+        self.config = ConfigParser()
+        self.config.read_string(default_config)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_from_config(self):
+        precise = AnalysisProfile.from_config(self.config, "precise")
+        self.assertEqual((256, 2048, "complex"), (precise.hop_size, precise.buf_size, precise.tempo_method))
+        draft = AnalysisProfile.from_config(self.config, "draft")
+        self.assertEqual((2048, 4096), (draft.hop_size, draft.buf_size))
+        normal = AnalysisProfile.from_config(self.config, "normal")
+        self.assertEqual(AnalysisProfile().params(), normal.params())
+        with self.assertRaises(KeyError):
+            AnalysisProfile.from_config(self.config, "nonesuch")
+
+    def test_profiles_reach_the_analysis(self):
+        for name in ("draft", "normal", "precise"):
+            profile = RecordingProfile.from_config(self.config, name)
+            rows = []
+            analyze(self.media, lambda batch, progress: rows.extend(batch), profile=profile)
+            tempoer, notes_o = profile.built[0]
+            for detector in (tempoer, notes_o):
+                self.assertEqual((profile.buf_size, profile.hop_size), (detector.buf_size, detector.hop_size))
+            # onsets land on the profile's hops
+            self.assertTrue(rows)
+            for location, mark, note, level in rows:
+                self.assertEqual(0, round(location * 22050) % profile.hop_size)
+
+    @unittest.skipUnless(os.environ.get("BITTYBAND_BENCHMARK"), "set BITTYBAND_BENCHMARK to time analyses")
+    def test_realtime_multiples(self):
+        realtime = {}
+        for name in ("draft", "normal", "precise"):
+            profile = AnalysisProfile.from_config(self.config, name)
+            started = time.perf_counter()
+            analyze(self.media, lambda batch, progress: None, profile=profile)
+            realtime[name] = 8.0 / (time.perf_counter() - started)
+            self.assertGreater(realtime[name], 1.0)
+        self.assertGreater(realtime["draft"], realtime["precise"])
+
+    @unittest.skipUnless(os.environ.get("BITTYBAND_BENCHMARK"), "set BITTYBAND_BENCHMARK to time analyses")
+    def test_job_reports_realtime(self):
+        job = AutomateJob(self.media, workers=1, profile=AnalysisProfile.from_config(self.config, "draft"))
+        job.start()
+        job.thread.join(30)
+        kind, summary, realtime = job.take()[-1]
+        self.assertEqual("done", kind)
+        self.assertGreater(realtime, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
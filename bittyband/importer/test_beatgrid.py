@@ -0,0 +1,90 @@
+import unittest
+
+import numpy
+from configparser import ConfigParser
+
+from ..config import default_config
+from . import Importer
+from .beatgrid import BeatGrid, fit_grid
+
+
+def beats_with_tempo_change(seed=1):
+    rng = numpy.random.default_rng(seed)
+    slow = 0.3 + numpy.arange(64) * 0.5
+    fast = slow[-1] + numpy.arange(1, 65) * 0.4
+    beats = numpy.concatenate([slow, fast]) + rng.normal(0, 0.008, 128)
+    # the detector misses the odd beat
+    return numpy.delete(beats, [10, 70])
+
+
+class TestFitGrid(unittest.TestCase):
+    def test_tempo_change(self):
+        grid = fit_grid(beats_with_tempo_change())
+        self.assertEqual(2, len(grid))
+        self.assertAlmostEqual(0.5, grid.periods[0], delta=0.002)
+        self.assertAlmostEqual(0.4, grid.periods[1], delta=0.002)
+        # within a beat of where the tempo changed
+        self.assertAlmostEqual(31.8, grid.starts[1], delta=0.5)
+
+    def test_steady_tempo_stays_one_segment(self):
+        rng = numpy.random.default_rng(2)
+        beats = numpy.arange(20000) * 0.5 + rng.normal(0, 0.01, 20000)
+        grid = fit_grid(beats)
+        self.assertEqual(1, len(grid))
+        self.assertAlmostEqual(0.5, grid.periods[0], delta=0.0001)
+
+    def test_too_few_beats(self):
+        self.assertIsNone(fit_grid([1.0, 1.5, 2.0]))
+
+    def test_snap(self):
+        grid = BeatGrid([0.0, 10.0], [0.0, 10.0], [0.5, 0.4])
+        numpy.testing.assert_allclose([0.5, 0.75, 10.4, 10.2],
+                                      grid.snap([0.49, 0.76, 10.41, 10.19], 2))
+        numpy.testing.assert_allclose([0.5, 0.6], grid.snap([0.49, 0.6], 2, max_shift=0.25))
+
+    def test_text_round_trip(self):
+        grid = fit_grid(beats_with_tempo_change())
+        again = BeatGrid.from_text(grid.to_text())
+        numpy.testing.assert_array_equal(grid.starts, again.starts)
+        numpy.testing.assert_array_equal(grid.origins, again.origins)
+        numpy.testing.assert_array_equal(grid.periods, again.periods)
+        self.assertIsNone(BeatGrid.from_text(""))
+
+
+class TestSnapRows(unittest.TestCase):
+    def test_snap_rows(self):
+        importer = Importer({"instance": {"project_dir": "."}})
+        for location in [0.0, 10.0, 0.26, 0.27, 0.49, 0.74, 1.02, 1.5]:
+            importer.add_row(location, note=60 if location == 0.49 else "")
+        grid = BeatGrid([0.0], [0.0], [0.5])
+        self.assertEqual(4, importer.snap_rows(grid, 2))
+        # 0.27 would land on the row snapped from 0.26
+        self.assertEqual([0.0, 0.25, 0.27, 0.5, 0.75, 1.0, 1.5, 10.0], list(importer.rows))
+        self.assertEqual(60, importer.rows.row(0.5)["note"])
+
+    def test_snapped_track_keeps_its_metadata(self):
+        config = ConfigParser(inline_comment_prefixes=None)
+        config.read_string(default_config)
+        config.add_section("instance")
+        config["instance"]["project_dir"] = "."
+        importer = Importer(config)
+        importer.metadata = ConfigParser(inline_comment_prefixes=None)
+        importer.metadata.add_section("audio")
+        for location in [0.0, 10.0, 0.26, 0.74]:
+            importer.add_row(location, note=60)
+        importer.rows.row(0.26)["track-change"] = "track"
+        importer.clean()
+        importer.metadata["0.26"]["key"] = "65"
+        importer.metadata["0.26"]["pad_selections"] = "1 4 5"
+        importer._propagate(full=True)
+        self.assertEqual(2, importer.snap_rows(BeatGrid([0.0], [0.0], [0.5]), 2))
+        importer._propagate(full=True)
+        self.assertFalse(importer.metadata.has_section("0.26"))
+        self.assertEqual("65", importer.metadata["0.25"]["key"])
+        self.assertEqual("1 4 5", importer.metadata["0.25"]["pad_selections"])
+        self.assertEqual(65, importer.song_data[0.25]["key_note"])
+        self.assertEqual(0.25, importer.rows.row(0.75)["track_id"])
+
+
+if __name__ == '__main__':
+    unittest.main()
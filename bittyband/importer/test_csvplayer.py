@@ -0,0 +1,94 @@
+import threading
+import time
+import unittest
+
+from ..player import PushButtonPlayer
+from .csvplayer import CsvPlayer
+from .rowstore import RowStore
+
+
+class FakeImporter:
+    def __init__(self, locations):
+        self.player = None
+        self.song_data = {-1: {"lead_instrument": 0, "pad_instrument": 0}}
+        self.rows = RowStore()
+        for location in locations:
+            self.rows.add({"location": location, "lyric": "la", "note": 60})
+
+
+class FakePushPlayer:
+    def __init__(self, expected):
+        self.times = []
+        self.due = []
+        self.expected = expected
+        self.done = threading.Event()
+
+    def feed_midi(self, *what, at=None, **kwargs):
+        if what[0].type == "note_on":
+            self.due.append((time.perf_counter(), at))
+
+    def new_track(self, **kwargs):
+        pass
+
+    def unknown_track(self):
+        pass
+
+    def feed_lyric(self, lyric):
+        self.times.append(time.perf_counter())
+        if len(self.times) == self.expected:
+            self.done.set()
+
+
+class TestCsvPlayer(unittest.TestCase):
+    def make_player(self, locations, expected):
+        importer = FakeImporter(locations)
+        push_player = FakePushPlayer(expected)
+        player = CsvPlayer(None)
+        player.wire(importer=importer, push_player=push_player)
+        player.start()
+        self.addCleanup(player.end)
+        return player, push_player
+
+    def test_rows_keep_to_absolute_time(self):
+        locations = [1.0 + i * 0.01 for i in range(30)]
+        player, push_player = self.make_player(locations, len(locations))
+        player.seek(0)
+        player.play()
+        self.assertTrue(push_player.done.wait(5))
+        player.pause()
+        start = push_player.due[0][1]
+        for (fed, at), location in zip(push_player.due, locations):
+            # each row is due against the anchor, so errors don't add up
+            self.assertAlmostEqual(start + location - locations[0], at, delta=0.001)
+            self.assertLess(fed, at + 0.005)
+
+    def test_paused_runner_blocks(self):
+        player, push_player = self.make_player([0.0, 0.5], 1)
+        time.sleep(0.05)
+        self.assertEqual([], push_player.times)
+        player.seek(1)
+        player.play()
+        self.assertTrue(push_player.done.wait(5))
+        player.pause()
+
+    def test_silence_cancels_what_was_fed_ahead(self):
+        push_player = PushButtonPlayer({})
+        player = CsvPlayer(None)
+        player.wire(importer=FakeImporter([0.0]), push_player=push_player)
+        player.set_lead_note(60)
+        player.due = time.perf_counter() + 0.05
+        player.set_lead_note(62)
+        player.due = None
+        player.silence()
+        push_player.stopping = True
+        sent = []
+        while True:
+            entry = push_player._next_due()
+            if entry is None:
+                break
+            sent.append((entry[2].type, entry[2].note))
+        self.assertEqual([("note_on", 60), ("note_off", 60), ("note_off", 62)], sent)
+
+
+if __name__ == '__main__':
+    unittest.main()
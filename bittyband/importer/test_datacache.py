@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from .datacache import read_cache, write_cache, cache_file_for
+
+
+def make_rows():
+    return [
+        {"location": 0.0, "lyric": "", "mark": "START", "track-change": "", "chord-change": "",
+         "chord-selection": 0.0, "note": ""},
+        {"location": 1.5, "lyric": "la", "mark": "", "track-change": "1", "chord-change": "",
+         "chord-selection": "", "note": 60.0},
+        {"location": 2.25, "lyric": "dé", "mark": "", "track-change": "", "chord-change": "2",
+         "chord-selection": 3, "note": 62},
+        {"location": 9.0, "lyric": "la", "mark": "END", "track-change": "", "chord-change": "",
+         "chord-selection": 0.0, "note": ""},
+    ]
+
+
+class TestDataCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_file = Path(self.tmp.name) / "song.data"
+        self.data_file.write_text("pretend TSV\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        self.assertTrue(write_cache(self.data_file, make_rows()))
+        rows = read_cache(self.data_file)
+        self.assertEqual([0.0, 1.5, 2.25, 9.0], [r["location"] for r in rows])
+        self.assertEqual(["", "la", "dé", "la"], [r["lyric"] for r in rows])
+        self.assertEqual(["START", "", "", "END"], [r["mark"] for r in rows])
+        self.assertEqual(["", 60, 62, ""], [r["note"] for r in rows])
+        self.assertEqual([0, "", 3, 0], [r["chord-selection"] for r in rows])
+        self.assertEqual("-", rows[0]["note_ui"])
+        self.assertNotEqual("-", rows[1]["note_ui"])
+
+    def test_stale(self):
+        write_cache(self.data_file, make_rows())
+        self.data_file.write_text("pretend TSV, edited\n")
+        self.assertIsNone(read_cache(self.data_file))
+
+    def test_missing(self):
+        self.assertIsNone(read_cache(self.data_file))
+
+    def test_unrepresentable(self):
+        write_cache(self.data_file, make_rows())
+        rows = make_rows()
+        rows[1]["note"] = 60.5
+        self.assertFalse(write_cache(self.data_file, rows))
+        self.assertFalse(cache_file_for(self.data_file).exists())
+
+    def test_truncated(self):
+        write_cache(self.data_file, make_rows())
+        cache_file = cache_file_for(self.data_file)
+        with cache_file.open("r+b") as f:
+            f.truncate(os.path.getsize(str(cache_file)) - 3)
+        self.assertIsNone(read_cache(self.data_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from .journal import EditJournal
+from .rowstore import RowStore
+
+
+class TestEditJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_file = Path(self.tmp.name) / "song.data"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_replay(self):
+        journal = EditJournal(self.data_file)
+        journal.add({"location": 1.0, "lyric": "la", "note": 60})
+        journal.add({"location": 2.0, "lyric": "di"})
+        journal.update({"location": 1.0, "lyric": "da", "note": 62})
+        journal.delete(2.0)
+        journal.close()
+
+        rows = RowStore()
+        applied = EditJournal(self.data_file).replay(rows)
+        self.assertEqual(4, applied)
+        self.assertEqual([1.0], list(rows))
+        self.assertEqual("da", rows.row(1.0)["lyric"])
+        self.assertEqual(62, rows.row(1.0)["note"])
+
+    def test_torn_record_is_ignored(self):
+        journal = EditJournal(self.data_file)
+        journal.add({"location": 1.0, "lyric": "la"})
+        journal.close()
+        with journal.path.open("a") as out:
+            out.write('"add"\t2.0\t"unfinis')
+
+        rows = RowStore()
+        EditJournal(self.data_file).replay(rows)
+        self.assertEqual([1.0], list(rows))
+
+    def test_rotated_records_replay_first(self):
+        journal = EditJournal(self.data_file)
+        journal.add({"location": 1.0, "lyric": "old"})
+        self.assertTrue(journal.rotate())
+        self.assertFalse(journal.rotate())
+        journal.update({"location": 1.0, "lyric": "new"})
+        journal.close()
+
+        rows = RowStore()
+        EditJournal(self.data_file).replay(rows)
+        self.assertEqual("new", rows.row(1.0)["lyric"])
+
+        journal.compacted()
+        journal.truncate()
+        self.assertEqual(0, EditJournal(self.data_file).replay(RowStore()))
+
+
+if __name__ == '__main__':
+    unittest.main()
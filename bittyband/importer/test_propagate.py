@@ -0,0 +1,100 @@
+import unittest
+from configparser import ConfigParser
+
+from ..config import default_config
+from . import Importer
+
+ROWS = 50000
+
+
+def make_importer(rows=ROWS):
+    config = ConfigParser(inline_comment_prefixes=None)
+    config.read_string(default_config)
+    config.add_section("instance")
+    config["instance"]["project_dir"] = "."
+    importer = Importer(config)
+    importer.metadata = ConfigParser(inline_comment_prefixes=None)
+    importer.metadata.add_section("audio")
+    importer.add_row(0.0, mark="START")
+    importer.add_row(rows * 0.25, mark="END")
+    for n in range(1, rows):
+        importer.add_row(n * 0.25, note=60 + n % 12)
+    for n in range(0, rows, 5000):
+        importer.rows.row_at(n)["track-change"] = "track"
+    for n in range(0, rows, 16):
+        importer.rows.row_at(n)["chord-change"] = "chord"
+    for n in range(100, rows, 500):
+        importer.rows.row_at(n)["mark"] = "Verse"
+    importer.clean()
+    return importer
+
+
+def snapshot(importer):
+    keys = ("mark_loc", "track_id", "track_ui", "chord_value", "chord_ui")
+    return [tuple(row.get(k) for k in keys) for row in importer.rows.rows()]
+
+
+class TestPropagate(unittest.TestCase):
+    def setUp(self):
+        self.importer = make_importer()
+        # settled, as after loading
+        self.importer._propagate(full=True)
+
+    def test_untouched_rows_are_skipped(self):
+        importer = self.importer
+        datum = importer.rows.row_at(ROWS // 2)
+        datum["lyric"] = "la"
+        importer.rows.touch(datum["location"])
+        visited = importer._propagate()
+        self.assertLessEqual(visited, 3)
+
+    def test_mark_edit_stops_at_next_mark(self):
+        importer = self.importer
+        line = ROWS // 2 + 7
+        importer.rows.row_at(line)["mark"] = "Bridge"
+        importer.rows.touch(importer.rows[line])
+        visited = importer._propagate()
+        self.assertLessEqual(visited, 501)
+        self.assertEqual(importer.rows[line], importer.rows.row_at(line + 1)["mark_loc"])
+
+    def test_matches_full_pass(self):
+        importer = make_importer(rows=4000)
+        importer.rows.row_at(1234)["chord-change"] = "rest"
+        importer.rows.touch(importer.rows[1234])
+        importer.add_row(525.125, note=61)
+        importer.rows.row_at(2500)["track-change"] = "track"
+        importer.rows.touch(importer.rows[2500])
+        importer.rows.remove_at(3000)
+        while importer.rows.dirty is not None:
+            importer._propagate()
+        incremental = snapshot(importer)
+        importer._propagate(full=True)
+        self.assertEqual(snapshot(importer), incremental)
+
+    def test_moved_track_start_matches_full_pass(self):
+        importer = make_importer(rows=2000)
+        importer.rows.row_at(1000)["track-change"] = "track"
+        importer.rows.touch(importer.rows[1000])
+        importer._propagate(full=True)
+        importer.swap_goodies(importer.rows[1010], importer.rows[1000])
+        while importer.rows.dirty is not None:
+            importer._propagate()
+        incremental = snapshot(importer)
+        importer._propagate(full=True)
+        self.assertEqual(snapshot(importer), incremental)
+
+    def test_edit_cost_is_bounded(self):
+        importer = self.importer
+        self.assertEqual(ROWS + 1, importer._propagate(full=True))
+        visited = 0
+        for line in range(1000, ROWS, ROWS // 100):
+            datum = importer.rows.row_at(line)
+            datum["lyric"] = "di"
+            importer.rows.touch(datum["location"])
+            visited += importer._propagate()
+        # each edit visits the row before it, itself and the row after
+        self.assertLessEqual(visited, 3 * 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
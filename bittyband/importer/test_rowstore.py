@@ -0,0 +1,63 @@
+import unittest
+
+from .rowstore import RowStore
+
+
+def make_row(location, **kwargs):
+    row = {"location": location}
+    row.update(kwargs)
+    return row
+
+
+class TestRowStore(unittest.TestCase):
+    def test_add_keeps_order(self):
+        rows = RowStore()
+        for location in (5.0, 0.0, 2.5, 10.0, 1.25):
+            rows.add(make_row(location))
+        self.assertEqual([0.0, 1.25, 2.5, 5.0, 10.0], list(rows))
+        self.assertEqual(5, len(rows))
+        self.assertEqual(10.0, rows[-1])
+
+    def test_add_duplicate(self):
+        rows = RowStore()
+        rows.add(make_row(1.0))
+        with self.assertRaises(IndexError):
+            rows.add(make_row(1.0))
+
+    def test_index(self):
+        rows = RowStore()
+        for location in (0.0, 1.0, 2.0, 3.0):
+            rows.add(make_row(location))
+        self.assertEqual(2, rows.index(2.0))
+        with self.assertRaises(ValueError):
+            rows.index(2.5)
+        self.assertEqual(3, rows.line_for(2.5))
+        self.assertEqual(4, rows.line_for(99.0))
+
+    def test_row_lookup(self):
+        rows = RowStore()
+        rows.add(make_row(0.0, lyric="la"))
+        rows.add(make_row(1.0, lyric="di"))
+        self.assertEqual("di", rows.row_at(1)["lyric"])
+        self.assertEqual("la", rows.row(0.0)["lyric"])
+        self.assertIsNone(rows.get(0.5))
+        self.assertIn(1.0, rows)
+        self.assertNotIn(0.5, rows)
+        self.assertEqual(["la", "di"], [r["lyric"] for r in rows.rows()])
+
+    def test_remove(self):
+        rows = RowStore()
+        for location in (0.0, 1.0, 2.0, 3.0):
+            rows.add(make_row(location))
+        revision = rows.revision
+        rows.remove(1.0)
+        self.assertEqual([0.0, 2.0, 3.0], list(rows))
+        removed = rows.remove_at(1)
+        self.assertEqual(2.0, removed["location"])
+        self.assertEqual([0.0, 3.0], list(rows))
+        self.assertNotIn(2.0, rows)
+        self.assertEqual(revision + 2, rows.revision)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,14 +4,16 @@
 
 from pathlib import Path
 from configparser import ConfigParser
+from concurrent.futures import ThreadPoolExecutor
 
-import taglib
-import pyglet
 import time
 
 from .importer import Importer
 from .utils.time import human_duration, reasonable_time
 
+# media probed with taglib at once when the catalog is out of date
+SCAN_WORKERS = 4
+
 class ImportLister:
 
     def __init__(self, config):
@@ -19,6 +21,7 @@ class ImportLister:
         self.project_dir = Path(config["instance"]["project_dir"])
         self.order = []
         self.data = {}
+        self.catalog = None
         self.ui = None
         self.player = None
         self.last_player_time = None
@@ -65,7 +68,7 @@ class ImportLister:
             meta["audio"]["deleted"] = "DELETED"
             with open(str(metadata_file), 'w') as out:
                 meta.write(out)
-        self.scan()
+        self._update_entry(self.order[line])
         if self.lister is not None:
             self.lister.invalidate = True
         return True
@@ -76,6 +79,7 @@ class ImportLister:
         # media = media.resolve()
         media = datum["media"]
         self.play_length = datum["length_secs"]
+        import pyglet
         sound = pyglet.media.load(str(media))
         group = pyglet.media.SourceGroup(sound.audio_format, sound.video_format)
         group.queue(sound)
@@ -114,32 +118,22 @@ class ImportLister:
         return False
 
 
-    def export_midi(self, basename, output):
-        config = {}
-        config.update(self.config)
-        config["instance"]["import-file"] = basename
+    def load_importer(self, basename, ui=None):
+        """ Return an `Importer` with the rows of `basename` loaded. """
+        self.config["instance"]["import-file"] = basename
         importer = Importer(self.config)
-        importer.wire(ui = self.ui, import_lister=self, push_player=None, csv_player=None)
+        importer.wire(ui = ui, import_lister=self, push_player=None, csv_player=None)
         importer.scan()
-        importer.export_midi(output)
+        return importer
+
+    def export_midi(self, basename, output):
+        self.load_importer(basename, ui=self.ui).export_midi(output)
 
     def export_txt(self, basename, output):
-        config = {}
-        config.update(self.config)
-        config["instance"]["import-file"] = basename
-        importer = Importer(self.config)
-        importer.wire(ui = None, import_lister=self, push_player=None, csv_player=None)
-        importer.scan()
-        importer.export_txt(output)
+        self.load_importer(basename).export_txt(output)
 
     def export_ly(self, basename, output):
-        config = {}
-        config.update(self.config)
-        config["instance"]["import-file"] = basename
-        importer = Importer(self.config)
-        importer.wire(ui = None, import_lister=self, push_player=None, csv_player=None)
-        importer.scan()
-        importer.export_ly(output)
+        self.load_importer(basename).export_ly(output)
 
 
     def return_value(self, line):
@@ -194,80 +188,178 @@ class ImportLister:
         return self.data.get(what)
 
     def scan(self):
+        """ Bring the list up to date with the media in `imports/`.
+
+            The display fields of every media file are kept in
+            `imports.catalog`, along with the size and modification time
+            of the media and its `.meta`. Only entries whose files have
+            changed since are examined again; those that need probing
+            with taglib are probed concurrently.
+        """
         import_dir = self.project_dir / "imports"
         if not import_dir.exists():
             return
+        catalog = self._load_catalog()
+        changed = False
+        seen = set()
+        stale = []
+        for f in import_dir.glob("*.[mMfFoO][pPlLgG]*[3cCgG]"):
+            seen.add(f.name)
+            state = _file_state(f)
+            if f.name not in catalog or not _is_current(catalog[f.name], state):
+                stale.append(f)
+        if stale:
+            with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+                for f, entry in zip(stale, pool.map(_examine, stale)):
+                    catalog[f.name] = entry
+            changed = True
+        for name in catalog.sections():
+            if name not in seen:
+                catalog.remove_section(name)
+                changed = True
+        if changed or not self.catalog_file.exists():
+            self._save_catalog()
+        self._build()
+        return self.order
+
+    @property
+    def catalog_file(self):
+        return self.project_dir / "imports.catalog"
+
+    def _load_catalog(self):
+        if self.catalog is None:
+            self.catalog = ConfigParser(interpolation=None)
+            self.catalog.optionxform = str
+            if self.catalog_file.exists():
+                self.catalog.read(str(self.catalog_file))
+        return self.catalog
+
+    def _save_catalog(self):
+        with open(str(self.catalog_file), 'w') as out:
+            self.catalog.write(out)
+
+    def _update_entry(self, what):
+        """ Examine the media file of `what` again, and rebuild the list. """
+        catalog = self._load_catalog()
+        for name in catalog.sections():
+            if Path(name).stem == what:
+                catalog[name] = _examine(self.project_dir / "imports" / name)
+        self._save_catalog()
+        self._build()
+
+    def _build(self):
         self.data = {}
         sortable_order = []
-        for f in import_dir.glob("*.[mMfFoO][pPlLgG]*[3cCgG]"):
-            metadata_file = f.with_suffix(".meta")
-            lyrics_file = f.with_suffix(".txt")
-            media_file = f.resolve()
-            meta = ConfigParser()
-            if metadata_file.exists():
-                meta.read(filenames=str(metadata_file))
-            if "audio" not in meta:
-                meta.add_section("audio")
-
-                stat = media_file.stat()
-                early_stamp = stat.st_ctime
-                if early_stamp is None or early_stamp == 0 or early_stamp > stat.st_mtime:
-                    early_stamp = stat.st_mtime
-                meta["audio"]["created"] = str(early_stamp)
-                meta["audio"]["modified"] = str(stat.st_mtime)
-                meta["audio"]["size"] = str(stat.st_size)
-
-                what = taglib.File(str(media_file))
-                if "ARTIST" in what.tags:
-                    meta["audio"]["artist"] = flatten_tag(what.tags["ARTIST"])
-                fallback_title = "{} from {}".format(metadata_file.stem, reasonable_time(early_stamp))
-                if "TITLE" in what.tags:
-                    meta["audio"]["title"] = flatten_tag(what.tags["TITLE"], truncate=True, fallback=fallback_title)
-                else:
-                    meta["audio"]["title"] = fallback_title
-                if "ALBUM" in what.tags:
-                    meta["audio"]["album"] = flatten_tag(what.tags["ALBUM"], truncate=True)
-                if "DATE" in what.tags:
-                    meta["audio"]["date"] = flatten_tag(what.tags["DATE"], truncate=True)
-                meta["audio"]["sample_rate"] = str(what.sampleRate)
-                meta["audio"]["channels"] = str(what.channels)
-                meta["audio"]["length"] = str(what.length)
-                meta["audio"]["bit_rate"] = str(what.bitrate)
-                meta["audio"]["tracks"] = "0"
-
-                if "LYRICS:NONE" in what.tags and not lyrics_file.exists():
-                    lyrics = flatten_tag(what.tags["LYRICS:NONE"], separator=r"\n\n-----\n\n")
-                    lyrics_file.write_text(lyrics.replace(r"\n","\n"))
-                if lyrics_file.exists():
-                    meta["audio"]["lyrics"] = lyrics_file.name
-                with open(str(metadata_file), 'w') as out:
-                    meta.write(out)
-
-            if "deleted" not in meta["audio"]:
-                sortable_order.append((int(metadata_file.stat().st_mtime), float(meta["audio"]["modified"]), metadata_file.stem))
-            title = meta["audio"]["title"]
-            length_secs = float(meta["audio"]["length"])
-            total_length = human_duration(length_secs)
-            timestamp =  reasonable_time(float(meta["audio"]["created"]))
-            tracks = int(meta["audio"].get("tracks",0))
-            unprocessed_length = None
-            if "unprocessed_length" in meta["audio"]:
-                unprocessed_length = human_duration(float(meta["audio"]["unprocessed_length"]))
-
-            self.data[metadata_file.stem] = {
-                "media": str(media_file.resolve()),
-                "metadata": str(metadata_file.resolve()),
-                "title": title,
-                "total_length": total_length,
-                "length_secs": length_secs,
-                "timestamp": timestamp,
-                "tracks": tracks,
-                "unprocessed_length": unprocessed_length,
+        for name in self.catalog.sections():
+            entry = self.catalog[name]
+            stem = Path(name).stem
+            if entry["deleted"] == "":
+                sortable_order.append((int(entry["sort_mtime"]), float(entry["modified"]), stem))
+            self.data[stem] = {
+                "media": entry["media"],
+                "metadata": entry["metadata"],
+                "title": entry["title"],
+                "total_length": entry["total_length"],
+                "length_secs": float(entry["length_secs"]),
+                "timestamp": entry["timestamp"],
+                "tracks": int(entry["tracks"]),
+                "unprocessed_length": entry["unprocessed_length"] or None,
             }
         sortable_order.sort(reverse=True)
         self.order = [x[-1] for x in sortable_order]
 
-        return self.order
+
+def _file_state(f):
+    """ Return the catalog fields that tell whether `f` or its `.meta` changed. """
+    stat = f.stat()
+    metadata_file = f.with_suffix(".meta")
+    if metadata_file.exists():
+        meta_stat = metadata_file.stat()
+        meta_mtime, meta_size = str(meta_stat.st_mtime_ns), str(meta_stat.st_size)
+    else:
+        meta_mtime, meta_size = "", ""
+    return {
+        "media_mtime": str(stat.st_mtime_ns),
+        "media_size": str(stat.st_size),
+        "meta_mtime": meta_mtime,
+        "meta_size": meta_size,
+    }
+
+
+def _is_current(entry, state):
+    return all(entry.get(k) == v for k, v in state.items())
+
+
+def _examine(f):
+    """ Return the catalog entry for the media file `f`.
+
+        The `.meta` is created, probing the media with taglib, if it
+        doesn't have an `[audio]` section yet.
+    """
+    metadata_file = f.with_suffix(".meta")
+    lyrics_file = f.with_suffix(".txt")
+    media_file = f.resolve()
+    meta = ConfigParser()
+    if metadata_file.exists():
+        meta.read(filenames=str(metadata_file))
+    if "audio" not in meta:
+        meta.add_section("audio")
+
+        stat = media_file.stat()
+        early_stamp = stat.st_ctime
+        if early_stamp is None or early_stamp == 0 or early_stamp > stat.st_mtime:
+            early_stamp = stat.st_mtime
+        meta["audio"]["created"] = str(early_stamp)
+        meta["audio"]["modified"] = str(stat.st_mtime)
+        meta["audio"]["size"] = str(stat.st_size)
+
+        import taglib
+        what = taglib.File(str(media_file))
+        if "ARTIST" in what.tags:
+            meta["audio"]["artist"] = flatten_tag(what.tags["ARTIST"])
+        fallback_title = "{} from {}".format(metadata_file.stem, reasonable_time(early_stamp))
+        if "TITLE" in what.tags:
+            meta["audio"]["title"] = flatten_tag(what.tags["TITLE"], truncate=True, fallback=fallback_title)
+        else:
+            meta["audio"]["title"] = fallback_title
+        if "ALBUM" in what.tags:
+            meta["audio"]["album"] = flatten_tag(what.tags["ALBUM"], truncate=True)
+        if "DATE" in what.tags:
+            meta["audio"]["date"] = flatten_tag(what.tags["DATE"], truncate=True)
+        meta["audio"]["sample_rate"] = str(what.sampleRate)
+        meta["audio"]["channels"] = str(what.channels)
+        meta["audio"]["length"] = str(what.length)
+        meta["audio"]["bit_rate"] = str(what.bitrate)
+        meta["audio"]["tracks"] = "0"
+
+        if "LYRICS:NONE" in what.tags and not lyrics_file.exists():
+            lyrics = flatten_tag(what.tags["LYRICS:NONE"], separator=r"\n\n-----\n\n")
+            lyrics_file.write_text(lyrics.replace(r"\n","\n"))
+        if lyrics_file.exists():
+            meta["audio"]["lyrics"] = lyrics_file.name
+        with open(str(metadata_file), 'w') as out:
+            meta.write(out)
+
+    length_secs = float(meta["audio"]["length"])
+    unprocessed_length = ""
+    if "unprocessed_length" in meta["audio"]:
+        unprocessed_length = human_duration(float(meta["audio"]["unprocessed_length"]))
+    entry = _file_state(f)
+    entry.update({
+        "media": str(media_file),
+        "metadata": str(metadata_file.resolve()),
+        "title": meta["audio"]["title"],
+        "total_length": human_duration(length_secs),
+        "length_secs": str(length_secs),
+        "timestamp": reasonable_time(float(meta["audio"]["created"])),
+        "tracks": str(int(meta["audio"].get("tracks", 0))),
+        "unprocessed_length": unprocessed_length,
+        "deleted": "1" if "deleted" in meta["audio"] else "",
+        "sort_mtime": str(int(metadata_file.stat().st_mtime)),
+        "modified": meta["audio"]["modified"],
+    })
+    return entry
+
 
 def flatten_tag(tag_list, truncate = False, fallback = "", separator = " // "):
     if tag_list is None:
@@ -1,15 +1,26 @@
 #!/usr/bin/env python3
 
+__all__ = ["JamLister", "read_segment"]
+
 from pathlib import Path
+import mmap
+import os
 import time
 from configparser import ConfigParser
 
 from .bgplayer import BackgroundNull
 from .exportly import ExportLy
-from .exportmidi import ExportMidi
 from .commands import Commands
+from .render import render_segment
+from .streamformat import stream_version, read_records, scan_marks
 from .utils.time import human_duration
 
+# sections of the index that track how far each stream has been parsed
+STREAM_PREFIX = "stream:"
+# streams at least this big are memory-mapped to read a segment
+MMAP_THRESHOLD = 16 * 1024 * 1024
+# a stream with nothing marked in it, untouched for this long, is abandoned
+ABANDONED_STREAM_SECS = 24 * 60 * 60
 
 class JamLister:
 
@@ -21,8 +32,7 @@ class JamLister:
         self.order = []
         if self.streams_index.exists():
             self.marks.read(str(self.streams_index))
-        else:
-            self.scan()
+        self.scan()
 
     def wire(self, *, push_commands, **kwargs):
         self.commands = push_commands
@@ -107,28 +117,19 @@ class JamLister:
         self.save()
         self.scan()
 
-    def get(self, what):
+    def get(self, what, use_mmap=None):
         n = self.get_mark(what)
-        fname = self.project_dir / n["name"]
-        txt = fname.read_text().split("\n")
-        s = int(n["start"])
-        e = int(n["end"])
-        return txt[s:e]
+        return read_segment(self.project_dir / n["name"], n, use_mmap=use_mmap)
 
     def export_midi(self, what, output):
-        exporter = ExportMidi(self.config, output)
-        cmds = Commands(self.config)
-        cmds.wire(push_player=exporter, metronome=BackgroundNull())
-        exporter.start()
-        cmds.play(self.get(what), realtime=False)
-        exporter.end()
+        render_segment(self.config, self.get(what), output)
 
     def export_ly(self, what, output, title=""):
         exporter = ExportLy(self.config, output, title=title)
         cmds = Commands(self.config)
         cmds.wire(push_player=exporter, metronome=BackgroundNull())
         exporter.start()
-        cmds.play(self.get(what), realtime=False)
+        cmds.play(self.get(what), realtime=False, quiet=True)
         exporter.end()
 
     def save(self):
@@ -146,37 +147,189 @@ class JamLister:
         return title
 
     def scan(self):
-        self.order = []
+        """ Bring the index up to date with the `cmd-*.stream` files.
+
+            Only new files, and the bytes appended to known files since
+            they were last scanned, are parsed; the position and parse
+            state of each stream is kept in its `stream:` section. The
+            index is only rewritten if something changed. Streams in the
+            v2 format are scanned in bulk by `streamformat.scan_marks`.
+        """
+        changed = False
+        seen = set()
         for f in self.project_dir.glob("cmd-*.stream"):
-            txt = f.read_text().split("\n")
-            marks = 0
-            line = 0
-            line_start = None
-            start_secs = 0.0
-            while line < len(txt):
-                j = txt[line].split(",", 1)
+            seen.add(f.name)
+            if self._scan_stream(f):
+                changed = True
+        for section in self.marks.sections():
+            if section.startswith(STREAM_PREFIX) and section[len(STREAM_PREFIX):] not in seen:
+                self._forget_stream(section[len(STREAM_PREFIX):])
+                changed = True
+        self.order = self._build_order()
+        if changed or not self.streams_index.exists():
+            self.save()
+
+    def _build_order(self):
+        order = []
+        for section in self.marks.sections():
+            if section.startswith(STREAM_PREFIX):
+                continue
+            n = self.marks[section]
+            if n.get("state") == "deleted" or "name" not in n:
+                continue
+            if not self.marks.has_section(STREAM_PREFIX + n["name"]):
+                continue
+            order.append((float(n["timestamp_secs"]), int(n["start"]), section))
+        order.sort()
+        return [section for timestamp, start, section in order]
+
+    def _forget_stream(self, name):
+        """ Drop the index entries for a stream; returns the segment sections. """
+        dropped = {}
+        self.marks.remove_section(STREAM_PREFIX + name)
+        for section in self.marks.sections():
+            if self.marks[section].get("name") == name:
+                dropped[section] = dict(self.marks[section])
+                self.marks.remove_section(section)
+        return dropped
+
+    def _scan_stream(self, f):
+        """ Parse whatever hasn't been parsed of a stream; returns True if the index changed. """
+        stat = f.stat()
+        key = STREAM_PREFIX + f.name
+        if self.marks.has_section(key):
+            state = self.marks[key]
+            if int(state["size"]) == stat.st_size and state["mtime"] == str(stat.st_mtime_ns):
+                return False
+        else:
+            state = None
+        version = str(stream_version(f))
+        previous = {}
+        if state is None or stat.st_size < int(state["offset"]) or state.get("format", "1") != version:
+            # new, converted, or rewritten since we last looked: start over
+            previous = self._forget_stream(f.name)
+            self.marks.add_section(key)
+            state = self.marks[key]
+            state["offset"] = "0"
+            state["lines"] = "0"
+            state["line_start"] = ""
+            state["start_offset"] = "0"
+            state["start_secs"] = "0.0"
+            state["segments"] = "0"
+            state["format"] = version
+        if version == "2":
+            return self._scan_v2(f, stat, state, previous)
+        offset = int(state["offset"])
+        line = int(state["lines"])
+        line_start = None if state["line_start"] == "" else int(state["line_start"])
+        start_offset = int(state.get("start_offset", "0"))
+        start_secs = float(state["start_secs"])
+        marks = int(state["segments"])
+        with f.open("rb") as stream:
+            stream.seek(offset)
+            for raw in stream:
+                if not raw.endswith(b"\n"):
+                    # still being written; pick it up next time
+                    break
+                offset += len(raw)
+                j = raw.decode(errors="replace").rstrip("\r\n").split(",", 1)
                 cmd = j[-1]
                 if cmd == "mark_bad":
                     line_start = line + 1
+                    start_offset = offset
                     start_secs = float(j[0])
                 if cmd.startswith("mark_good") or cmd == "next":
                     if line_start is not None:
-                        n = "{}-{}-{}".format(f.name, line_start, line)
-                        if not self.marks.has_section(n):
-                            self.marks.add_section(n)
-                        if self.marks[n].get("state") != "deleted":
-                            self.order.append(n)
-                            end_secs = float(j[0])
-                            self.marks[n]["name"] = f.name
-                            self.marks[n]["start"] = str(line_start)
-                            self.marks[n]["end"] = str(line+1)
-                            self.marks[n]["length"] = str(end_secs - start_secs)
-                            self.marks[n]["timestamp_secs"] = f.name[len("cmd-"):-len(".stream")]
+                        if self._add_segment(f, previous, line_start, line + 1, start_offset, offset,
+                                             float(j[0]) - start_secs):
                             marks += 1
                     start_secs = float(j[0])
                     line_start = line + 1
+                    start_offset = offset
                 line += 1
-            if marks == 0:
-                f.unlink()
-        self.save()
+        return self._scanned(f, stat, state, offset, line, line_start, start_offset, start_secs, marks)
 
+    def _scan_v2(self, f, stat, state, previous):
+        offset = int(state["offset"])
+        boundary = None
+        if state["line_start"] != "":
+            boundary = (int(state["line_start"]) - 1, int(state["start_offset"]), float(state["start_secs"]))
+        segments, boundary, line, offset = scan_marks(f, offset or None, boundary)
+        marks = int(state["segments"])
+        for start, end, start_offset, end_offset, start_secs, end_secs in segments:
+            if self._add_segment(f, previous, start, end, start_offset, end_offset, end_secs - start_secs):
+                marks += 1
+        if boundary is None:
+            return self._scanned(f, stat, state, offset, line, None, 0, 0.0, marks)
+        line_start, start_offset, start_secs = boundary
+        return self._scanned(f, stat, state, offset, line, line_start + 1, start_offset, start_secs, marks)
+
+    def _add_segment(self, f, previous, start, end, start_offset, end_offset, length):
+        """ Index lines `start` to `end` of a stream; returns False if it was deleted. """
+        n = "{}-{}-{}".format(f.name, start, end - 1)
+        if not self.marks.has_section(n):
+            self.marks.add_section(n)
+            for k, v in previous.get(n, {}).items():
+                self.marks[n][k] = v
+        if self.marks[n].get("state") == "deleted":
+            return False
+        self.marks[n]["name"] = f.name
+        self.marks[n]["start"] = str(start)
+        self.marks[n]["end"] = str(end)
+        self.marks[n]["start_offset"] = str(start_offset)
+        self.marks[n]["end_offset"] = str(end_offset)
+        self.marks[n]["length"] = str(length)
+        self.marks[n]["timestamp_secs"] = f.name[len("cmd-"):-len(".stream")]
+        return True
+
+    def _scanned(self, f, stat, state, offset, line, line_start, start_offset, start_secs, marks):
+        """ Record how far a stream has been scanned; returns True.
+
+            A stream with no segments may still be being recorded, so it's
+            only removed once it has been left alone for a while with no
+            unfinished line.
+        """
+        if marks == 0 and offset == stat.st_size and time.time() - stat.st_mtime > ABANDONED_STREAM_SECS:
+            self._forget_stream(f.name)
+            f.unlink()
+            return True
+        state["size"] = str(stat.st_size)
+        state["mtime"] = str(stat.st_mtime_ns)
+        state["offset"] = str(offset)
+        state["lines"] = str(line)
+        state["line_start"] = "" if line_start is None else str(line_start)
+        state["start_offset"] = str(start_offset)
+        state["start_secs"] = str(start_secs)
+        state["segments"] = str(marks)
+        return True
+
+
+def read_segment(fname, mark, use_mmap=None):
+    """ Return the lines of the segment `mark` of the stream `fname`.
+
+        Only the segment's bytes are read. Streams of `MMAP_THRESHOLD`
+        bytes or more are memory-mapped rather than read, unless
+        `use_mmap` says otherwise. The segments of v2 streams come back
+        as `(time, command)` pairs rather than lines; `Commands.play`
+        takes either.
+    """
+    if stream_version(fname) == 2:
+        return read_records(fname, int(mark["start_offset"]), int(mark["end_offset"]))
+    if "start_offset" not in mark:
+        # indexed before offsets were recorded
+        txt = fname.read_text().split("\n")
+        s = int(mark["start"])
+        e = int(mark["end"])
+        return txt[s:e]
+    start = int(mark["start_offset"])
+    end = int(mark["end_offset"])
+    with fname.open("rb") as stream:
+        if use_mmap is None:
+            use_mmap = os.fstat(stream.fileno()).st_size >= MMAP_THRESHOLD
+        if use_mmap:
+            with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                data = mapped[start:end]
+        else:
+            stream.seek(start)
+            data = stream.read(end - start)
+    return data.decode(errors="replace").splitlines()
@@ -1,19 +1,55 @@
 #!/usr/bin/env python3
 
-__all__ = ["PushButtonPlayer"]
+__all__ = ["PushButtonPlayer", "LOOKAHEAD_SECS", "ALL_SOUND_OFF", "ALL_NOTES_OFF"]
 
 import sys
+import heapq
+import itertools
 import mido
-import queue
 import threading
+import time
 import os.path
 from datetime import datetime, timedelta 
 from mido import Message, MidiFile, MidiTrack
 
+from .utils.stats import RunningStats
+
+_now = time.perf_counter
+
+# channel mode controllers
+ALL_SOUND_OFF = 120
+ALL_NOTES_OFF = 123
+
+# how far ahead of their due time producers feed scheduled messages
+LOOKAHEAD_SECS = 0.05
+# how close to a message's due time the runner stops sleeping and spins
+SPIN_SECS = 0.0005
+
+
 class PushButtonPlayer:
+    """ Sends MIDI messages to the output port when they are due.
+
+        Messages are kept in a heap keyed on their due time, on the
+        `time.perf_counter()` clock. Producers may feed them ahead of time
+        with `at`; anything fed without one is due immediately. One thread
+        sends them all, so everything feeding this player shares a clock.
+        How late each message went out is kept in `jitter`. Messages fed
+        with a `stamp` time how long they took from then until they were
+        sent, in microseconds, in `latency`.
+
+        The notes left sounding by what has been sent are tracked in
+        `active`, a map of channel to notes, so a panic can turn off just
+        those.
+    """
 
     def __init__(self, config):
-        self.queue = queue.Queue() 
+        self.cond = threading.Condition()
+        self.pending = []
+        self.seq = itertools.count()
+        self.stopping = False
+        self.jitter = RunningStats()
+        self.latency = RunningStats()
+        self.stamps = {}
         self.thread = None
         self.active = {}
         self.midiport = None
@@ -34,24 +70,98 @@ class PushButtonPlayer:
 
     def start(self):
         if self.thread is None:
+            self.stopping = False
             self.thread = threading.Thread(target=self._runner)
             self.thread.start()
 
     def end(self):
-        if self.queue is not None and self.thread is not None:
-            self.queue.join()
-            self.queue.put(None)
+        """ Stop once every pending message has been sent. """
+        thread = self.thread
+        if thread is not None:
+            with self.cond:
+                self.stopping = True
+                self.cond.notify_all()
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def _next_due(self):
+        """ Wait for and return the next message that is due, or None to stop. """
+        with self.cond:
+            while True:
+                if not self.pending:
+                    if self.stopping:
+                        return None
+                    self.cond.wait()
+                    continue
+                due = self.pending[0][0]
+                wait = due - time.perf_counter()
+                if wait > SPIN_SECS:
+                    self.cond.wait(wait - SPIN_SECS)
+                    continue
+                if wait <= 0:
+                    return heapq.heappop(self.pending)
+                # too close to trust the condition's timeout; yield until due
+                self.cond.release()
+                try:
+                    time.sleep(0)
+                finally:
+                    self.cond.acquire()
 
     def _runner(self):
         with mido.open_output(self.midiport) as output:
             while True:
-                message = self.queue.get()
-                if message is None:
+                entry = self._next_due()
+                if entry is None:
                     break
+                due, seq, message = entry
                 output.send(message)
-                self.queue.task_done()
+                sent = time.perf_counter()
+                self.jitter.add(sent - due)
+                stamp = self.stamps.pop(seq, None)
+                if stamp is not None:
+                    self.latency.add((sent - stamp) * 1000000)
+                self._sent(message)
         self.thread = None
-        self.queue = None
+
+    def _sent(self, message):
+        with self.cond:
+            if message.type == "note_on" and message.velocity > 0:
+                self.active.setdefault(message.channel, set()).add(message.note)
+            elif message.type in ("note_on", "note_off"):
+                self.active.get(message.channel, set()).discard(message.note)
+            elif message.type == "control_change" and message.control in (ALL_NOTES_OFF, ALL_SOUND_OFF):
+                self.active.pop(message.channel, None)
+
+    def cancel(self, after=None, channels=None):
+        """ Drop the messages due after `after` (by default, now).
+
+            Only the messages on `channels` are dropped, if it's given.
+            Their `note_off`s are sent now instead, so nothing that was
+            already turned on is left sounding.
+        """
+        if after is None:
+            after = _now()
+        with self.cond:
+            kept = []
+            offs = []
+            for entry in self.pending:
+                due, seq, message = entry
+                if due <= after or (channels is not None and getattr(message, "channel", None) not in channels):
+                    kept.append(entry)
+                elif message.type == "note_off" or (message.type == "note_on" and message.velocity == 0):
+                    offs.append(message)
+                else:
+                    self.stamps.pop(seq, None)
+            heapq.heapify(kept)
+            self.pending = kept
+            for message in offs:
+                heapq.heappush(self.pending, (after, next(self.seq), message))
+            self.cond.notify_all()
+
+    def sounding(self):
+        """ Return (channel, note) for each note that has been left on. """
+        with self.cond:
+            return [(channel, note) for channel in sorted(self.active) for note in sorted(self.active[channel])]
 
     def feed_lyric(self, lyric, **kwargs):
         pass
@@ -62,12 +172,22 @@ class PushButtonPlayer:
     def sync_comment(self, cmt, **kwargs):
         pass
 
-    def feed_midi(self, *what, ui=None, abbr=None, channel=None, time=None): 
+    def feed_midi(self, *what, ui=None, abbr=None, channel=None, time=None, at=None, stamp=None):
         self.ui = ui
-        if self.queue is not None:
+        if at is None:
+            at = _now()
+        with self.cond:
+            if abbr == "panic":
+                # nothing queued up should sound after a panic
+                self.pending.clear()
+                self.stamps.clear()
             for w in what:
                 if time is not None:
                     w.time = time
                     time = None
-                self.queue.put(w)
-
+                seq = next(self.seq)
+                heapq.heappush(self.pending, (at, seq, w))
+            if stamp is not None and what:
+                # the last message is the one the key was pressed for
+                self.stamps[seq] = stamp
+            self.cond.notify_all()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+""" Offline rendering of jam stream segments to MIDI files.
+
+    A segment is played through `Commands` as fast as it goes, with
+    messages built as raw bytes rather than `mido.Message` objects and
+    encoded as they are fed, so nothing is kept per message but its
+    bytes. The file written is the same as `ExportMidi` would write.
+"""
+
+__all__ = ["RenderMidi", "raw_message", "render_segment"]
+
+import struct
+
+from .bgplayer import BackgroundNull
+from .commands import Commands
+
+# as `mido.MidiFile` has it
+TICKS_PER_BEAT = 480
+_END_OF_TRACK = b"\x00\xff\x2f\x00"
+_STATUS = {"note_off": 0x80, "note_on": 0x90, "control_change": 0xB0, "program_change": 0xC0}
+
+
+class RawMessage:
+    """ A channel message as its MIDI bytes, and its time in ticks. """
+    __slots__ = ("data", "time")
+
+    def __init__(self, data, time):
+        self.data = data
+        self.time = time
+
+
+def raw_message(type, *, channel=0, note=0, velocity=64, control=0, value=0, program=0, time=0):
+    """ Build a `RawMessage`; takes the arguments `mido.Message` does for the messages `Commands` plays. """
+    if type == "program_change":
+        data = (program,)
+    elif type == "control_change":
+        data = (control, value)
+    else:
+        data = (note, velocity)
+    if not 0 <= channel <= 15 or not all(0 <= d <= 127 for d in data):
+        raise ValueError("{} out of range: channel={} data={}".format(type, channel, data))
+    return RawMessage(bytes((_STATUS[type] | channel,) + data), time)
+
+
+def _variable_int(value):
+    if value < 0x80:
+        return bytes((value,))
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(out))
+
+
+class RenderMidi:
+    """ A player that writes what it's fed as a one track MIDI file.
+
+        Messages are `RawMessage`s with integer tick times. They are
+        encoded as they come, with running status.
+    """
+
+    def __init__(self, config, filenm):
+        self.filenm = filenm
+        self.track = None
+        self.running = None
+
+    def new_track(self, **kwargs):
+        pass
+
+    def unknown_track(self):
+        pass
+
+    def start(self):
+        self.track = bytearray()
+        self.running = None
+
+    def end(self):
+        header = struct.pack(">hhh", 1, 1, TICKS_PER_BEAT)
+        track = self.track + _END_OF_TRACK
+        with open(str(self.filenm), "wb") as out:
+            out.write(b"MThd" + struct.pack(">L", len(header)) + header)
+            out.write(b"MTrk" + struct.pack(">L", len(track)))
+            out.write(track)
+
+    def feed_comment(self, cmt, **kwargs):
+        pass
+    def feed_other(self, cmd, **kwargs):
+        pass
+    def sync_comment(self, cmt, **kwargs):
+        pass
+    def feed_lyric(self, lyric, **kwargs):
+        pass
+
+    def feed_midi(self, *what, ui=None, abbr=None, channel=None, time=None, at=None):
+        track = self.track
+        for w in what:
+            if time is None:
+                delta = w.time
+            else:
+                delta = time
+                time = None
+            if not isinstance(delta, int) or delta < 0:
+                raise ValueError("message time must be a non-negative int in a MIDI file")
+            track += _variable_int(delta)
+            data = w.data
+            if data[0] == self.running:
+                track += data[1:]
+            else:
+                track += data
+                self.running = data[0]
+
+
+def render_segment(config, material, output):
+    """ Render the stream segment `material`, as `Commands.play` takes it, to the MIDI file `output`. """
+    render = RenderMidi(config, output)
+    cmds = Commands(config)
+    cmds.make_message = raw_message
+    cmds.wire(push_player=render, metronome=BackgroundNull())
+    render.start()
+    cmds.play(material, realtime=False, quiet=True)
+    render.end()
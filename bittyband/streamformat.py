@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+""" Reading and writing jam command streams.
+
+    A v1 stream is the text the `CommandRecorder` writes: `FILE_ID`,
+    then a `"{perf_counter},{command}"` line per command. A v2 stream
+    holds the same commands as fixed-width binary records:
+
+        magic       8 bytes, `STREAM_MAGIC`
+        header      `<HHII`: version, number of commands, line base, reserved
+        commands    for each: `<H` length, then the command in utf-8
+        padding     to a multiple of 8 bytes
+        records     `<dH`: the time, and the command's index in the table
+
+    The line base is the number of lines before the first command in the
+    v1 stream a v2 stream was converted from, so record `i` is line
+    `line_base + i` of the v1 stream and segments keep their names.
+"""
+
+__all__ = ["stream_version", "read_stream", "read_records", "write_v1", "write_v2",
+           "convert_stream", "convert_streams", "still_recording", "scan_marks", "V2_RECORD", "STREAM_MAGIC"]
+
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+from .cmdrecorder import FILE_ID, RECORDING_SUFFIX
+
+STREAM_MAGIC = b"BBSTREAM"
+_HEADER = struct.Struct("<HHII")
+_LENGTH = struct.Struct("<H")
+V2_RECORD = struct.Struct("<dH")
+
+
+def stream_version(fname):
+    """ Return 2 for a v2 stream, otherwise 1. """
+    with open(str(fname), "rb") as f:
+        return 2 if f.read(len(STREAM_MAGIC)) == STREAM_MAGIC else 1
+
+
+def read_header(f):
+    """ Read a v2 header from `f`; returns `(commands, line_base, records_offset)`. """
+    f.seek(0)
+    if f.read(len(STREAM_MAGIC)) != STREAM_MAGIC:
+        raise ValueError("not a v2 command stream")
+    version, count, line_base, reserved = _HEADER.unpack(f.read(_HEADER.size))
+    if version != 2:
+        raise ValueError("unknown command stream version {}".format(version))
+    commands = []
+    for i in range(count):
+        length, = _LENGTH.unpack(f.read(_LENGTH.size))
+        commands.append(f.read(length).decode("utf-8"))
+    return commands, line_base, _aligned(f.tell())
+
+
+def _aligned(offset):
+    return (offset + 7) // 8 * 8
+
+
+def read_records(fname, start=None, end=None):
+    """ Return the `(time, command)` pairs of a v2 stream.
+
+        `start` and `end` are byte offsets of records; by default, all
+        of them are read.
+    """
+    with open(str(fname), "rb") as f:
+        commands, line_base, records_offset = read_header(f)
+        if start is None:
+            start = records_offset
+        f.seek(start)
+        data = f.read() if end is None else f.read(end - start)
+    data = data[:len(data) // V2_RECORD.size * V2_RECORD.size]
+    return [(t, commands[i]) for t, i in V2_RECORD.iter_unpack(data)]
+
+
+def _parse_v1(lines):
+    """ Yield `(line, time, command)` for the command lines of a v1 stream. """
+    for line_no, line in enumerate(lines):
+        if line == "" or line[0] in "# \t":
+            continue
+        p = line.split(",", 1)
+        yield line_no, float(p[0]), p[-1]
+
+
+def read_stream(fname):
+    """ Return the `(time, command)` pairs of a v1 or v2 stream. """
+    if stream_version(fname) == 2:
+        return read_records(fname)
+    with open(str(fname), "rb") as f:
+        text = f.read().decode(errors="replace")
+    # a last line without its newline is still being written
+    lines = text.split("\n")[:-1]
+    return [(t, cmd) for line_no, t, cmd in _parse_v1(line.rstrip("\r") for line in lines)]
+
+
+def write_v2(fname, records, line_base=0):
+    """ Write the `(time, command)` pairs as a v2 stream. """
+    table = {}
+    for t, cmd in records:
+        table.setdefault(cmd, len(table))
+    if len(table) > 0xFFFF:
+        raise ValueError("too many distinct commands for a v2 stream")
+    header = bytearray(STREAM_MAGIC)
+    header += _HEADER.pack(2, len(table), line_base, 0)
+    for cmd in table:
+        encoded = cmd.encode("utf-8")
+        header += _LENGTH.pack(len(encoded))
+        header += encoded
+    header += bytes(_aligned(len(header)) - len(header))
+    body = bytearray(V2_RECORD.size * len(records))
+    for n, (t, cmd) in enumerate(records):
+        V2_RECORD.pack_into(body, n * V2_RECORD.size, t, table[cmd])
+    _replace(fname, bytes(header) + bytes(body))
+
+
+def write_v1(fname, records, line_base=1):
+    """ Write the `(time, command)` pairs as a v1 stream, after `line_base` header lines. """
+    text = FILE_ID * max(line_base, 1) + "".join("{!r},{}\n".format(t, cmd) for t, cmd in records)
+    _replace(fname, text.encode("utf-8"))
+
+
+def _replace(fname, data):
+    tmp_file = str(fname) + ".tmp"
+    with open(tmp_file, "wb") as out:
+        out.write(data)
+    os.replace(tmp_file, str(fname))
+
+
+def convert_stream(fname, version=2):
+    """ Rewrite the stream `fname` in the given format; returns False if it already was. """
+    if stream_version(fname) == version:
+        return False
+    if version == 1:
+        with open(str(fname), "rb") as f:
+            commands, line_base, records_offset = read_header(f)
+        write_v1(fname, read_records(fname), line_base)
+        return True
+    with open(str(fname), "rb") as f:
+        text = f.read().decode(errors="replace")
+    lines = [line.rstrip("\r") for line in text.split("\n")[:-1]]
+    parsed = list(_parse_v1(lines))
+    line_base = parsed[0][0] if parsed else len(lines)
+    if any(line_no != line_base + n for n, (line_no, t, cmd) in enumerate(parsed)):
+        raise ValueError("{}: comments between commands can't be kept in a v2 stream".format(fname))
+    write_v2(fname, [(t, cmd) for line_no, t, cmd in parsed], line_base)
+    return True
+
+
+def still_recording(fname, abandoned_secs):
+    """ Return True if `fname` looks like it is still being recorded.
+
+        Its recorder leaves a marker next to it, unless it crashed; a
+        marker on a stream untouched for `abandoned_secs` is ignored. A
+        v1 stream whose last line is unfinished is still being written
+        whatever the marker says.
+    """
+    stat = os.stat(str(fname))
+    marker = Path(str(fname) + RECORDING_SUFFIX)
+    if marker.exists() and time.time() - stat.st_mtime < abandoned_secs:
+        return True
+    if stream_version(fname) == 1 and stat.st_size > 0:
+        with open(str(fname), "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+    return False
+
+
+def convert_streams(config):
+    """ Convert every jam stream of the project to the `stream_format` instance option.
+
+        Streams still being recorded are skipped. The jam index is
+        brought up to date afterwards. Progress is reported on stderr;
+        returns the number of streams that failed.
+    """
+    from .jamlister import JamLister, ABANDONED_STREAM_SECS
+    project_dir = Path(config["instance"]["project_dir"])
+    version = int(config["instance"].get("stream_format", "2"))
+    streams = sorted(project_dir.glob("cmd-*.stream"))
+    failed = 0
+    for done, stream in enumerate(streams, start=1):
+        try:
+            if still_recording(stream, ABANDONED_STREAM_SECS):
+                status = "skipped: still being recorded"
+            elif convert_stream(stream, version):
+                status = "converted to v{}".format(version)
+            else:
+                status = "already v{}".format(version)
+        except (OSError, ValueError) as e:
+            status = "failed: {}".format(e)
+            failed += 1
+        sys.stderr.write("[{}/{}] {}: {}\n".format(done, len(streams), stream.name, status))
+        sys.stderr.flush()
+    JamLister(config)
+    return failed
+
+
+def scan_marks(fname, start=None, boundary=None):
+    """ Find the marked segments of the v2 stream `fname`.
+
+        Records from byte offset `start` on are scanned (all of them by
+        default). Records are numbered as the lines of the v1 stream
+        they were converted from. `boundary` is the `(line, offset,
+        time)` of the last `mark_bad`, `mark_good` or `next` before
+        `start`, if there was one; a segment runs from the record after
+        one of those up to and including a `mark_good` or `next`.
+
+        Returns `(segments, boundary, lines, end)`: `segments` is a list
+        of `(start line, end line + 1, start offset, end offset, start
+        time, end time)`, `boundary` the last boundary found (or the one
+        passed in), and `lines` and `end` the line number and byte
+        offset the scan stopped at.
+    """
+    import numpy
+    with open(str(fname), "rb") as f:
+        commands, line_base, records_offset = read_header(f)
+        if start is None:
+            start = records_offset
+        f.seek(start)
+        data = f.read()
+    count = len(data) // V2_RECORD.size
+    first_line = line_base + (start - records_offset) // V2_RECORD.size
+    records = numpy.frombuffer(data, dtype=numpy.dtype([("time", "<f8"), ("command", "<u2")]), count=count)
+
+    bad_ids = [i for i, cmd in enumerate(commands) if cmd == "mark_bad"]
+    end_ids = [i for i, cmd in enumerate(commands) if cmd.startswith("mark_good") or cmd == "next"]
+    is_end = numpy.isin(records["command"], end_ids)
+    found = numpy.flatnonzero(is_end | numpy.isin(records["command"], bad_ids))
+
+    lines = found + first_line
+    offsets = start + (found + 1) * V2_RECORD.size
+    times = records["time"][found]
+    ends = is_end[found]
+    if boundary is not None:
+        lines = numpy.concatenate(([boundary[0]], lines))
+        offsets = numpy.concatenate(([boundary[1]], offsets))
+        times = numpy.concatenate(([boundary[2]], times))
+        ends = numpy.concatenate(([False], ends))
+    # every end closes the segment begun by the boundary before it
+    closing = numpy.flatnonzero(ends[1:]) + 1
+    segments = list(zip((lines[closing - 1] + 1).tolist(), (lines[closing] + 1).tolist(),
+                        offsets[closing - 1].tolist(), offsets[closing].tolist(),
+                        times[closing - 1].tolist(), times[closing].tolist()))
+    if len(lines):
+        boundary = (int(lines[-1]), int(offsets[-1]), float(times[-1]))
+    return segments, boundary, first_line + count, start + count * V2_RECORD.size
@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from configparser import ConfigParser
+from pathlib import Path
+
+from .batchexport import export_jams, export_imports
+from .config import default_config
+from .importlister import ImportLister
+
+STREAM = "#,audio/vnd.mrbeany.bittyband.stream : v1\n" \
+         "1.0,mark_bad\n1.5,note_1\n2.0,note_3\n2.5,mark_good\n3.0,note_5\n3.5,next\n"
+
+
+class TestExportJams(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.project_dir = Path(self.tmp.name)
+        (self.project_dir / "cmd-1000.5.stream").write_text(STREAM)
+        self.config = ConfigParser(inline_comment_prefixes=None)
+        self.config.add_section("instance")
+        self.config["instance"]["project_dir"] = self.tmp.name
+        self.config["instance"]["export_formats"] = "midi,txt"
+        self.config["instance"]["export_jobs"] = "2"
+
+    def exported(self):
+        return sorted(f.name for f in (self.project_dir / "exports").glob("cmd-*"))
+
+    def test_exports_then_skips(self):
+        self.assertEqual(0, export_jams(self.config))
+        self.assertEqual(["cmd-1000.5.stream-2-4.midi", "cmd-1000.5.stream-2-4.txt",
+                          "cmd-1000.5.stream-5-6.midi", "cmd-1000.5.stream-5-6.txt"], self.exported())
+        midi = self.project_dir / "exports" / "cmd-1000.5.stream-2-4.midi"
+        mtime = midi.stat().st_mtime_ns
+        export_jams(self.config)
+        self.assertEqual(mtime, midi.stat().st_mtime_ns)
+        midi.unlink()
+        export_jams(self.config)
+        self.assertTrue(midi.exists())
+
+
+class TestExportImports(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        import_dir = Path(self.tmp.name) / "imports"
+        import_dir.mkdir()
+        for name in ("song", "untouched"):
+            (import_dir / (name + ".ogg")).touch()
+            (import_dir / (name + ".meta")).write_text(
+                "[audio]\ntitle = {}\ncreated = 1000\nmodified = 1000\nlength = 30\n".format(name))
+        self.config = ConfigParser(inline_comment_prefixes=None)
+        self.config.read_string(default_config)
+        self.config.add_section("instance")
+        self.config["instance"]["project_dir"] = self.tmp.name
+        self.config["instance"]["export_jobs"] = "2"
+
+        lister = ImportLister(self.config)
+        lister.scan()
+        importer = lister.load_importer("song")
+        importer.add_row(1.0, lyric="la", note=60)
+        importer.add_row(2.0, lyric="di", note=62)
+        importer.rows.row(1.0)["track-change"] = "track"
+        importer.changed = True
+        importer.save()
+
+    def test_exports_worked_on_imports(self):
+        self.assertEqual(0, export_imports(self.config))
+        exports = Path(self.tmp.name) / "exports"
+        self.assertEqual(["song.ly", "song.midi", "song.txt"], sorted(f.name for f in exports.glob("song*")))
+        self.assertEqual([], list(exports.glob("untouched*")))
+        self.assertIn("la di", (exports / "song.txt").read_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import threading
+import time
+import unittest
+
+from mido import bpm2tempo
+
+from .bgplayer import BackgroundDrums, compile_pattern, DRUM_CHANNEL
+
+
+class TestDrumPattern(unittest.TestCase):
+    def test_compile(self):
+        pattern = compile_pattern(4, 4, bpm2tempo(120), ((35,), 38, ((42, 42),), 0))
+        self.assertEqual(2000000, pattern.bar_length)
+        offsets = [event[0] for event in pattern.events]
+        self.assertEqual(sorted(offsets), offsets)
+        on, off = 0x90 | DRUM_CHANNEL, 0x80 | DRUM_CHANNEL
+        self.assertEqual([(0, on, 35), (500000, off, 35), (500000, on, 38), (1000000, off, 38),
+                          (1000000, on, 42), (1250000, off, 42), (1250000, on, 42), (1500000, off, 42)],
+                         [event[:3] for event in pattern.events])
+        self.assertEqual(len(pattern.events), len(pattern.messages))
+        for (offset, status, note, velocity), message in zip(pattern.events, pattern.messages):
+            self.assertEqual([status, note, velocity], message.bytes())
+
+    def test_cached(self):
+        drums = BackgroundDrums(None)
+        drums.set_pattern(3, 4, bpm2tempo(90), [35, 38], [42, 42])
+        first = drums.next_pattern
+        drums.set_pattern(3, 4, bpm2tempo(90), (35, 38), (42, 42))
+        self.assertIs(first, drums.next_pattern)
+        drums.set_tempo(4, 4, bpm2tempo(90))
+        self.assertIsNot(first, drums.next_pattern)
+
+
+class FakePlayer:
+    def __init__(self):
+        self.fed = []
+        self.bars = threading.Semaphore(0)
+
+    def feed_midi(self, *what, at=None, **kwargs):
+        for message in what:
+            self.fed.append((at, message))
+            if message.type == "note_on":
+                self.bars.release()
+
+
+class TestBarLoop(unittest.TestCase):
+    def test_bars_follow_on_exactly(self):
+        drums = BackgroundDrums(None)
+        player = FakePlayer()
+        drums.wire(push_player=player)
+        drums.set_pattern(1, 4, bpm2tempo(1200), 35)
+        drums.start()
+        self.addCleanup(drums.end)
+        drums.play()
+        for i in range(6):
+            self.assertTrue(player.bars.acquire(timeout=5))
+        drums.set_pattern(2, 4, bpm2tempo(1200), 38)
+        for i in range(4):
+            self.assertTrue(player.bars.acquire(timeout=5))
+        drums.pause()
+        starts = [(at, m.note) for at, m in player.fed if m.type == "note_on"]
+        gaps = [b[0] - a[0] for a, b in zip(starts, starts[1:])]
+        # bar starts are computed, not measured, so they don't drift
+        for gap in gaps:
+            self.assertAlmostEqual(0.05, gap, delta=0.000001)
+        notes = [note for at, note in starts]
+        first_38 = notes.index(38)
+        self.assertTrue(all(note == 35 for note in notes[:first_38]))
+        self.assertTrue(all(note == 38 for note in notes[first_38:]))
+
+    def test_pause_is_prompt(self):
+        drums = BackgroundDrums(None)
+        player = FakePlayer()
+        drums.wire(push_player=player)
+        drums.set_pattern(1, 4, bpm2tempo(6), 35)
+        drums.start()
+        self.addCleanup(drums.end)
+        drums.play()
+        self.assertTrue(player.bars.acquire(timeout=5))
+        drums.pause()
+        deadline = time.perf_counter() + 0.5
+        while player.fed[-1][1].type != "note_off" and time.perf_counter() < deadline:
+            time.sleep(0.001)
+        self.assertEqual("note_off", player.fed[-1][1].type)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import io
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from . import cmdrecorder
+from .cmdrecorder import CommandRecorder, FILE_ID
+
+
+class TestCommandRecorder(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def make_recorder(self, **options):
+        config = {"instance": {"project_dir": self.tmp.name}, "recorder": options}
+        recorder = CommandRecorder(config)
+        recorder.start()
+        self.addCleanup(recorder.end)
+        return recorder
+
+    def lines(self, recorder):
+        return Path(recorder.fname).read_text().splitlines()[1:]
+
+    def wait_for(self, recorder, count):
+        deadline = time.perf_counter() + 2
+        while len(self.lines(recorder)) < count and time.perf_counter() < deadline:
+            time.sleep(0.005)
+        return self.lines(recorder)
+
+    def test_notes_wait_for_the_time_budget(self):
+        config = {"instance": {"project_dir": self.tmp.name}, "recorder": {"flush_ms": "200"}}
+        recorder = CommandRecorder(config)
+        now = [10.0]
+        recorder.clock = lambda: now[0]
+        out = io.StringIO()
+        self.assertFalse(recorder._collect([(1.0, "note_steps+0"), (1.1, "note_steps+1")], out))
+        now[0] = 10.1
+        recorder._collect([(1.2, "note_steps+2")], out)
+        self.assertEqual("", out.getvalue())
+        now[0] = 10.2
+        recorder._collect([], out)
+        self.assertEqual(["1.0,note_steps+0", "1.1,note_steps+1", "1.2,note_steps+2"], out.getvalue().splitlines())
+        # the next deadline runs from the next command
+        now[0] = 10.35
+        recorder._collect([(1.3, "rest")], out)
+        now[0] = 10.5
+        recorder._collect([], out)
+        self.assertEqual(3, len(out.getvalue().splitlines()))
+        self.assertTrue(recorder._collect([None], out))
+        self.assertEqual("1.3,rest", out.getvalue().splitlines()[-1])
+
+    def test_size_budget(self):
+        recorder = self.make_recorder(flush_ms="60000", flush_bytes="100")
+        for n in range(10):
+            recorder.add("note_steps+1")
+        self.assertGreaterEqual(len(self.wait_for(recorder, 4)), 4)
+
+    def test_marks_are_synced(self):
+        with mock.patch.object(cmdrecorder.os, "fsync") as fsync:
+            recorder = self.make_recorder(flush_ms="60000")
+            recorder.add("note_key")
+            recorder.add("mark_good")
+            self.assertEqual(2, len(self.wait_for(recorder, 2)))
+            recorder.end()
+        self.assertEqual(1, fsync.call_count)
+
+    def test_end_writes_everything(self):
+        recorder = self.make_recorder(flush_ms="60000")
+        for n in range(3):
+            recorder.add("rest")
+        recorder.end()
+        text = Path(recorder.fname).read_text()
+        self.assertTrue(text.startswith(FILE_ID))
+        self.assertEqual(["rest"] * 3, [line.split(",", 1)[1] for line in text.splitlines()[1:]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+from .commands import Commands, LEAD_CHANNEL
+from .utils.cmdutils import (preset_tables, parse_scale, parse_chords, parse_sequence,
+                             calculate_note)
+
+
+class FakePlayer:
+    def __init__(self):
+        self.fed = []
+
+    def feed_midi(self, *what, stamp=None, **kwargs):
+        self.fed.append(([(m.type, m.channel, m.note) for m in what], stamp))
+
+    def feed_other(self, cmd, **kwargs):
+        pass
+
+
+class FakeRecorder:
+    def __init__(self):
+        self.added = []
+
+    def add(self, what, at=None):
+        self.added.append((what, at))
+
+
+class TestPress(unittest.TestCase):
+    def setUp(self):
+        self.player = FakePlayer()
+        self.recorder = FakeRecorder()
+        self.commands = Commands({})
+        self.commands.wire(push_player=self.player, push_recorder=self.recorder, metronome=None)
+        self.commands.scale_text = "rel: 1 2 3 4 5 6 7"
+        self.commands._retable()
+        self.commands.compile_keys({"a": "note_key", "s": "note_steps+1", "k": "note_steps-8",
+                                    "r": "rest", "q": "quit", "=": "octave_up"})
+
+    def test_lead_notes(self):
+        self.assertEqual("note_key", self.commands.press("a", 1.5))
+        self.assertEqual("note_steps+1", self.commands.press("s", 2.5))
+        self.assertEqual([([("note_on", LEAD_CHANNEL, 60)], 1.5),
+                          ([("note_off", LEAD_CHANNEL, 60), ("note_on", LEAD_CHANNEL, 62)], 2.5)],
+                         self.player.fed)
+        self.assertEqual([("note_key", 1.5), ("note_steps+1", 2.5)], self.recorder.added)
+        self.assertEqual(62, self.commands.lead_note)
+
+    def test_matches_execute(self):
+        self.commands.press("k", None)
+        self.assertEqual(60 - 24 + 11, self.commands.lead_note)
+        self.commands.press("r", None)
+        self.assertIsNone(self.commands.lead_note)
+        self.assertEqual(([("note_off", LEAD_CHANNEL, 47)], None), self.player.fed[-1])
+
+    def test_rebuilt_for_octave(self):
+        self.commands.press("=", None)
+        self.commands.press("s", None)
+        self.assertEqual(74, self.commands.lead_note)
+
+    def test_quit_and_unknown(self):
+        self.assertEqual("quit", self.commands.press("q"))
+        self.assertIsNone(self.commands.press("x"))
+        self.assertEqual([], self.recorder.added)
+
+
+class TestPresetTables(unittest.TestCase):
+    def test_matches_parsing(self):
+        tables = preset_tables(62, "rel: 1 2 b3 4 5 b6 b7", "<1 3 5> :7<1 3 5 7>", "i-iv:7-v", -12)
+        scale = parse_scale("rel: 1 2 b3 4 5 b6 b7")
+        chords = parse_chords("<1 3 5> :7<1 3 5 7>", scale, 50)
+        self.assertEqual(scale, tables.scale)
+        self.assertEqual(chords, tables.chords)
+        self.assertEqual(parse_sequence("i-iv:7-v", chords), tables.sequence)
+        for what in ("note_steps+1", "note_steps-12", "note_steps+30", "note_key"):
+            self.assertEqual(calculate_note(what, key_note=62, scale=scale), tables.note_for(what))
+
+    def test_shared(self):
+        tables = preset_tables(60, "abs: 0 2 4 5 7 9 11", "<1 3 5>", "I-IV")
+        self.assertIs(tables, preset_tables(60, "abs: 0 2 4 5 7 9 11", "<1 3 5>", "I-IV"))
+        self.assertEqual([0, 2, 4, 5, 7, 9, 11], tables.scale)
+        self.assertEqual([[60, 64, 67], [65, 69, 72]], tables.sequence)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from configparser import ConfigParser
+from pathlib import Path
+from unittest import mock
+
+from . import importlister
+from .importlister import ImportLister
+
+
+def write_meta(path, title, **extra):
+    meta = ConfigParser()
+    meta["audio"] = {"created": "1500000000.0", "modified": "1500000000.0", "size": "4",
+                     "title": title, "length": "62.5", "tracks": "0"}
+    meta["audio"].update(extra)
+    with path.open("w") as out:
+        meta.write(out)
+
+
+class TestImportCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.project_dir = Path(self.tmp.name)
+        self.import_dir = self.project_dir / "imports"
+        self.import_dir.mkdir()
+        for stem in ("one", "two"):
+            (self.import_dir / (stem + ".mp3")).write_bytes(b"fake")
+            write_meta(self.import_dir / (stem + ".meta"), "Song " + stem)
+        self.config = {"instance": {"project_dir": str(self.project_dir)}}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_scan(self):
+        lister = ImportLister(self.config)
+        lister.scan()
+        self.assertEqual({"one", "two"}, set(lister.get_order()))
+        self.assertEqual("Song one", lister.get("one")["title"])
+        self.assertEqual(62.5, lister.get("one")["length_secs"])
+        self.assertIsNone(lister.get("one")["unprocessed_length"])
+        self.assertTrue((self.project_dir / "imports.catalog").exists())
+
+    def test_unchanged_files_are_not_examined(self):
+        ImportLister(self.config).scan()
+        write_meta(self.import_dir / "two.meta", "Renamed", tracks="3")
+        lister = ImportLister(self.config)
+        with mock.patch.object(importlister, "_examine", wraps=importlister._examine) as examine:
+            lister.scan()
+        self.assertEqual([self.import_dir / "two.mp3"], [c.args[0] for c in examine.call_args_list])
+        self.assertEqual("Renamed", lister.get("two")["title"])
+        self.assertEqual(3, lister.get("two")["tracks"])
+        self.assertEqual("Song one", lister.get("one")["title"])
+
+    def test_removed_media_leave_the_catalog(self):
+        ImportLister(self.config).scan()
+        (self.import_dir / "one.mp3").unlink()
+        lister = ImportLister(self.config)
+        lister.scan()
+        self.assertEqual(["two"], lister.get_order())
+        catalog = ConfigParser(interpolation=None)
+        catalog.read(str(self.project_dir / "imports.catalog"))
+        self.assertEqual(["two.mp3"], catalog.sections())
+
+    def test_remove_updates_one_entry(self):
+        lister = ImportLister(self.config)
+        lister.scan()
+        line = lister.get_order().index("one")
+        with mock.patch.object(importlister, "_examine", wraps=importlister._examine) as examine:
+            self.assertTrue(lister._do_remove("yes", line=line))
+        self.assertEqual(1, examine.call_count)
+        self.assertEqual(["two"], lister.get_order())
+        self.assertEqual(["two"], ImportLister(self.config).scan())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from .jamlister import JamLister, STREAM_PREFIX, ABANDONED_STREAM_SECS
+
+HEADER = "#,audio/vnd.mrbeany.bittyband.stream : v1\n"
+
+
+class TestJamListerIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.project_dir = Path(self.tmp.name)
+        self.config = {"instance": {"project_dir": self.tmp.name}}
+        self.stream = self.project_dir / "cmd-1000.5.stream"
+
+    def write(self, text, mode="w"):
+        with self.stream.open(mode) as out:
+            out.write(text)
+
+    def test_segments(self):
+        self.write(HEADER + "1.0,mark_good\n2.0,mark_bad\n2.5,note_1\n3.0,mark_good\n3.5,note_2\n4.0,next\n")
+        lister = JamLister(self.config)
+        self.assertEqual(["cmd-1000.5.stream-3-4", "cmd-1000.5.stream-5-6"], lister.get_order())
+        self.assertEqual(["2.5,note_1", "3.0,mark_good"], lister.get("cmd-1000.5.stream-3-4"))
+        self.assertEqual("1.0", lister.get_mark("cmd-1000.5.stream-3-4")["length"])
+
+    def test_live_stream_without_segments_is_kept(self):
+        self.write(HEADER + "1.0,mark_bad\n1.5,note_1\n")
+        lister = JamLister(self.config)
+        self.assertTrue(self.stream.exists())
+        self.assertEqual([], lister.get_order())
+        self.write("2.0,mark_good\n", "a")
+        lister = JamLister(self.config)
+        self.assertEqual(["cmd-1000.5.stream-2-3"], lister.get_order())
+
+    def test_abandoned_stream_is_removed(self):
+        self.write(HEADER + "1.0,mark_bad\n1.5,note_1")
+        old = time.time() - ABANDONED_STREAM_SECS - 60
+        os.utime(str(self.stream), (old, old))
+        JamLister(self.config)
+        # the unfinished line might still be written
+        self.assertTrue(self.stream.exists())
+        self.write("\n", "a")
+        os.utime(str(self.stream), (old, old))
+        JamLister(self.config)
+        self.assertFalse(self.stream.exists())
+
+    def test_appended(self):
+        self.write(HEADER + "2.0,mark_bad\n2.5,note_1\n3.0,mark_good\n3.5,note_2")
+        lister = JamLister(self.config)
+        self.assertEqual(["cmd-1000.5.stream-2-3"], lister.get_order())
+        lister.rename("cmd-1000.5.stream-2-3", "riff")
+        state = lister.marks[STREAM_PREFIX + self.stream.name]
+        # the unfinished last line is left for later
+        self.assertEqual(str(len(HEADER) + 38), state["offset"])
+
+        self.write("\n4.0,next\n", "a")
+        lister = JamLister(self.config)
+        self.assertEqual(["cmd-1000.5.stream-2-3", "cmd-1000.5.stream-4-5"], lister.get_order())
+        self.assertEqual("riff", lister.get_mark("cmd-1000.5.stream-2-3")["title"])
+        self.assertEqual(["3.5,note_2", "4.0,next"], lister.get("cmd-1000.5.stream-4-5"))
+
+    def test_rewritten(self):
+        self.write(HEADER + "2.0,mark_bad\n2.5,note_1\n3.0,mark_good\n3.5,note_2\n4.0,next\n")
+        lister = JamLister(self.config)
+        lister.rename("cmd-1000.5.stream-2-3", "riff")
+        self.write(HEADER + "2.0,mark_bad\n2.5,note_1\n3.0,mark_good\n")
+        lister = JamLister(self.config)
+        self.assertEqual(["cmd-1000.5.stream-2-3"], lister.get_order())
+        self.assertEqual("riff", lister.get_mark("cmd-1000.5.stream-2-3")["title"])
+
+    def test_get_reads_by_offset(self):
+        self.write(HEADER + "2.0,mark_bad\r\n2.5,note_1\n3.0,mark_good\n3.5,note_2\n4.0,next\n")
+        lister = JamLister(self.config)
+        for use_mmap in (None, False, True):
+            self.assertEqual(["2.5,note_1", "3.0,mark_good"], lister.get("cmd-1000.5.stream-2-3", use_mmap=use_mmap))
+        # an entry from before offsets were indexed
+        del lister.marks["cmd-1000.5.stream-4-5"]["start_offset"]
+        self.assertEqual(["3.5,note_2", "4.0,next"], lister.get("cmd-1000.5.stream-4-5"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import time
+import unittest
+
+from mido import Message
+
+from .player import PushButtonPlayer
+
+
+class TestPushButtonPlayer(unittest.TestCase):
+    def test_messages_come_due_in_order(self):
+        player = PushButtonPlayer({})
+        now = time.perf_counter()
+        player.feed_midi(Message('note_on', note=62), at=now + 0.02)
+        player.feed_midi(Message('note_on', note=61), at=now + 0.01)
+        player.feed_midi(Message('note_on', note=60))
+        player.feed_midi(Message('note_off', note=61), at=now + 0.01)
+        player.stopping = True
+        got = []
+        while True:
+            entry = player._next_due()
+            if entry is None:
+                break
+            due, seq, message = entry
+            self.assertGreaterEqual(time.perf_counter(), due)
+            got.append((message.type, message.note))
+        self.assertEqual([("note_on", 60), ("note_on", 61), ("note_off", 61), ("note_on", 62)], got)
+
+    def test_tracks_sounding_notes(self):
+        player = PushButtonPlayer({})
+        player._sent(Message('note_on', channel=1, note=60, velocity=64))
+        player._sent(Message('note_on', channel=0, note=67, velocity=64))
+        player._sent(Message('note_on', channel=0, note=64, velocity=64))
+        player._sent(Message('note_on', channel=0, note=64, velocity=0))
+        self.assertEqual([(0, 67), (1, 60)], player.sounding())
+        player._sent(Message('control_change', channel=1, control=123))
+        player._sent(Message('note_off', channel=0, note=67))
+        self.assertEqual([], player.sounding())
+
+    def test_panic_drops_pending(self):
+        player = PushButtonPlayer({})
+        player.feed_midi(Message('note_on', note=60), at=time.perf_counter() + 10)
+        player.feed_midi(Message('control_change', control=123), abbr="panic")
+        player.stopping = True
+        due, seq, message = player._next_due()
+        self.assertEqual('control_change', message.type)
+        self.assertIsNone(player._next_due())
+
+    def test_cancel_keeps_note_offs(self):
+        player = PushButtonPlayer({})
+        later = time.perf_counter() + 10
+        player.feed_midi(Message('note_off', channel=0, note=60), Message('note_on', channel=0, note=62), at=later)
+        player.feed_midi(Message('note_on', channel=9, note=36), at=later)
+        player.cancel(channels=(0, 1))
+        self.assertEqual([("note_off", 0, 60), ("note_on", 9, 36)],
+                         [(m.type, m.channel, m.note) for due, seq, m in sorted(player.pending)])
+        self.assertLess(min(player.pending)[0], later)
+
+
+if __name__ == '__main__':
+    unittest.main()
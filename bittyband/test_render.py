@@ -0,0 +1,71 @@
+import os
+import random
+import tempfile
+import time
+import unittest
+from configparser import ConfigParser
+from pathlib import Path
+
+from .bgplayer import BackgroundNull
+from .commands import Commands
+from .config import default_config
+from .exportmidi import ExportMidi
+from .render import render_segment, raw_message
+
+COMMANDS = ["note_steps+{}".format(n) for n in range(1, 8)] + \
+           ["note_steps-3", "note_key", "rest", "chord_next", "chord_prev"]
+
+
+def session(seconds, seed=1):
+    """ Return the lines of a jam of about `seconds`, changing preset every few minutes. """
+    rnd = random.Random(seed)
+    lines = ["1.0,preset_0"]
+    t = 1.0
+    while t < seconds:
+        t += rnd.uniform(0.1, 0.6)
+        if rnd.random() < 0.002:
+            lines.append("{!r},preset_{}".format(t, rnd.randrange(3)))
+        else:
+            lines.append("{!r},{}".format(t, rnd.choice(COMMANDS)))
+    lines.append("{!r},mark_good".format(t + 1.0))
+    return lines
+
+
+class TestRender(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.out = Path(self.tmp.name)
+        self.config = ConfigParser(inline_comment_prefixes=None)
+        self.config.read_string(default_config)
+
+    def export_midi(self, lines, output):
+        exporter = ExportMidi(self.config, output)
+        cmds = Commands(self.config)
+        cmds.wire(push_player=exporter, metronome=BackgroundNull())
+        exporter.start()
+        cmds.play(lines, realtime=False, quiet=True)
+        exporter.end()
+
+    def test_matches_export_midi(self):
+        lines = session(120)
+        render_segment(self.config, lines, self.out / "render.midi")
+        self.export_midi(lines, self.out / "export.midi")
+        self.assertEqual((self.out / "export.midi").read_bytes(), (self.out / "render.midi").read_bytes())
+
+    def test_checks_ranges(self):
+        self.assertEqual(b"\x91\x3c\x40", raw_message("note_on", channel=1, note=60).data)
+        self.assertEqual(b"\xc0\x05", raw_message("program_change", program=5).data)
+        with self.assertRaises(ValueError):
+            raw_message("note_on", note=128)
+
+    @unittest.skipUnless(os.environ.get("BITTYBAND_BENCHMARK"), "set BITTYBAND_BENCHMARK to time renders")
+    def test_hour_long_session(self):
+        lines = session(3600)
+        started = time.perf_counter()
+        render_segment(self.config, lines, self.out / "hour.midi")
+        self.assertLess(time.perf_counter() - started, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
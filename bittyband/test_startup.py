@@ -0,0 +1,45 @@
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+HEAVY = ("pyglet", "aubio", "numpy", "taglib")
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def imported_by(statement):
+    """ Return {module: cumulative microseconds} for what `statement` imports. """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            cwd=str(ROOT), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        modules[parts[2].strip()] = int(parts[1])
+    return modules
+
+
+class TestStartup(unittest.TestCase):
+    def assertLight(self, statement):
+        modules = imported_by(statement)
+        self.assertIn("bittyband", modules)
+        for name in modules:
+            self.assertNotIn(name.split(".")[0], HEAVY,
+                             "{!r} imports {}".format(statement, name))
+
+    def test_app(self):
+        self.assertLight("import bittyband.app")
+
+    def test_panic(self):
+        self.assertLight("import bittyband.config")
+
+    def test_import_modes(self):
+        self.assertLight("import bittyband.importlister, bittyband.importer")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from .cmdrecorder import CommandRecorder
+from .jamlister import JamLister
+from .streamformat import (convert_stream, convert_streams, read_stream, scan_marks, stream_version,
+                           write_v2, V2_RECORD)
+
+HEADER = "#,audio/vnd.mrbeany.bittyband.stream : v1\n"
+TEXT = HEADER + HEADER + ("1.0,mark_good\n2.0,mark_bad\n2.5,note_1\n3.0,mark_good\n3.5,!set key=60\n"
+                          "4.0,next\n4.5,note_2\n")
+
+
+class TestStreamFormat(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.project_dir = Path(self.tmp.name)
+        self.config = {"instance": {"project_dir": self.tmp.name}}
+        self.stream = self.project_dir / "cmd-1000.5.stream"
+        self.stream.write_text(TEXT)
+
+    def test_round_trip(self):
+        records = read_stream(self.stream)
+        self.assertEqual((2.5, "note_1"), records[2])
+        self.assertTrue(convert_stream(self.stream))
+        self.assertEqual(2, stream_version(self.stream))
+        self.assertEqual(records, read_stream(self.stream))
+        self.assertFalse(convert_stream(self.stream))
+        self.assertTrue(convert_stream(self.stream, 1))
+        self.assertEqual(1, stream_version(self.stream))
+        self.assertEqual(records, read_stream(self.stream))
+        # the lines are numbered as they were
+        self.assertEqual(TEXT, self.stream.read_text())
+
+    def test_convert_skips_streams_being_recorded(self):
+        recorder = CommandRecorder(self.config)
+        recorder.start()
+        self.addCleanup(recorder.end)
+        recorder.add("mark_bad")
+        with self.stream.open("a") as out:
+            out.write("5.0,note_3")
+            out.flush()
+            self.config["instance"]["stream_format"] = "2"
+            convert_streams(self.config)
+            self.assertEqual(1, stream_version(self.stream))
+            self.assertEqual(1, stream_version(recorder.fname))
+            out.write("\n5.5,mark_good\n")
+        recorder.add("mark_good")
+        recorder.end()
+        convert_streams(self.config)
+        self.assertEqual(2, stream_version(self.stream))
+        self.assertEqual((5.5, "mark_good"), read_stream(self.stream)[-1])
+        self.assertEqual(["mark_bad", "mark_good"], [cmd for t, cmd in read_stream(recorder.fname)])
+
+    def test_scan_matches_v1_index(self):
+        v1 = JamLister(self.config)
+        order = v1.get_order()
+        self.assertEqual(2, len(order))
+        material = [v1.get(what) for what in order]
+        v1.rename(order[0], "riff")
+
+        self.assertEqual(0, convert_streams(self.config))
+        v2 = JamLister(self.config)
+        self.assertEqual(order, v2.get_order())
+        self.assertEqual("riff", v2.get_mark(order[0])["title"])
+        for what in order:
+            self.assertEqual(v1.get_mark(what)["length"], v2.get_mark(what)["length"])
+        for lines, records in zip(material, (v2.get(what) for what in order)):
+            self.assertEqual([tuple(line.split(",", 1)) for line in lines],
+                             [("{!r}".format(t), cmd) for t, cmd in records])
+
+    def test_incremental_scan(self):
+        records = [(float(i), "mark_good" if i % 3 == 0 else "note_1") for i in range(30)]
+        write_v2(self.stream, records)
+        whole, boundary, lines, end = scan_marks(self.stream)
+        self.assertEqual(9, len(whole))
+        self.assertEqual(30, lines)
+        # the same segments, scanned in two goes
+        data = self.stream.read_bytes()
+        start = len(data) - 30 * V2_RECORD.size
+        cut = start + 14 * V2_RECORD.size
+        self.stream.write_bytes(data[:cut])
+        first, boundary, lines, offset = scan_marks(self.stream)
+        self.assertEqual(cut, offset)
+        self.stream.write_bytes(data)
+        rest, boundary, lines, offset = scan_marks(self.stream, offset, boundary)
+        self.assertEqual(whole, first + rest)
+        self.assertEqual((1, 4, 0.0, 3.0), (whole[0][0], whole[0][1], whole[0][4], whole[0][5]))
+
+
+if __name__ == '__main__':
+    unittest.main()
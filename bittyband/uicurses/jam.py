@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import curses
+from time import perf_counter
 
 from ..keymaps import KeyMaps
 
@@ -24,17 +25,15 @@ class JamScreen:
         command = ""
         self.command_log.add("mark_good")
         first_preset = "preset_0"
+        self.commands.compile_keys(self.keymap)
         self.commands.execute(first_preset)
         self.command_log.add(first_preset)
 
         while command != "quit":
             if command is None:
                 self.ui.putln("Unknown key: '{}' (len:{})".format(ch, len(ch)))
-            elif command != "":
-                self.command_log.add(command)
-                self.commands.execute(command)
             ch = self.ui.get_key()
-            command = self.keymap.get(ch)
+            command = self.commands.press(ch, perf_counter())
         self.commands.do_silence("silence")
         self.commands.do_panic()
         self.command_log.add("mark_bad")
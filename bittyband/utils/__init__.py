@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
-__all__ = ["time"]
+__all__ = ["time", "stats"]
 
 from . import time
+from . import stats
@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 
+from functools import lru_cache
+
 from ..errors import ConfigError
 
 OCTAVE_STEPS = 12
+# note steps either side of the key that `PresetTables` works out ahead
+TABLE_STEPS = 2 * OCTAVE_STEPS
+# how many presets' tables `preset_tables` keeps
+PRESET_CACHE_SIZE = 64
 
 _interval_conversion = {
     "b1": -1,
@@ -88,6 +94,7 @@ def parse_scale(scale):
         for s in scale[4:].split():
             if s != "":
                 ret.append(int(s))
+        return ret
     elif scale.startswith("rel:"):
         for s in scale[4:].split():
             if s != "":
@@ -237,3 +244,39 @@ def parse_timing(timing):
         raise ConfigError("Unknown timing: " + timing)
     return timing
 
+
+class PresetTables:
+    """ The notes and chords of a preset, worked out from its config strings.
+
+        `scale` is the parsed scale, `chords` the chord map and `sequence`
+        the chord sequence, as `parse_scale`, `parse_chords` and
+        `parse_sequence` return them; the chords are built on `key_note +
+        pad_offset`, and there is no sequence if `pad_sequence` is None. `step_notes` maps each `note_steps` command within
+        `TABLE_STEPS` of the key to its MIDI note.
+
+        They are shared through `preset_tables`, so treat them as read only.
+    """
+
+    def __init__(self, key_note, scale, pad_chords, pad_sequence, pad_offset=0):
+        self.key_note = key_note
+        self.scale = parse_scale(scale)
+        self.chords = parse_chords(pad_chords, self.scale, key_note + pad_offset)
+        self.sequence = [] if pad_sequence is None else parse_sequence(pad_sequence, self.chords)
+        self.step_notes = {}
+        for n in range(-TABLE_STEPS, TABLE_STEPS + 1):
+            if n != 0:
+                what = "note_steps{:+d}".format(n)
+                self.step_notes[what] = calculate_note(what, key_note=key_note, scale=self.scale)
+
+    def note_for(self, what):
+        """ Return the MIDI note for the `note_steps` command `what`, as `calculate_note` does. """
+        note = self.step_notes.get(what)
+        if note is None:
+            note = calculate_note(what, key_note=self.key_note, scale=self.scale)
+        return note
+
+
+@lru_cache(maxsize=PRESET_CACHE_SIZE)
+def preset_tables(key_note, scale, pad_chords, pad_sequence, pad_offset=0):
+    """ Return the `PresetTables` for these config strings, reusing recent ones. """
+    return PresetTables(key_note, scale, pad_chords, pad_sequence, pad_offset)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+__all__ = ["RunningStats"]
+
+import math
+
+
+class RunningStats:
+    """ Count, mean, spread and range of a stream of samples.
+
+        Uses Welford's method, so nothing but the totals is kept.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, sample):
+        self.count += 1
+        delta = sample - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (sample - self.mean)
+        if self.min is None or sample < self.min:
+            self.min = sample
+        if self.max is None or sample > self.max:
+            self.max = sample
+
+    @property
+    def stddev(self):
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self._m2 / (self.count - 1))
+
+    def __str__(self):
+        if self.count == 0:
+            return "no samples"
+        return "n={} mean={:.6f} sd={:.6f} min={:.6f} max={:.6f}".format(
+            self.count, self.mean, self.stddev, self.min, self.max)
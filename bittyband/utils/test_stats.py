@@ -0,0 +1,25 @@
+import unittest
+
+from .stats import RunningStats
+
+
+class TestRunningStats(unittest.TestCase):
+    def test_empty(self):
+        stats = RunningStats()
+        self.assertEqual(0, stats.count)
+        self.assertEqual(0.0, stats.stddev)
+        self.assertEqual("no samples", str(stats))
+
+    def test_samples(self):
+        stats = RunningStats()
+        for sample in (2, 4, 4, 4, 5, 5, 7, 9):
+            stats.add(sample)
+        self.assertEqual(8, stats.count)
+        self.assertAlmostEqual(5.0, stats.mean)
+        self.assertAlmostEqual(2.138089935, stats.stddev)
+        self.assertEqual(2, stats.min)
+        self.assertEqual(9, stats.max)
+
+
+if __name__ == '__main__':
+    unittest.main()